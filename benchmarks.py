@@ -0,0 +1,619 @@
+import os
+import heapq
+import math
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+
+os.environ.setdefault("ROBOTSIM_TRANSMIT", "False")
+
+import item
+import checkpoint
+import customexceptions
+import main
+import order
+import robot
+import robotfleet
+import utils
+import warehouse
+import warehouselayout
+
+
+def legacy_astar_path(whouse, robot_obj):
+    # The original Warehouse.compute_robot_astar_path, kept here so the new planners can be compared against it
+    robot_x, robot_y = robot_obj.get_position()
+    target_x, target_y = robot_obj.get_target().get_position()
+
+    @dataclass(order=True)
+    class PrioNode:
+        x: int = field(compare=False)
+        y: int = field(compare=False)
+        f_score: int
+
+        def __eq__(self, other):
+            return self.x == other.x and self.y == other.y
+    g_scores = {}
+    f_scores = {}
+    came_from = {}
+    search_frontier = []
+    f_scores[(robot_x, robot_y)] = utils.taxicab_dist(robot_x, robot_y, target_x, target_y)
+    g_scores[(robot_x, robot_y)] = 0
+    heapq.heappush(search_frontier,
+                   PrioNode(robot_x, robot_y, f_scores[(robot_x, robot_y)]))
+    while len(search_frontier) != 0:
+        current = heapq.heappop(search_frontier)
+        if current.x == target_x and current.y == target_y:
+            return utils.reconstruct_astar_path(came_from, (current.x, current.y))[1:]
+
+        offsets = [(current.x + 1, current.y),
+                   (current.x - 1, current.y),
+                   (current.x, current.y + 1),
+                   (current.x, current.y - 1)]
+
+        for n in offsets:
+            if not whouse.is_within_grid(n[0], n[1]):
+                continue
+            neigh_tup = (n[0], n[1])
+            cur_tup = (current.x, current.y)
+            if not whouse.cell_contains_robot(n[0], n[1]):
+                possible_g_score = g_scores[cur_tup] + 1
+                if neigh_tup in g_scores.keys():
+                    if not possible_g_score < g_scores[neigh_tup]:
+                        continue
+                came_from[neigh_tup] = cur_tup
+                g_scores[neigh_tup] = possible_g_score
+                f_scores[neigh_tup] = possible_g_score + utils.taxicab_dist(current.x, current.y+1,
+                                                                            target_x, target_y)
+                if PrioNode(n[0], n[1], 0) not in search_frontier:
+                    heapq.heappush(search_frontier,
+                                   PrioNode(n[0], n[1], f_scores[neigh_tup]))
+    return []
+
+
+def build_nxn_warehouse(robot_num, side_len, step_limit=1000, **kwargs):
+    return warehouse.Warehouse(main.gen_nxn_layout(robot_num, side_len), 12, 3, "simple", [0, 0, 0, 0], True,
+                               step_limit, **kwargs)
+
+
+def build_fleet_warehouse(robot_num, width=200, travel_len=40, **kwargs):
+    # A block of robot_num robots at the top of an open floor, travel_len rows above a bottom row of shelves and a
+    # goal. Every robot is sent straight down its column towards the goal, so every robot has somewhere to move.
+    robot_rows = (robot_num + width - 1) // width
+    lines = []
+    for row in range(robot_rows):
+        robots_in_row = min(width, robot_num - row * width)
+        lines.append("R" * robots_in_row + "X" * (width - robots_in_row))
+    lines += ["X" * width] * travel_len
+    lines.append("S" * 12 + "G" + "X" * (width - 13))
+    whouse = warehouse.Warehouse(warehouselayout.WarehouseLayout.from_rows(lines), 12, 3, "simple", [0, 0, 0, 0],
+                                 False, 100000, **kwargs)
+    goal = whouse._order_stations["goal0"]
+    for robot_obj in whouse._robots.values():
+        x, y = robot_obj.get_position()
+        robot_obj.set_target(goal)
+        robot_obj.set_movement_path([(x, y - i) for i in range(1, travel_len + 1)])
+    return whouse
+
+
+def benchmark_queries(whouse):
+    # Every robot is sent to every shelf and order station, from its home
+    queries = []
+    targets = list(whouse._shelves.values()) + list(whouse._order_stations.values())
+    for robot_obj in whouse._robots.values():
+        for target in targets:
+            queries.append((robot_obj, target))
+    return queries
+
+
+def time_planner(planner, queries, repeats):
+    best = None
+    path_lengths = []
+    for i in range(repeats):
+        path_lengths = []
+        start_time = time.perf_counter_ns()
+        for robot_obj, target in queries:
+            robot_obj.set_target(target)
+            path_lengths.append(len(planner(robot_obj)))
+        elapsed = time.perf_counter_ns() - start_time
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / len(queries), path_lengths
+
+
+def run_pathfinding_benchmark(robot_nums=(1, 5, 10), side_lens=(11, 21, 31, 41), repeats=3):
+    # Compares the per call time of the legacy A* against Warehouse.compute_robot_astar_path
+    # The legacy planner walks through shelves, goals and homes, so its paths can be shorter than the new ones
+    print("robots side calls legacy_us new_us speedup differing_paths")
+    results = []
+    for side_len in side_lens:
+        for robot_num in robot_nums:
+            whouse = build_nxn_warehouse(robot_num, side_len)
+            queries = benchmark_queries(whouse)
+
+            legacy_ns, legacy_lengths = time_planner(lambda r: legacy_astar_path(whouse, r), queries, repeats)
+            new_ns, new_lengths = time_planner(whouse.compute_robot_astar_path, queries, repeats)
+
+            differing_paths = sum(1 for a, b in zip(legacy_lengths, new_lengths) if a != b)
+
+            result = [robot_num, side_len, len(queries), legacy_ns / 1000, new_ns / 1000, legacy_ns / new_ns,
+                      differing_paths]
+            print("%s %s %s %.1f %.1f %.1fx %s" % tuple(result))
+            results.append(result)
+    return results
+
+
+def run_jump_point_benchmark(robot_nums=(1, 5, 10), side_lens=(11, 21, 31, 41), repeats=3):
+    # Compares the per call time of Warehouse.compute_robot_astar_path with the A* and jump point planners
+    print("robots side calls astar_us jump_point_us speedup astar_expansions jump_point_expansions differing_paths")
+    results = []
+    for side_len in side_lens:
+        for robot_num in robot_nums:
+            astar_whouse = build_nxn_warehouse(robot_num, side_len)
+            jump_point_whouse = build_nxn_warehouse(robot_num, side_len, path_planner="jump-point")
+
+            astar_ns, astar_lengths = time_planner(astar_whouse.compute_robot_astar_path,
+                                                   benchmark_queries(astar_whouse), repeats)
+            jump_point_ns, jump_point_lengths = time_planner(jump_point_whouse.compute_robot_astar_path,
+                                                             benchmark_queries(jump_point_whouse), repeats)
+            astar_expansions = astar_whouse.get_movement_stats()["node_expansions"] // repeats
+            jump_point_expansions = jump_point_whouse.get_movement_stats()["node_expansions"] // repeats
+
+            differing_paths = sum(1 for a, b in zip(astar_lengths, jump_point_lengths) if a != b)
+
+            result = [robot_num, side_len, len(astar_lengths), astar_ns / 1000, jump_point_ns / 1000,
+                      astar_ns / jump_point_ns, astar_expansions, jump_point_expansions, differing_paths]
+            print("%s %s %s %.1f %.1f %.1fx %s %s %s" % tuple(result))
+            results.append(result)
+    return results
+
+
+def run_replanning_benchmark(robot_nums=(5, 10), side_lens=(21, 41), seeds=range(5), step_limit=3000):
+    # Runs whole simulations with each path planner, and compares how many nodes the planners expanded
+    # The simulations follow different paths once tied paths are broken differently, so the totals are over all seeds
+    print("robots side planner path_plans node_expansions repairs estimated_saved_expansions steps seconds")
+    results = []
+    for side_len in side_lens:
+        for robot_num in robot_nums:
+            for path_planner in warehouse.PATH_PLANNERS:
+                totals = {"path_plans": 0, "node_expansions": 0, "incremental_repairs": 0,
+                          "incremental_estimated_saved_expansions": 0}
+                total_steps = 0
+                start_time = time.perf_counter()
+                for seed in seeds:
+                    whouse = build_nxn_warehouse(robot_num, side_len, step_limit=step_limit, path_planner=path_planner,
+                                                 seed=seed)
+                    while not whouse.step():
+                        pass
+                    total_steps += whouse.get_total_steps()
+                    stats = whouse.get_movement_stats()
+                    for key in totals:
+                        totals[key] += stats[key]
+                elapsed = time.perf_counter() - start_time
+
+                result = [robot_num, side_len, path_planner, totals["path_plans"], totals["node_expansions"],
+                          totals["incremental_repairs"], totals["incremental_estimated_saved_expansions"], total_steps,
+                          elapsed]
+                print("%s %s %s %s %s %s %s %s %.2f" % tuple(result))
+                results.append(result)
+    return results
+
+
+def run_cooperative_benchmark(settings=((10, 21), (20, 31), (10, 41)), seeds=range(5), step_limit=3000):
+    # Runs whole simulations with each movement mode, for the (robots, side) pairs of settings, and compares how often
+    # robots were blocked and how many paths they planned. Totals are over all seeds.
+    print("robots side mode blocked_steps path_plans steps seconds")
+    results = []
+    for robot_num, side_len in settings:
+        for movement_mode in ("astar", "cooperative"):
+            totals = {"blocked_steps": 0, "path_plans": 0}
+            total_steps = 0
+            start_time = time.perf_counter()
+            for seed in seeds:
+                whouse = build_nxn_warehouse(robot_num, side_len, step_limit=step_limit, movement_mode=movement_mode,
+                                             seed=seed)
+                while not whouse.step():
+                    pass
+                total_steps += whouse.get_total_steps()
+                stats = whouse.get_movement_stats()
+                for key in totals:
+                    totals[key] += stats[key]
+            elapsed = time.perf_counter() - start_time
+
+            result = [robot_num, side_len, movement_mode, totals["blocked_steps"], totals["path_plans"], total_steps,
+                      elapsed]
+            print("%s %s %s %s %s %s %.2f" % tuple(result))
+            results.append(result)
+    return results
+
+
+def run_path_cache_benchmark(robot_nums=(5, 10), side_lens=(21, 41), seeds=range(5), step_limit=3000):
+    # Runs whole simulations with and without the path cache, to see how often it is hit and what it saves. The hit
+    # rate is of the plans that looked in the cache.
+    print("robots side planner cache_size path_plans hits misses expired hit_rate node_expansions steps seconds")
+    results = []
+    for side_len in side_lens:
+        for robot_num in robot_nums:
+            for path_planner in warehouse.PATH_PLANNERS:
+                for path_cache_size in (0, 64, warehouse.PATH_CACHE_SIZE):
+                    totals = {"path_plans": 0, "path_cache_hits": 0, "path_cache_misses": 0, "path_cache_expired": 0,
+                              "node_expansions": 0}
+                    total_steps = 0
+                    start_time = time.perf_counter()
+                    for seed in seeds:
+                        whouse = build_nxn_warehouse(robot_num, side_len, step_limit=step_limit,
+                                                     path_planner=path_planner, path_cache_size=path_cache_size,
+                                                     seed=seed)
+                        while not whouse.step():
+                            pass
+                        total_steps += whouse.get_total_steps()
+                        stats = whouse.get_movement_stats()
+                        for key in totals:
+                            totals[key] += stats[key]
+                    elapsed = time.perf_counter() - start_time
+
+                    lookups = totals["path_cache_hits"] + totals["path_cache_misses"]
+                    result = [robot_num, side_len, path_planner, path_cache_size, totals["path_plans"],
+                              totals["path_cache_hits"], totals["path_cache_misses"], totals["path_cache_expired"],
+                              totals["path_cache_hits"] / lookups if lookups else 0, totals["node_expansions"],
+                              total_steps, elapsed]
+                    print("%s %s %s %s %s %s %s %s %.2f %s %s %.2f" % tuple(result))
+                    results.append(result)
+    return results
+
+
+def run_fleet_step_benchmark(robot_nums=(100, 1000, 4000, 10000), steps=20):
+    # Time per step of a fleet that is all moving, one robot at a time and with the vectorized step
+    print("robots per_robot_ms vectorized_ms speedup")
+    results = []
+    for robot_num in robot_nums:
+        step_ms = []
+        for vectorized_step in (False, True):
+            whouse = build_fleet_warehouse(robot_num, travel_len=steps + 1, vectorized_step=vectorized_step)
+            start_time = time.perf_counter()
+            for i in range(steps):
+                whouse.step()
+            step_ms.append((time.perf_counter() - start_time) * 1000 / steps)
+
+        result = [robot_num, step_ms[0], step_ms[1], step_ms[0] / step_ms[1]]
+        print("%s %.2f %.2f %.1fx" % tuple(result))
+        results.append(result)
+    return results
+
+
+def run_vectorized_step_divergence_benchmark(settings=((5, 21), (10, 21), (10, 41), (20, 41)), seeds=range(10),
+                                             step_limit=3000):
+    # How far whole simulations with the vectorized step drift from the same simulations stepped one robot at a
+    # time, as the two settle robots wanting the same cells differently. Runs are stepped side by side until the
+    # robots' positions first differ, and then each on to the end. Means are over the runs that finished in both.
+    print("robots side runs identical_runs first_difference_step steps vectorized_steps blocked_steps "
+          "vectorized_blocked_steps mean_completion vectorized_mean_completion")
+    results = []
+    for robot_num, side_len in settings:
+        identical_runs = 0
+        first_differences = []
+        totals = {False: [0, 0, 0], True: [0, 0, 0]}
+        finished_runs = 0
+        for seed in seeds:
+            whouses = {vectorized_step: build_nxn_warehouse(robot_num, side_len, step_limit=step_limit, seed=seed,
+                                                            vectorized_step=vectorized_step)
+                       for vectorized_step in (False, True)}
+            done = {False: False, True: False}
+            first_difference = None
+            try:
+                while not all(done.values()):
+                    for vectorized_step, whouse in whouses.items():
+                        if not done[vectorized_step]:
+                            done[vectorized_step] = whouse.step()
+                    if first_difference is None and any(
+                            robot_obj.get_position() != whouses[True]._robots[name].get_position()
+                            for name, robot_obj in whouses[False]._robots.items()):
+                        first_difference = whouses[False].get_total_steps()
+            except customexceptions.SimulationError:
+                continue
+            finished_runs += 1
+            completion_times = {}
+            for vectorized_step, whouse in whouses.items():
+                completion_times[vectorized_step] = sorted(
+                    whouse.get_order_manager().return_mapping_prio_to_completion_times())
+                times = [time for prio, time in completion_times[vectorized_step]]
+                totals[vectorized_step][0] += whouse.get_total_steps()
+                totals[vectorized_step][1] += whouse.get_movement_stats()["blocked_steps"]
+                totals[vectorized_step][2] += statistics.mean(times) if times else 0
+            if first_difference is None and completion_times[False] == completion_times[True]:
+                identical_runs += 1
+            else:
+                first_differences.append(first_difference or whouses[False].get_total_steps())
+
+        runs = max(finished_runs, 1)
+        result = [robot_num, side_len, finished_runs, identical_runs,
+                  statistics.mean(first_differences) if first_differences else 0,
+                  totals[False][0] / runs, totals[True][0] / runs, totals[False][1] / runs, totals[True][1] / runs,
+                  totals[False][2] / runs, totals[True][2] / runs]
+        print("%s %s %s %s %.1f %.1f %.1f %.1f %.1f %.1f %.1f" % tuple(result))
+        results.append(result)
+    return results
+
+
+def run_waiting_fleet_benchmark(robot_num=4000, waiting_fractions=(0, 0.5, 0.9, 1), steps=20):
+    # Time per step of a moving fleet where some of the robots are waiting out the whole run, as when charging
+    print("robots waiting step_ms")
+    results = []
+    for waiting_fraction in waiting_fractions:
+        whouse = build_fleet_warehouse(robot_num, travel_len=steps + 1, vectorized_step=True)
+        waiting_num = int(robot_num * waiting_fraction)
+        # The robots at the back of the block wait, so they don't stand in the way of the others
+        for robot_obj in sorted(whouse._robots.values(), key=lambda robo: -robo.get_position()[1])[:waiting_num]:
+            robot_obj.add_wait_steps(steps * 2)
+        start_time = time.perf_counter()
+        for i in range(steps):
+            whouse.step()
+        result = [robot_num, waiting_num, (time.perf_counter() - start_time) * 1000 / steps]
+        print("%s %s %.2f" % tuple(result))
+        results.append(result)
+    return results
+
+
+def run_event_engine_benchmark(robot_num=10, side_lens=(51, 101, 201), seeds=range(3), step_limit=20000):
+    # Whole simulations with the tick and event engines. The event engine should give the same results, so the
+    # steps and order completion times are compared too.
+    print("robots side engine steps skipped_steps step_calls total_ms same_results")
+    results = []
+    for side_len in side_lens:
+        outcomes = {}
+        for engine in warehouse.ENGINES:
+            total_steps = 0
+            skipped_steps = 0
+            step_calls = 0
+            elapsed = 0
+            outcomes[engine] = []
+            for seed in seeds:
+                whouse = build_nxn_warehouse(robot_num, side_len, step_limit=step_limit, engine=engine, seed=seed)
+                start_time = time.perf_counter()
+                done = False
+                while not done:
+                    done = whouse.step()
+                    step_calls += 1
+                elapsed += time.perf_counter() - start_time
+                total_steps += whouse.get_total_steps()
+                skipped_steps += whouse.get_movement_stats()["skipped_steps"]
+                outcomes[engine].append((whouse.get_total_steps(),
+                                         whouse.get_order_manager().return_mapping_prio_to_completion_times()))
+
+            result = [robot_num, side_len, engine, total_steps, skipped_steps, step_calls, elapsed * 1000,
+                      outcomes[engine] == outcomes["tick"]]
+            print("%s %s %s %s %s %s %.1f %s" % tuple(result))
+            results.append(result)
+    return results
+
+
+def bytes_per_object(make_objects, count):
+    # Memory allocated per object while count objects made by make_objects are alive
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = make_objects(count)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del objects
+    return used / count
+
+
+def make_robots(count):
+    fleet = robotfleet.RobotFleet()
+    return [robot.Robot("robot%s" % i, i, 0, 3, [0, 0, 0, 0], fleet) for i in range(count)]
+
+
+def make_orders(count, items_per_order=3):
+    # Orders share the warehouse's items, as the order manager's do
+    items = [item.Item(i, i) for i in range(12)]
+    return [order.Order([items[(i + j) % len(items)] for j in range(items_per_order)], i % 5 + 1, i)
+            for i in range(count)]
+
+
+class LegacyItem:
+    # The original dict backed entity classes, before they were slotted and items were identified by int, with just
+    # the attributes they held, kept here so run_memory_benchmark can compare against them
+    def __init__(self, item_name: str, item_dep: int):
+        self._name = item_name
+        self._dep = item_dep
+
+
+class LegacyRobot:
+    # Robot, with the attributes of InventoryEntity, and its position and state held on the object rather than in
+    # a fleet's columns
+    def __init__(self, name: str, x: int, y: int, max_inv_size: int, fault_rates: list):
+        self._x = x
+        self._y = y
+        self._home_x = x
+        self._home_y = y
+        self.wait_steps = 0
+        self._assigned_order = None
+        self._movement_path = []
+        self._current_target = None
+        self._steps_halted = 0
+        self._prio = None
+        self._battery_critical_fault_rate = fault_rates[0]
+        self._battery_low_fault_rate = fault_rates[1]
+        self._actuator_fault_rate = fault_rates[2]
+        self._sensor_fault_rate = fault_rates[3]
+        self._goal_visit_flag = None
+        self.battery_faulted = False
+        self.gone_home_to_clear_inv = False
+        self.charge_time = 50
+        self.apply_charge_wait_upon_reaching_home = False
+        self.battery_faulted_critical = False
+        self.sensors_faulted = False
+        self.actuators_faulted = False
+        self._name = name
+        self._inventory = []
+        self.last_item_dep = math.inf
+        self._max_inv = max_inv_size
+        self._amount_items_transfer_next_time = None
+        self._should_transmit = True
+
+
+class LegacyOrder:
+    def __init__(self, items: list, prio: int, idnum: int, original_items=None):
+        self._items = items
+        self._prio = prio
+        self._id = idnum
+        if original_items is None:
+            self._orig_items = items
+        else:
+            self._orig_items = original_items
+
+
+def make_legacy_robots(count):
+    return [LegacyRobot("robot%s" % i, i, 0, 3, [0, 0, 0, 0]) for i in range(count)]
+
+
+def make_legacy_orders(count, items_per_order=3):
+    items = [LegacyItem("item%s" % i, i) for i in range(12)]
+    return [LegacyOrder([items[(i + j) % len(items)] for j in range(items_per_order)], i % 5 + 1, i)
+            for i in range(count)]
+
+
+def run_warehouse_setup_benchmark(robot_num=10, side_lens=(21, 101, 201), repeats=20):
+    # Time to build a warehouse from a layout file, read and parsed every time as each simulation used to, and from
+    # one in-memory layout, whose parsed form is shared
+    print("robots side file_ms layout_ms speedup")
+    results = []
+    for side_len in side_lens:
+        layout = main.gen_nxn_layout(robot_num, side_len)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            file_name = os.path.join(tmp_dir, "layout.txt")
+            with open(file_name, "w") as f:
+                f.write(layout.get_text())
+            setup_ms = []
+            for source in (file_name, layout):
+                start_time = time.perf_counter()
+                for i in range(repeats):
+                    warehouse.Warehouse(source, 12, 3, "simple", [0, 0, 0, 0], True, 1000)
+                setup_ms.append((time.perf_counter() - start_time) * 1000 / repeats)
+
+        result = [robot_num, side_len, setup_ms[0], setup_ms[1], setup_ms[0] / setup_ms[1]]
+        print("%s %s %.2f %.2f %.1fx" % tuple(result))
+        results.append(result)
+    return results
+
+
+def run_fork_benchmark(robot_nums=(10, 100), side_len=101, steps=50, repeats=20):
+    # Time to build a new warehouse against forking one part way through a simulation, which copies only the state
+    # that changes as it runs and shares the rest
+    print("robots side build_ms fork_ms speedup")
+    results = []
+    for robot_num in robot_nums:
+        layout = main.gen_nxn_layout(robot_num, side_len)
+        start_time = time.perf_counter()
+        for i in range(repeats):
+            whouse = warehouse.Warehouse(layout, 12, 3, "simple", [0, 0, 0, 0], True, 100000, seed=0)
+        build_ms = (time.perf_counter() - start_time) * 1000 / repeats
+        for i in range(steps):
+            whouse.step()
+        start_time = time.perf_counter()
+        for i in range(repeats):
+            whouse.fork()
+        fork_ms = (time.perf_counter() - start_time) * 1000 / repeats
+
+        result = [robot_num, side_len, build_ms, fork_ms, build_ms / fork_ms]
+        print("%s %s %.2f %.2f %.1f" % tuple(result))
+        results.append(result)
+    return results
+
+
+def run_checkpoint_benchmark(robot_nums=(10, 100), side_len=101, checkpoint_steps=100, seeds=range(3),
+                             step_limit=20000, repeats=20):
+    # Time per step of whole simulations without checkpoints and with one every checkpoint_steps steps, and the
+    # time taken on the step to take one. Compressing and writing the file is done on a thread. A run of each is
+    # done first to warm up, then the runs take turns to go first for each seed, so neither gets the warm caches.
+    print("robots side checkpoints plain_step_ms checkpointed_step_ms checkpoint_ms")
+    results = []
+    for robot_num in robot_nums:
+        elapsed = {0: 0, checkpoint_steps: 0}
+        total_steps = {0: 0, checkpoint_steps: 0}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            def run(seed, steps_apart):
+                whouse = build_nxn_warehouse(robot_num, side_len, step_limit=step_limit, seed=seed,
+                                             checkpoint_steps=steps_apart,
+                                             checkpoint_filename=os.path.join(tmp_dir, str(seed) + "-%s.bin"))
+                start_time = time.perf_counter()
+                while not whouse.step():
+                    pass
+                run_time = time.perf_counter() - start_time
+                whouse.wait_for_checkpoints()
+                return whouse, run_time
+
+            for steps_apart in (0, checkpoint_steps):
+                run(seeds[0], steps_apart)
+            for f in os.listdir(tmp_dir):
+                os.remove(os.path.join(tmp_dir, f))
+            for i, seed in enumerate(seeds):
+                for steps_apart in (0, checkpoint_steps)[::1 if i % 2 == 0 else -1]:
+                    whouse, run_time = run(seed, steps_apart)
+                    elapsed[steps_apart] += run_time
+                    total_steps[steps_apart] += whouse.get_total_steps()
+            checkpoint_count = len(os.listdir(tmp_dir))
+        start_time = time.perf_counter()
+        for i in range(repeats):
+            checkpoint.encode_checkpoint(whouse)
+        checkpoint_ms = (time.perf_counter() - start_time) * 1000 / repeats
+
+        result = [robot_num, side_len, checkpoint_count] + [elapsed[steps_apart] * 1000 / total_steps[steps_apart]
+                                                            for steps_apart in (0, checkpoint_steps)] + [checkpoint_ms]
+        print("%s %s %s %.3f %.3f %.3f" % tuple(result))
+        results.append(result)
+    return results
+
+
+def run_memory_benchmark(counts=(1000, 10000)):
+    # Bytes allocated per robot and per order, including everything they own, for the original dict backed classes
+    # and the slotted ones
+    print("objects legacy_bytes_per_robot bytes_per_robot legacy_bytes_per_order bytes_per_order")
+    results = []
+    for count in counts:
+        result = [count, bytes_per_object(make_legacy_robots, count), bytes_per_object(make_robots, count),
+                  bytes_per_object(make_legacy_orders, count), bytes_per_object(make_orders, count)]
+        print("%s %.0f %.0f %.0f %.0f" % tuple(result))
+        results.append(result)
+    return results
+
+
+def run_step_time_benchmark(robot_num=10, side_lens=(21, 51, 101, 201), seeds=range(3), step_limit=20000):
+    # Average time per step of whole simulations with each path planner, to see how it grows with the floor size
+    print("robots side planner steps step_ms")
+    results = []
+    for side_len in side_lens:
+        for path_planner in warehouse.PATH_PLANNERS:
+            total_steps = 0
+            elapsed = 0
+            for seed in seeds:
+                whouse = build_nxn_warehouse(robot_num, side_len, step_limit=step_limit, path_planner=path_planner,
+                                             seed=seed)
+                start_time = time.perf_counter()
+                while not whouse.step():
+                    pass
+                elapsed += time.perf_counter() - start_time
+                total_steps += whouse.get_total_steps()
+
+            result = [robot_num, side_len, path_planner, total_steps, elapsed * 1000 / total_steps]
+            print("%s %s %s %s %.3f" % tuple(result))
+            results.append(result)
+    return results
+
+
+if __name__ == "__main__":
+    run_pathfinding_benchmark()
+    run_jump_point_benchmark()
+    run_replanning_benchmark()
+    run_cooperative_benchmark()
+    run_path_cache_benchmark()
+    run_step_time_benchmark()
+    run_fleet_step_benchmark()
+    run_vectorized_step_divergence_benchmark()
+    run_waiting_fleet_benchmark()
+    run_event_engine_benchmark()
+    run_warehouse_setup_benchmark()
+    run_fork_benchmark()
+    run_checkpoint_benchmark()
+    run_memory_benchmark()
@@ -0,0 +1,128 @@
+import io
+import os
+import pickle
+import struct
+import threading
+import zlib
+
+import customexceptions
+import warehouse
+import warehouselayout
+
+# A checkpoint file is a header followed by a zlib compressed record of the warehouse. The header is the magic bytes,
+# the format version, the step the checkpoint was taken after, the length of the compressed data and its CRC-32, so
+# files cut short or from another format are caught before the record is read.
+# The record is a dict of the arguments the warehouse was built with, see warehouse.Warehouse.get_arguments, and the
+# state that changes as it runs, see warehouse.Warehouse.get_state. It only holds plain data, dicts, lists, tuples,
+# strings, numbers, arrays and NumPy arrays, pickled, and no classes of the simulation, so reading one builds the
+# warehouse with the code that reads it. Anything else in the pickle is refused.
+MAGIC = b"RSCK"
+# Version 1 also held the state of random, from before warehouses had their own random streams. Version 2 held the
+# pickled warehouse.
+FORMAT_VERSION = 3
+HEADER = struct.Struct("<4sHQQI")
+# The only globals a record's pickle may name, those arrays and NumPy arrays are pickled with
+RECORD_GLOBALS = {("array", "array"), ("array", "_array_reconstructor"), ("numpy", "dtype"), ("numpy", "ndarray"),
+                  ("numpy._core.numeric", "_frombuffer"), ("numpy.core.numeric", "_frombuffer"),
+                  ("numpy._core.multiarray", "_reconstruct"), ("numpy.core.multiarray", "_reconstruct")}
+
+
+class RecordUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in RECORD_GLOBALS:
+            raise customexceptions.SimulationError("Checkpoint records can't hold %s.%s" % (module, name))
+        return super().find_class(module, name)
+
+
+def encode_checkpoint(warehouse_obj):
+    # Returns the pickled record of the warehouse and its step, pickling is all that has to be done on the step itself
+    record = {"arguments": warehouse_obj.get_arguments(), "state": warehouse_obj.get_state()}
+    return pickle.dumps(record, pickle.HIGHEST_PROTOCOL), warehouse_obj.get_total_steps()
+
+
+def decode_checkpoint(state: bytes):
+    # Builds the warehouse again from a pickled record, from encode_checkpoint
+    record = RecordUnpickler(io.BytesIO(state)).load()
+    arguments = record["arguments"]
+    arguments["w_house_layout"] = warehouselayout.WarehouseLayout.from_text(arguments["w_house_layout"])
+    warehouse_obj = warehouse.Warehouse(**arguments)
+    warehouse_obj.set_state(record["state"])
+    return warehouse_obj
+
+
+def write_checkpoint_file(filename: str, state: bytes, step: int):
+    # Written to a temporary file first and then moved into place, so a crash while writing never leaves a broken
+    # checkpoint under the real name
+    data = zlib.compress(state, 1)
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, step, len(data), zlib.crc32(data)))
+        f.write(data)
+    os.replace(temp_filename, filename)
+
+
+def write_checkpoint(filename: str, warehouse_obj):
+    write_checkpoint_file(filename, *encode_checkpoint(warehouse_obj))
+
+
+def read_checkpoint(filename: str):
+    # Returns the warehouse saved in a checkpoint. Carrying on stepping it gives the same results as the run that
+    # wrote it, and it carries on writing checkpoints if that run did.
+    with open(filename, "rb") as f:
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise customexceptions.SimulationError("Checkpoint %s is too short" % filename)
+        magic, version, step, length, crc = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise customexceptions.SimulationError("%s is not a checkpoint" % filename)
+        if version != FORMAT_VERSION:
+            raise customexceptions.SimulationError("Checkpoint %s has format version %s, expected %s" %
+                                                   (filename, version, FORMAT_VERSION))
+        data = f.read(length)
+    if len(data) != length or zlib.crc32(data) != crc:
+        raise customexceptions.SimulationError("Checkpoint %s is corrupt" % filename)
+
+    return decode_checkpoint(zlib.decompress(data))
+
+
+class CheckpointWriter:
+    # Writes a checkpoint of a warehouse every `every` steps, to filename_pattern with the step filled in, so there
+    # is a checkpoint to go back to for every part of a run. Only the record is made on the step, compressing and
+    # writing the file is done on a thread while the simulation carries on. An error writing a file is raised by the
+    # next call to write or wait.
+    def __init__(self, filename_pattern: str, every: int):
+        if every <= 0:
+            raise customexceptions.SimulationError("Checkpoints must be at least one step apart")
+        self._filename_pattern = filename_pattern
+        self._every = every
+        self._thread = None
+        self._error = None
+
+    def after_step(self, warehouse_obj, steps_before: int):
+        # Writes a checkpoint if the step, or the steps jumped over with it, passed a multiple of every
+        if warehouse_obj.get_total_steps() // self._every > steps_before // self._every:
+            self.write(warehouse_obj)
+
+    def write(self, warehouse_obj):
+        # Only one checkpoint is written at a time, so they land in order
+        self.wait()
+        state, step = encode_checkpoint(warehouse_obj)
+        self._thread = threading.Thread(target=self.write_file, args=(self._filename_pattern % step, state, step))
+        self._thread.start()
+
+    def write_file(self, filename: str, state: bytes, step: int):
+        # Runs on the thread, an exception there would otherwise only be printed
+        try:
+            write_checkpoint_file(filename, state, step)
+        except Exception as e:
+            self._error = e
+
+    def wait(self):
+        # Waits for the checkpoint being written, if any, to be in its file, and raises what went wrong writing it
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error = self._error
+            self._error = None
+            raise error
@@ -7,6 +7,9 @@ import copy
 
 # Models an entity with a LIFO stack inventory, where items within the stack must follow a dependency
 class InventoryEntity:
+    __slots__ = ("_name", "_inventory", "last_item_dep", "_max_inv", "_amount_items_transfer_next_time",
+                 "_should_transmit")
+
     def __init__(self, name: str, max_inventory_size, is_simulation_obj=True):
         self._name = name
         self._inventory = []
@@ -103,4 +106,15 @@ class InventoryEntity:
         return item_names
 
     def get_inventory_usage(self):
-        return len(self._inventory)
\ No newline at end of file
+        return len(self._inventory)
+
+    def get_state(self):
+        # The inventory as plain data, items by id, see warehouse.Warehouse.get_state
+        return {"inventory": [itm.get_id() for itm in self._inventory], "last_item_dep": self.last_item_dep,
+                "amount_items_transfer_next_time": self._amount_items_transfer_next_time}
+
+    def set_state(self, state, items):
+        # items is a dict of item name -> item
+        self._inventory = [items[item.ITEM_NAME_FORMAT % item_id] for item_id in state["inventory"]]
+        self.last_item_dep = state["last_item_dep"]
+        self._amount_items_transfer_next_time = state["amount_items_transfer_next_time"]
\ No newline at end of file
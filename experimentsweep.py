@@ -0,0 +1,186 @@
+import argparse
+import functools
+import itertools
+import json
+import os
+import random
+import statistics
+import time
+import tomllib
+
+import customexceptions
+import main
+import warehouselayout
+
+# Spec keys whose values are lists of settings to sweep over, the grid is every combination of them. Generated
+# layouts are also swept over "robots".
+SWEEP_KEYS = ["layouts", "schedule_modes", "fault_rates", "fault_tolerant", "movement_modes", "path_planners",
+              "engines", "seeds"]
+DEFAULT_SPEC = {"robots": [1],
+                "schedule_modes": ["simple"],
+                "fault_rates": [[0, 0, 0, 0]],
+                "fault_tolerant": [True],
+                "movement_modes": ["astar"],
+                "path_planners": ["astar"],
+                "engines": ["tick"],
+                "seeds": [0],
+                "repetitions": 1,
+                "num_items": 12,
+                "inventory_size": 3,
+                "step_limit": 1500,
+                "output": "results.jsonl"}
+
+
+def load_spec(spec_filename: str):
+    # Reads an experiment spec from a JSON or TOML file. Layouts are either {"side_len": n}, for an n by n layout made
+    # by main.gen_nxn_layout for each number of robots, or {"file": name}, relative to the spec's directory.
+    with open(spec_filename, "rb") as f:
+        if spec_filename.endswith(".toml"):
+            spec = tomllib.load(f)
+        else:
+            spec = json.load(f)
+    if "layouts" not in spec:
+        raise customexceptions.SimulationError("Experiment spec has no layouts")
+    spec = dict(DEFAULT_SPEC, **spec)
+    spec_dir = os.path.dirname(os.path.abspath(spec_filename))
+    for layout in spec["layouts"]:
+        if "file" in layout:
+            layout["file"] = os.path.join(spec_dir, layout["file"])
+        elif "side_len" not in layout:
+            raise customexceptions.SimulationError("Layouts need a side_len or a file")
+    spec["output"] = os.path.join(spec_dir, spec["output"])
+    return spec
+
+
+def expand_cells(spec):
+    # Returns a cell for each combination of the spec's settings. Each cell runs the spec's repetitions of one
+    # setting, seeded from its seed.
+    cells = []
+    for settings in itertools.product(*(spec[key] for key in SWEEP_KEYS)):
+        cell = dict(zip(["layout", "schedule_mode", "fault_rates", "fault_tolerant", "movement_mode", "path_planner",
+                         "engine", "seed"], settings))
+        for key in ["repetitions", "num_items", "inventory_size", "step_limit"]:
+            cell[key] = spec[key]
+        if "file" in cell["layout"]:
+            cells.append(dict(cell, robots=None))
+        else:
+            for robot_num in spec["robots"]:
+                cells.append(dict(cell, robots=robot_num))
+    return cells
+
+
+def build_layout(cell):
+    layout = cell["layout"]
+    if "file" in layout:
+        return warehouselayout.WarehouseLayout.from_file(layout["file"])
+    return main.gen_nxn_layout(cell["robots"], layout["side_len"])
+
+
+@functools.lru_cache(maxsize=None)
+def layout_file_size(filename: str):
+    # The number of robots, width and height of a layout file, without parsing it into a layout
+    with open(filename, "r") as f:
+        rows = [row.strip() for row in f.read().splitlines()]
+    return sum(row.count(warehouselayout.ROBOT) for row in rows), len(rows[0]) if rows else 0, len(rows)
+
+
+def expected_cost(cell):
+    # A rough guess of how long a cell takes, robots times floor area, to start the longest cells first. Worked out
+    # from the cell's settings, the layouts are only built when the cells are run.
+    layout = cell["layout"]
+    if "file" in layout:
+        robot_num, width, height = layout_file_size(layout["file"])
+    else:
+        robot_num, width, height = cell["robots"], layout["side_len"], layout["side_len"]
+    return robot_num * width * height * cell["repetitions"]
+
+
+def run_cell(cell):
+    # Runs a cell's simulations and returns its record for the results file. The layout is built once and shared
+    # by the cell's simulations.
+    warehouse_args = (build_layout(cell), cell["num_items"], cell["inventory_size"], cell["schedule_mode"],
+                      cell["fault_rates"], cell["fault_tolerant"], cell["step_limit"], cell["movement_mode"],
+                      cell["path_planner"])
+    seed_rng = random.Random(cell["seed"])
+    seeds = [seed_rng.getrandbits(64) for _ in range(cell["repetitions"])]
+    start_time = time.perf_counter()
+    results = [main.run_one_simulation(sim_num, warehouse_args, {"engine": cell["engine"]}, seed)
+               for sim_num, seed in enumerate(seeds)]
+    elapsed = time.perf_counter() - start_time
+
+    finished = [result for result in results if result["error"] is None]
+    total_steps = sum(result["step_count"] for result in finished)
+    record = dict(cell, side_len=cell["layout"].get("side_len"))
+    record.update({"steps": [result["steps"] for result in finished],
+                   "errors": [result["error"] for result in results if result["error"] is not None],
+                   "mean_steps": statistics.mean(result["steps"] for result in finished) if finished else None,
+                   "mean_step_ms": (sum(result["step_time_ns"] for result in finished) / total_steps / 10**6
+                                    if total_steps else None),
+                   "order_prio": [list(pair) for result in finished for pair in result["order_prio"]],
+                   "ga_attempts": [sum(attempts) for attempts in
+                                   zip(*([result["ga_attempts"] for result in finished] or [[0] * 5]))],
+                   "elapsed_s": elapsed})
+    return record
+
+
+def run_sweep(spec, processes=None):
+    # Runs every cell of the spec, longest expected first, spread over a process pool, and writes a JSON line per
+    # cell to the spec's output as each finishes. Returns the records.
+    cells = sorted(expand_cells(spec), key=expected_cost, reverse=True)
+    if processes == 1:
+        records = map(run_cell, cells)
+    else:
+        records = main.get_process_pool(processes).imap_unordered(run_cell, cells)
+
+    results = []
+    with open(spec["output"], "w") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            results.append(record)
+            print("Finished cell %s of %s" % (len(results), len(cells)))
+    return results
+
+
+def load_results(results_filename: str):
+    with open(results_filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def plot_results(results, x="robots", y="mean_step_ms", group="schedule_mode"):
+    # Plots the mean of y against x for each value of group, from records of run_sweep or load_results
+    import matplotlib.pyplot as plt
+
+    series = {}
+    for record in results:
+        if record.get(x) is None or record[y] is None:
+            continue
+        series.setdefault(str(record[group]), {}).setdefault(record[x], []).append(record[y])
+
+    plt.figure(figsize=(8, 8))
+    for group_value, points in sorted(series.items()):
+        x_values = sorted(points.keys())
+        plt.plot(x_values, [statistics.mean(points[x_value]) for x_value in x_values], marker="o", label=group_value)
+    ax = plt.gca()
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    plt.legend(title=group)
+    plt.show()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("spec", help="JSON or TOML experiment spec")
+    parser.add_argument("-p", "--processes", type=int, default=None, help="Processes to run cells in, all cores if"
+                                                                           " not given")
+    parser.add_argument("--plot", action="store_true", help="Plot the results once the sweep is done")
+    parser.add_argument("--x", default="robots", help="Field to plot along the x axis")
+    parser.add_argument("--y", default="mean_step_ms", help="Field to plot along the y axis")
+    parser.add_argument("--group", default="schedule_mode", help="Field to plot a line for each value of")
+    args = parser.parse_args()
+    os.environ.setdefault("ROBOTSIM_TRANSMIT", "False")
+
+    sweep_spec = load_spec(args.spec)
+    sweep_results = run_sweep(sweep_spec, args.processes)
+    if args.plot:
+        plot_results(sweep_results, args.x, args.y, args.group)
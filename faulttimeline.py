@@ -0,0 +1,54 @@
+import numpy
+
+# Fault types, in the order of the fault lists used by Robot.introduce_faults
+BATTERY_CRITICAL = 0
+BATTERY_LOW = 1
+ACTUATOR = 2
+SENSOR = 3
+FAULT_TYPES = 4
+# Step of a fault that will never happen
+NEVER = numpy.iinfo(numpy.int64).max
+
+
+class FaultTimeline:
+    # Each type of fault happens to a robot with a fixed chance every step. Rather than drawing for every robot and
+    # fault type each step, the step of the next fault of each type is drawn ahead for the whole fleet at once. The
+    # number of steps until a fault with chance p per step follows a geometric distribution, so this gives the same
+    # chances, and nothing is drawn again until one of those steps comes. Fault free fleets never draw at all.
+    def __init__(self, fault_rates, rng: numpy.random.Generator):
+        # fault_rates is a list of [battery critical, battery low, actuator, sensor] chances per step, one per robot
+        self._rates = numpy.array(fault_rates, dtype=float).reshape(-1, FAULT_TYPES)
+        self._rng = rng
+        self._fault_steps = numpy.full(self._rates.shape, NEVER, dtype=numpy.int64)
+        possible = self._rates > 0
+        self._fault_steps[possible] = self._rng.geometric(self._rates[possible])
+        self._next_step = self._fault_steps.min(initial=NEVER)
+
+    def faults_at(self, step: int):
+        # Returns a dict of robot index -> list of whether each fault type is due for the robots with faults due on
+        # step, and draws the next step of each of those faults. Steps must be asked for in order.
+        if step < self._next_step:
+            return {}
+        due = self._fault_steps == step
+        robots = numpy.flatnonzero(due.any(axis=1))
+        faults = {robot_index: due[robot_index].tolist() for robot_index in robots.tolist()}
+        self._fault_steps[due] = step + self._rng.geometric(self._rates[due])
+        self._next_step = self._fault_steps.min()
+        return faults
+
+    def next_fault_step(self):
+        return self._next_step
+
+    def get_state(self):
+        return {"fault_steps": self._fault_steps.copy(), "next_step": int(self._next_step)}
+
+    def set_state(self, state, rng: numpy.random.Generator):
+        # Takes over the data of state, from get_state, and carries on drawing from rng
+        self._fault_steps = state["fault_steps"]
+        self._next_step = state["next_step"]
+        self._rng = rng
+
+    def stop(self, robot_index: int):
+        # No more faults happen to the robot, once its battery has failed
+        self._fault_steps[robot_index] = NEVER
+        self._next_step = self._fault_steps.min()
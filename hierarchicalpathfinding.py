@@ -0,0 +1,284 @@
+import functools
+import heapq
+from collections import OrderedDict
+
+import pathfinding
+
+# Side length, in cells, of the square clusters the grid is split into
+CLUSTER_SIZE = 10
+# Runs of open border between two clusters at least this long get an entrance at each end instead of one in the middle
+LONG_ENTRANCE_LENGTH = 6
+# Cost tables kept by each abstraction, the least recently used are dropped and built again if they are needed
+COST_TABLE_CACHE_SIZE = 256
+
+
+class ClusterAbstraction:
+    # The static, layout only part of hierarchical pathfinding (HPA*). The grid is split into square clusters, and
+    # the open cells (not walls or endpoints) either side of each run of open border between two clusters are the
+    # nodes of an abstract graph. A node has an edge of cost 1 to the node across the border from it, and an edge to
+    # every other node it can reach without leaving its cluster, costing the length of the shortest such path.
+    # Abstractions are shared between warehouses with the same layout, see compile_cluster_abstraction, so they must
+    # not be changed after they are built.
+    def __init__(self, graph: pathfinding.NavigationGraph, cluster_size: int):
+        self.graph = graph
+        self.cluster_size = cluster_size
+        self.clusters_x = (graph.width + cluster_size - 1) // cluster_size
+        self.clusters_y = (graph.height + cluster_size - 1) // cluster_size
+        # Node cell -> list of (neighbour node cell, cost)
+        self.edges = {}
+        self.cluster_nodes = [[] for i in range(self.clusters_x * self.clusters_y)]
+        # Target cell -> cost table, see cost_table
+        self._cost_tables = OrderedDict()
+
+        self.find_entrances()
+        for cluster in range(len(self.cluster_nodes)):
+            self.connect_cluster_nodes(cluster)
+
+    def __reduce__(self):
+        # As with navigation graphs, copies of an abstraction are the one compiled for the same graph. The cache
+        # tells calls with and without cluster_size apart, so it has to be given when compiling for a warehouse too.
+        return compile_cluster_abstraction, (self.graph, self.cluster_size)
+
+    def cluster_of(self, cell: int):
+        width = self.graph.width
+        return (cell // width // self.cluster_size) * self.clusters_x + (cell % width) // self.cluster_size
+
+    def is_open(self, cell: int):
+        return not self.graph.is_wall[cell] and not self.graph.is_endpoint[cell]
+
+    def add_node(self, cell: int):
+        if cell not in self.edges:
+            self.edges[cell] = []
+            self.cluster_nodes[self.cluster_of(cell)].append(cell)
+
+    def add_entrance(self, run):
+        # run is a list of (cell, cell across the border) pairs that are all open
+        if len(run) < LONG_ENTRANCE_LENGTH:
+            pairs = [run[len(run) // 2]]
+        else:
+            pairs = [run[0], run[-1]]
+        for inside, across in pairs:
+            self.add_node(inside)
+            self.add_node(across)
+            self.edges[inside].append((across, 1))
+            self.edges[across].append((inside, 1))
+
+    def find_entrances(self):
+        width = self.graph.width
+        height = self.graph.height
+        # Borders between columns of clusters, then between rows of clusters
+        for border_x in range(self.cluster_size, width, self.cluster_size):
+            for cluster_y in range(self.clusters_y):
+                run = []
+                for y in range(cluster_y * self.cluster_size, min((cluster_y + 1) * self.cluster_size, height)):
+                    inside = y * width + border_x - 1
+                    if self.is_open(inside) and self.is_open(inside + 1):
+                        run.append((inside, inside + 1))
+                    elif run:
+                        self.add_entrance(run)
+                        run = []
+                if run:
+                    self.add_entrance(run)
+        for border_y in range(self.cluster_size, height, self.cluster_size):
+            for cluster_x in range(self.clusters_x):
+                run = []
+                for x in range(cluster_x * self.cluster_size, min((cluster_x + 1) * self.cluster_size, width)):
+                    inside = (border_y - 1) * width + x
+                    if self.is_open(inside) and self.is_open(inside + width):
+                        run.append((inside, inside + width))
+                    elif run:
+                        self.add_entrance(run)
+                        run = []
+                if run:
+                    self.add_entrance(run)
+
+    def endpoint_sources(self, cell: int):
+        # A robot enters or leaves a shelf, goal or home through the open cells next to it, which can be in a
+        # different cluster to it
+        graph = self.graph
+        if not graph.is_endpoint[cell]:
+            return {cell: 0}
+        return {entry: 1 for entry in graph.entries[graph.entry_offsets[cell]:graph.entry_offsets[cell + 1]]
+                if self.is_open(entry)}
+
+    def cluster_distances(self, sources):
+        # Breadth first search from sources (a dict of cell -> starting distance) through open cells, without
+        # crossing out of the cluster of each source. Moves between open cells can always be reversed, so these are
+        # also the distances back to the sources.
+        graph = self.graph
+        offsets = graph.offsets
+        adjacency = graph.adjacency
+        distances = dict(sources)
+        frontier = list(sources)
+        while frontier:
+            next_frontier = []
+            for cell in frontier:
+                distance = distances[cell] + 1
+                cluster = self.cluster_of(cell)
+                for neighbour in adjacency[offsets[cell]:offsets[cell + 1]]:
+                    if neighbour not in distances and self.cluster_of(neighbour) == cluster:
+                        distances[neighbour] = distance
+                        next_frontier.append(neighbour)
+            frontier = next_frontier
+        return distances
+
+    def connect_cluster_nodes(self, cluster: int):
+        nodes = self.cluster_nodes[cluster]
+        for node in nodes:
+            distances = self.cluster_distances({node: 0})
+            for other in nodes:
+                if other != node and other in distances:
+                    self.edges[node].append((other, distances[other]))
+
+    def cost_table(self, target: int):
+        # Returns a dict of the number of steps from each node to target over the abstract graph, ignoring robots.
+        # Nodes that can't reach target are left out. Each table is built the first time it is asked for, and the
+        # COST_TABLE_CACHE_SIZE most recently used are kept.
+        cost_tables = self._cost_tables
+        table = cost_tables.get(target)
+        if table is None:
+            table = self.build_cost_table(target)
+            cost_tables[target] = table
+            if len(cost_tables) > COST_TABLE_CACHE_SIZE:
+                cost_tables.popitem(last=False)
+        else:
+            cost_tables.move_to_end(target)
+        return table
+
+    def build_cost_table(self, target: int):
+        # Dijkstra's algorithm out from target, starting at the nodes that can reach it without leaving a cluster.
+        # Every edge can be travelled both ways at the same cost, so no reversed graph is needed.
+        table = {}
+        frontier = [(distance, node) for node, distance in self.cluster_distances(self.endpoint_sources(target)).items()
+                    if node in self.edges]
+        heapq.heapify(frontier)
+        while frontier:
+            distance, node = heapq.heappop(frontier)
+            if node in table:
+                continue
+            table[node] = distance
+            for neighbour, cost in self.edges[node]:
+                if neighbour not in table:
+                    heapq.heappush(frontier, (distance + cost, neighbour))
+        return table
+
+
+@functools.lru_cache(maxsize=32)
+def compile_cluster_abstraction(graph: pathfinding.NavigationGraph, cluster_size: int = CLUSTER_SIZE):
+    # Navigation graphs are shared per layout, so this shares the abstraction per layout as well
+    return ClusterAbstraction(graph, cluster_size)
+
+
+class HierarchicalPathfinder:
+    # Plans at the level of the ClusterAbstraction, using its cost tables, and only works out the cells of the path
+    # through the cluster the robot is in. A path ends at the first cell in the next cluster, and the rest of the
+    # path is planned when the robot gets there. Robots are only avoided within the cluster, so a robot heads for
+    # the best exit from its cluster that isn't blocked.
+    # The search can only leave the cluster through a node, so when every node out is blocked, or the target can
+    # only be reached through border cells that aren't nodes, it finds nothing even though there is a path. Then
+    # the whole path is planned by fallback, a GridPathfinder over the same graph, instead.
+    PLANS_THROUGH_CELLS = False
+
+    def __init__(self, abstraction: ClusterAbstraction, fallback: pathfinding.GridPathfinder):
+        self._abstraction = abstraction
+        self._graph = abstraction.graph
+        self._width = abstraction.graph.width
+        self._fallback = fallback
+
+        self.searches = 0
+        self.expansions = 0
+        self.fallbacks = 0
+
+    def get_state(self):
+        # The counts, see warehouse.Warehouse.get_state. The abstraction's cost tables are shared, they only depend
+        # on the layout.
+        return {"searches": self.searches, "expansions": self.expansions, "fallbacks": self.fallbacks}
+
+    def set_state(self, state, fallback: pathfinding.GridPathfinder):
+        self._fallback = fallback
+        self.searches = state["searches"]
+        self.expansions = state["expansions"]
+        self.fallbacks = state["fallbacks"]
+
+    def heuristic(self, a: int, b: int):
+        width = self._width
+        return abs(a % width - b % width) + abs(a // width - b // width)
+
+    def find_path(self, start: int, target: int, occupancy, free_value=-1):
+        # Returns the cells (as (x,y) tuples) of the next part of a path from start to target, not including start.
+        # A cell can only be entered if its occupancy value is free_value. An empty list is returned if there is
+        # no path.
+        self.searches += 1
+        if start == target:
+            return []
+        path = self.find_cluster_path(start, target, occupancy, free_value)
+        if path is None:
+            self.fallbacks += 1
+            path = self._fallback.find_path(start, target, occupancy, free_value)
+        return path
+
+    def find_cluster_path(self, start: int, target: int, occupancy, free_value: int):
+        # The path through the start's cluster to the next one, or to target, or None if none was found
+        abstraction = self._abstraction
+        graph = self._graph
+        offsets = graph.offsets
+        adjacency = graph.adjacency
+        cost_table = abstraction.cost_table(target)
+        target_entries = ()
+        if graph.is_endpoint[target]:
+            target_entries = graph.entries[graph.entry_offsets[target]:graph.entry_offsets[target + 1]]
+
+        # A* through the start's cluster. Stepping into a node in another cluster, or into the target, finishes
+        # the search, with the node's cost table entry as the exact cost of the rest of the path. Exits are pushed
+        # with a heuristic score of -1, so they are taken ahead of cells with the same f score.
+        g_scores = {start: 0}
+        came_from = {}
+        closed = set()
+        start_h = self.heuristic(start, target)
+        frontier = [(start_h, start_h, start)]
+        expansions = 0
+        while frontier:
+            f_score, h_score, current = heapq.heappop(frontier)
+            if current in closed:
+                continue
+            if h_score < 0 or current == target:
+                self.expansions += expansions
+                return self.reconstruct_path(start, current, came_from)
+            closed.add(current)
+            expansions += 1
+
+            possible_g_score = g_scores[current] + 1
+            cluster = abstraction.cluster_of(current)
+            neighbours = adjacency[offsets[current]:offsets[current + 1]]
+            if current in target_entries:
+                neighbours.append(target)
+            for neighbour in neighbours:
+                if occupancy[neighbour] != free_value or neighbour in closed:
+                    continue
+                if neighbour == target:
+                    neighbour_f, neighbour_h = possible_g_score, 0
+                elif current == start or abstraction.cluster_of(neighbour) == cluster:
+                    neighbour_h = self.heuristic(neighbour, target)
+                    neighbour_f = possible_g_score + neighbour_h
+                elif neighbour in cost_table:
+                    neighbour_f, neighbour_h = possible_g_score + cost_table[neighbour], -1
+                else:
+                    continue
+                if neighbour in g_scores and not possible_g_score < g_scores[neighbour]:
+                    continue
+                g_scores[neighbour] = possible_g_score
+                came_from[neighbour] = current
+                heapq.heappush(frontier, (neighbour_f, neighbour_h, neighbour))
+
+        self.expansions += expansions
+        return None
+
+    def reconstruct_path(self, start: int, end: int, came_from):
+        width = self._width
+        path = []
+        current = end
+        while current != start:
+            path.append(pathfinding.cell_position(current, width))
+            current = came_from[current]
+        path.reverse()
+        return path
@@ -1,16 +1,36 @@
+# Item i is called "item<i>"
+ITEM_NAME_FORMAT = "item%s"
+
+
 class Item:
-    def __init__(self, item_name: str, item_dep: int):
-        self._name = item_name
+    # Items are identified by a small int id, and their name is made from it. Items never change, so a copy of an
+    # item is the item itself, which keeps the many deep copies of inventories and orders cheap.
+    __slots__ = ("_id", "_dep")
+
+    def __init__(self, item_id: int, item_dep: int):
+        self._id = item_id
         self._dep = item_dep
 
     def __eq__(self, other):
-        return self._name == other.get_name() and self._dep == other.get_dependency()
+        return self._id == other.get_id() and self._dep == other.get_dependency()
+
+    def __hash__(self):
+        return hash((self._id, self._dep))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def get_id(self):
+        return self._id
 
     def get_dependency(self):
         return self._dep
 
     def get_name(self):
-        return self._name
+        return ITEM_NAME_FORMAT % self._id
 
     def __repr__(self):
-        return "Item name %s Item dep %s" % (self._name, self._dep)
+        return "Item name %s Item dep %s" % (self.get_name(), self._dep)
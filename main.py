@@ -1,20 +1,39 @@
+import checkpoint
 import customexceptions
+import resultcache
 import warehouse
+import warehouselayout
 import robot
 import os
 import argparse
 import time
+import traceback
+import atexit
 import statistics
-import shutil
 import random
 import math
 import matplotlib
+import multiprocessing
+import pickle
 
 from operator import add
 
+# Process pool for running simulations at the same time, see get_process_pool
+_process_pool = None
+_process_pool_size = None
+
 class Simulation:
-    def __init__(self, num_sims:int, whouse:str, num_items:int, inv_size:int, schedule_mode:str, fault_rates, fault_mode, step_limit, side_len = None):
+    def __init__(self, num_sims:int, whouse:str, num_items:int, inv_size:int, schedule_mode:str, fault_rates, fault_mode, step_limit, side_len = None,
+                 movement_mode = "astar", path_planner = "astar", path_cache_size = 0, engine = "tick", seed = None,
+                 result_cache = None):
         self._side_len = side_len
+        self._seed = seed
+        # A resultcache.ResultCache to reuse the results of simulations already run, or None to run every one
+        self._result_cache = result_cache
+        self._movement_mode = movement_mode
+        self._path_planner = path_planner
+        self._path_cache_size = path_cache_size
+        self._engine = engine
         self._num_sims = num_sims
         self.warehouse_file = whouse
         self._num_items = num_items
@@ -27,7 +46,13 @@ class Simulation:
         self.num_robots = None
 
         self.step_amounts = []
-        self.step_times = []
+        # Total time of the steps of every simulation and how many steps that covers, a call to step can jump over
+        # quiet steps. The longest and shortest times per step are of single calls to step, each divided by the steps
+        # that call covered, so a call that jumped over quiet steps counts as that many steps of its average time.
+        self.step_time_ns = 0
+        self.step_count = 0
+        self.max_step_ns = None
+        self.min_step_ns = None
         self.error_strings = []
         self.ga_attempts = [0,0,0,0,0]
 
@@ -36,56 +61,93 @@ class Simulation:
 
         self.order_completion_steps_by_num_robots = {}
 
-    def run_simulation(self, reraise_error, slow_for_transmit):
-        for sim_num in range(self._num_sims):
-            print("Starting sim %s" % sim_num)
-            sim_step_times = []
-            try:
-                simu = warehouse.Warehouse(self.warehouse_file, self._num_items, self._inv_size,
-                                           self._schedule_mode, self._fault_rates, self._fault_mode, self._step_limit)
-                keep_step = True
-                while keep_step:
-                    if slow_for_transmit:
-                        time.sleep(0.2)
-                    before_step_time = time.perf_counter_ns()
-                    keep_step = not simu.step()
-                    elapsed_time_between = time.perf_counter_ns() - before_step_time
-                    sim_step_times.append(elapsed_time_between)
-
-            except customexceptions.SimulationError as err:
-                if reraise_error:
-                    raise err
-                self.error_strings.append(err)
-                continue
-            except Exception as err:
-                if reraise_error:
-                    raise err
-                continue
+    def run_simulation(self, reraise_error, slow_for_transmit, processes=1):
+        # processes > 1 runs the simulations at the same time in a process pool, None uses every core. Each
+        # simulation gets its own seed, so the results don't depend on how many processes run them. The seeds are
+        # drawn from the Simulation's seed, or from random without one, so seeding random still repeats the whole
+        # run. The layout is read once and handed to every simulation, whouse can be a
+        # warehouselayout.WarehouseLayout or the name of a layout file.
+        # With a result cache, the results of seeds already in it are read back rather than run again. A Simulation
+        # with a seed draws the same seeds in the same order every time, so adding simulations to one only runs the
+        # new ones.
+        layout = warehouselayout.load_layout(self.warehouse_file)
+        warehouse_args = (layout, self._num_items, self._inv_size, self._schedule_mode, self._fault_rates,
+                          self._fault_mode, self._step_limit, self._movement_mode, self._path_planner,
+                          self._path_cache_size)
+        warehouse_kwargs = {"engine": self._engine}
+        seed_rng = random if self._seed is None else random.Random(self._seed)
+        seeds = [seed_rng.getrandbits(64) for _ in range(self._num_sims)]
+
+        # Watching simulations being transmitted is the point of slowing them down, so those are always run
+        use_cache = self._result_cache is not None and not slow_for_transmit
+        cached = {}
+        if use_cache:
+            key = resultcache.config_key(warehouse_args, warehouse_kwargs)
+            cached = self._result_cache.get_results(key, seeds)
+            print("%s of %s simulations read from the result cache" % (len(cached), self._num_sims))
+
+        tasks = [(sim_num, warehouse_args, warehouse_kwargs, seed, slow_for_transmit)
+                 for sim_num, seed in enumerate(seeds) if seed not in cached]
+        if processes == 1 or slow_for_transmit:
+            results = map(run_simulation_task, tasks)
+        else:
+            results = get_process_pool(processes).imap(run_simulation_task, tasks)
+
+        # The results are added in the order of the seeds, wherever they came from, so they are the same as if
+        # every simulation had been run
+        for seed in seeds:
+            if seed in cached:
+                result = cached[seed]
+            else:
+                result = next(results)
+                if use_cache:
+                    self._result_cache.put_result(key, seed, result)
+            self.add_result(result, reraise_error)
 
-            self.step_times.extend(sim_step_times)
+        for prio_num in range(5):
+            for order_list in self.order_prio:
+                if order_list[0] == prio_num + 1:
+                    self.order_prio_sorted_completion_time_lists[prio_num].append(order_list[1])
 
-            self.step_amounts.append(simu.get_total_steps())
-            self.order_prio = self.order_prio + simu.get_order_manager().return_mapping_prio_to_completion_times()
-            self.ga_attempts = list(map(add, simu.get_scheduler().get_ga_attempts(), self.ga_attempts))
+    def add_result(self, result, reraise_error):
+        # Adds the results of one simulation, as returned by run_one_simulation
+        err = result["error"]
+        if err is not None:
+            if reraise_error:
+                # The exception itself is raised where it came back from the simulation. Its traceback doesn't pickle,
+                # so one from a process pool is chained to the traceback it was raised with.
+                exception = result["exception"]
+                if exception is None:
+                    if result["simulation_error"]:
+                        raise customexceptions.SimulationError(err)
+                    raise RuntimeError(err)
+                if exception.__traceback__ is None and not result["simulation_error"]:
+                    raise exception from RuntimeError(err)
+                raise exception
+            if result["simulation_error"]:
+                self.error_strings.append(err)
+            return
 
-            orders_to_amount_robots = simu.get_scheduler().get_order_to_amount_of_robots_assigned()
-            order_start_times = simu.get_order_manager().get_order_start_work_times()
-            order_finish_times = simu.get_order_manager().get_order_finish_work_times()
+        self.step_time_ns += result["step_time_ns"]
+        self.step_count += result["step_count"]
+        if self.max_step_ns is None:
+            self.max_step_ns = result["max_step_ns"]
+            self.min_step_ns = result["min_step_ns"]
+        else:
+            self.max_step_ns = max(self.max_step_ns, result["max_step_ns"])
+            self.min_step_ns = min(self.min_step_ns, result["min_step_ns"])
 
-            for order_name in orders_to_amount_robots.keys():
-                order_total_time = order_finish_times[order_name] - order_start_times[order_name]
-                amount_robots = orders_to_amount_robots[order_name]
-                if amount_robots not in self.order_completion_steps_by_num_robots.keys():
-                    self.order_completion_steps_by_num_robots[amount_robots] = [order_total_time]
-                else:
-                    self.order_completion_steps_by_num_robots[amount_robots].append(order_total_time)
+        self.step_amounts.append(result["steps"])
+        self.order_prio = self.order_prio + result["order_prio"]
+        self.ga_attempts = list(map(add, result["ga_attempts"], self.ga_attempts))
 
-            self.num_robots = simu.get_number_of_robots()
+        for amount_robots, order_total_times in result["order_completion_steps_by_num_robots"].items():
+            if amount_robots not in self.order_completion_steps_by_num_robots.keys():
+                self.order_completion_steps_by_num_robots[amount_robots] = list(order_total_times)
+            else:
+                self.order_completion_steps_by_num_robots[amount_robots].extend(order_total_times)
 
-        for prio_num in range(5):
-            for order_list in self.order_prio:
-                if order_list[0] == prio_num + 1:
-                    self.order_prio_sorted_completion_time_lists[prio_num].append(order_list[1])
+        self.num_robots = result["num_robots"]
 
     def print_priority_info(self):
         import matplotlib.pyplot as plt
@@ -121,17 +183,142 @@ class Simulation:
         return self.step_amounts
 
     def print_step_time_info(self):
-        print("Max step time %sms, Min step time %sms" % (max(self.step_times) / 10**6, min(self.step_times) / 10**6))
-        print("Mean step time %sms" % (statistics.mean(self.step_times) / 10**6))
+        # Only simulations that finished are timed, so there may be no step times at all
+        if self.step_count == 0:
+            print("No simulation finished, so there are no step times")
+            return [self.num_robots, self._side_len, None]
+        mean_step_time = self.step_time_ns / self.step_count
+        print("Max step time %sms, Min step time %sms" % (self.max_step_ns / 10**6, self.min_step_ns / 10**6))
+        print("Mean step time %sms" % (mean_step_time / 10**6))
+
+        return [self.num_robots, self._side_len, mean_step_time / 10**6]
+
+
+def run_one_simulation(sim_num, warehouse_args, warehouse_kwargs, seed=None, slow_for_transmit=False):
+    # Runs one simulation and returns its results as a dict, for Simulation.add_result. Errors are returned as the
+    # result's "error" rather than raised, so a process pool carries on with the other simulations, see
+    # error_result. The results include the warehouse's seed, so any simulation can be run again on its own.
+    print("Starting sim %s" % sim_num)
+    try:
+        simu = warehouse.Warehouse(*warehouse_args, seed=seed, **warehouse_kwargs)
+    except Exception as err:
+        return error_result(err, seed)
+    return run_warehouse(simu, slow_for_transmit)
+
 
-        return [self.num_robots, self._side_len, statistics.mean(self.step_times) / 10**6]
+def error_result(err, seed):
+    # Errors are returned as their message, and as the exception too if it pickles, as it has to to come back from
+    # a process pool. A SimulationError is the simulation failing, anything else is a bug, so its message is the
+    # whole traceback.
+    try:
+        pickle.loads(pickle.dumps(err, pickle.HIGHEST_PROTOCOL))
+        exception = err
+    except Exception:
+        exception = None
+    if isinstance(err, customexceptions.SimulationError):
+        return {"error": str(err), "exception": exception, "simulation_error": True, "seed": seed}
+    return {"error": "".join(traceback.format_exception(err)), "exception": exception, "simulation_error": False,
+            "seed": seed}
+
+
+def resume_simulation(checkpoint_filename, slow_for_transmit=False):
+    # Carries on the simulation saved in a checkpoint to the end, with the same results as the run that wrote it.
+    # The results are as for run_one_simulation, with the step times of the steps run since the checkpoint.
+    return run_warehouse(checkpoint.read_checkpoint(checkpoint_filename), slow_for_transmit)
+
+
+def run_warehouse(simu, slow_for_transmit=False):
+    # Steps the warehouse until the simulation is done, and returns its results as run_one_simulation does. Only
+    # totals of the step times are kept, so the results stay small whatever the number of steps.
+    step_time_ns = 0
+    step_count = 0
+    max_step_ns = 0
+    min_step_ns = math.inf
+    try:
+        keep_step = True
+        while keep_step:
+            if slow_for_transmit:
+                time.sleep(0.2)
+            before_step_time = time.perf_counter_ns()
+            keep_step = not simu.step()
+            elapsed_time_between = time.perf_counter_ns() - before_step_time
+            last_step_count = simu.get_last_step_count()
+            step_time_ns += elapsed_time_between
+            step_count += last_step_count
+            max_step_ns = max(max_step_ns, elapsed_time_between / last_step_count)
+            min_step_ns = min(min_step_ns, elapsed_time_between / last_step_count)
+    except Exception as err:
+        return error_result(err, simu.get_seed())
+    finally:
+        simu.wait_for_checkpoints()
+
+    order_completion_steps_by_num_robots = {}
+    orders_to_amount_robots = simu.get_scheduler().get_order_to_amount_of_robots_assigned()
+    order_start_times = simu.get_order_manager().get_order_start_work_times()
+    order_finish_times = simu.get_order_manager().get_order_finish_work_times()
+    for order_name in orders_to_amount_robots.keys():
+        order_total_time = order_finish_times[order_name] - order_start_times[order_name]
+        amount_robots = orders_to_amount_robots[order_name]
+        order_completion_steps_by_num_robots.setdefault(amount_robots, []).append(order_total_time)
+
+    return {"error": None,
+            "exception": None,
+            "simulation_error": False,
+            "seed": simu.get_seed(),
+            "steps": simu.get_total_steps(),
+            "order_prio": simu.get_order_manager().return_mapping_prio_to_completion_times(),
+            "ga_attempts": simu.get_scheduler().get_ga_attempts(),
+            "step_time_ns": step_time_ns,
+            "step_count": step_count,
+            "max_step_ns": max_step_ns,
+            "min_step_ns": min_step_ns,
+            "order_completion_steps_by_num_robots": order_completion_steps_by_num_robots,
+            "num_robots": simu.get_number_of_robots()}
+
+
+def run_simulation_task(task):
+    return run_one_simulation(*task)
+
+
+def get_process_pool(processes=None):
+    # The pool is kept for the rest of the program, so later runs don't have to start their processes again. It is
+    # closed when the program exits, see close_process_pool.
+    global _process_pool, _process_pool_size
+    if processes is None:
+        processes = os.cpu_count()
+    if _process_pool is None or _process_pool_size != processes:
+        if _process_pool is not None:
+            _process_pool.terminate()
+        _process_pool = multiprocessing.Pool(processes)
+        _process_pool_size = processes
+    return _process_pool
+
+
+def close_process_pool():
+    # Lets the pool's processes finish and waits for them, rather than leaving them to be killed at exit
+    global _process_pool, _process_pool_size
+    if _process_pool is not None:
+        _process_pool.close()
+        _process_pool.join()
+        _process_pool = None
+        _process_pool_size = None
+
+
+atexit.register(close_process_pool)
 
 
 def gen_nxn_warehouse(robot_num, side_len):
-    robots_left_to_place = robot_num
-    goals_left_to_place = robot_num
+    # Writes the layout of gen_nxn_layout to a file in the working directory and returns the file's name
     filename = "wt%sx%sr%s.txt" % (side_len, side_len, robot_num)
     f = open(filename, "a")
+    f.write(gen_nxn_layout(robot_num, side_len).get_text())
+    f.close()
+
+    return filename
+
+def gen_nxn_layout(robot_num, side_len):
+    robots_left_to_place = robot_num
+    goals_left_to_place = robot_num
 
     lines = []
 
@@ -182,85 +369,36 @@ def gen_nxn_warehouse(robot_num, side_len):
     lines[middle_index] = lines[middle_index][0] + spacing + "SSXSS" + spacing + lines[middle_index][-2] + "\n"
     lines[one_below] = lines[one_below][0] + spacing + "SSXSS" + spacing + lines[one_below][-2] + "\n"
 
-    for line in lines:
-        f.write(line)
-
-    f.close()
-
-    return filename
-
-def run_simulation_performance_test(scheduling_mode:str, robots_max:int, size_max:int, step_limit:int):
-    try:
-        os.makedirs("tmp")
-    except FileExistsError:
-        shutil.rmtree("tmp")
-        os.makedirs("tmp")
-    os.chdir("tmp")
-    results = []
-    by_sim_size = []
-    ctr = 0
-    for i in range(7, size_max, 2):
-        by_sim_size.append([])
-        for j in range(1, robots_max+1):
-            print("starting %s %s" % (j, i))
-            file_name = gen_nxn_warehouse(j, i)
-            sim_1 = Simulation(10, file_name, 12, 3, scheduling_mode,
-                     [0, 0, 0, 0], True, step_limit, i)
-            sim_1.run_simulation(False, False)
-            results.append(sim_1.print_step_time_info())
-            by_sim_size[ctr].append(sim_1.print_step_time_info())
-        ctr += 1
-    print(results)
-
-    import numpy
-    import matplotlib.pyplot as plt
-    import matplotlib
-    import matplotlib.ticker as ticker
-    from mpl_toolkits.mplot3d import proj3d
+    return warehouselayout.WarehouseLayout.from_text("".join(lines))
 
-    res = numpy.array(results)
-    fig = plt.figure(figsize=(8,8))
-    ax = fig.add_subplot(111, projection='3d')
-    x = res[:, 0]
-    y = res[:, 1]
-    z = res[:, 2]
-    plt.title("Simulation performance for scheduling algorithm %s" % scheduling_mode)
-
-
-    for robot_line in by_sim_size:
-        mini_res = numpy.array(robot_line)
-        ax.plot(mini_res[:, 0], mini_res[:, 1], mini_res[:, 2], color="grey")
-    ax.scatter(x, y, z, c=z, cmap=matplotlib.colormaps.get_cmap("inferno"))
-
-
-
-    ax.set_xlabel('Amount of Robots')
-    ax.set_ylabel('Warehouse side length')
-    ax.set_zlabel('Average step time (ms)')
-
-    ax.xaxis.set_major_locator(ticker.IndexLocator(1,0))
-    ax.yaxis.set_major_locator(ticker.IndexLocator(2, 0))
-
-    plt.show()
+def run_simulation_performance_test(spec_filename="performancesweep.toml", processes=None, plot=False):
+    # Mean step time for each layout size and number of robots, as set out in the spec, see experimentsweep. plot
+    # shows a line of step time against side length for each number of robots once the sweep is done.
+    import experimentsweep
+    results = experimentsweep.run_sweep(experimentsweep.load_spec(spec_filename), processes)
+    if plot:
+        experimentsweep.plot_results(results, x="side_len", group="robots")
+    return results
 
 
-def run_completion_time_test(fault_rates):
+def run_completion_time_test(fault_rates, result_cache=None, seed=0):
+    # result_cache is a resultcache.ResultCache, so running the test again only runs what isn't in it
     sim = Simulation(500, "whouse2.txt", 10, 3, "simple",
-                     fault_rates, True, 1000)
+                     fault_rates, True, 1000, seed=seed, result_cache=result_cache)
 
     sim_1 = Simulation(500, "whouse2.txt", 10, 3, "simple-interrupt",
-                       fault_rates, True, 1000)
+                       fault_rates, True, 1000, seed=seed, result_cache=result_cache)
 
     sim_2 = Simulation(500, "whouse2.txt", 10, 3, "multi-robot",
-                       fault_rates, True, 1000)
+                       fault_rates, True, 1000, seed=seed, result_cache=result_cache)
 
     sim_3 = Simulation(500, "whouse2.txt", 10, 3, "multi-robot-genetic",
-                       fault_rates, True, 1000)
+                       fault_rates, True, 1000, seed=seed, result_cache=result_cache)
 
-    sim.run_simulation(False, False)
-    sim_1.run_simulation(False, False)
-    sim_2.run_simulation(False, False)
-    sim_3.run_simulation(False, False)
+    sim.run_simulation(False, False, None)
+    sim_1.run_simulation(False, False, None)
+    sim_2.run_simulation(False, False, None)
+    sim_3.run_simulation(False, False, None)
 
     steps = [sim.print_steps_taken(), sim_1.print_steps_taken(), sim_2.print_steps_taken(), sim_3.print_steps_taken()]
 
@@ -276,20 +414,21 @@ def run_completion_time_test(fault_rates):
     ax.set_ylabel("Amount of steps")
     plt.show()
 
-def run_fault_test(scheduling_mode):
+def run_fault_test(scheduling_mode, result_cache=None, seed=0):
+    # result_cache is a resultcache.ResultCache, so running the test again only runs what isn't in it
     faulty = [0.0001, 0.001, 0.001, 0.001]
     num_sims = 250
 
     sim = Simulation(num_sims, "whouse2.txt", 10, 3, scheduling_mode,
-                     faulty, True, 1500)
+                     faulty, True, 1500, seed=seed, result_cache=result_cache)
 
     sim_1 = Simulation(num_sims, "whouse2.txt", 10, 3, scheduling_mode,
-                       faulty, False, 1500)
+                       faulty, False, 1500, seed=seed, result_cache=result_cache)
 
 
 
-    sim.run_simulation(False, False)
-    sim_1.run_simulation(False, False)
+    sim.run_simulation(False, False, None)
+    sim_1.run_simulation(False, False, None)
 
 
     all_errors_1 = sim.print_error_info()
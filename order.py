@@ -1,5 +1,7 @@
 import copy
 class Order:
+    __slots__ = ("_items", "_prio", "_id", "_orig_items")
+
     def __init__(self, items: list, prio: int, idnum: int, original_items= None):
         self._items = items
         self._prio = prio
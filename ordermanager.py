@@ -1,9 +1,13 @@
+import bisect
 import order
 import random
 import time
 
 class OrderManager:
-    def __init__(self, num_init_orders: int, num_dynamic_orders: int, item_set: dict, dynamic_deadline:int):
+    def __init__(self, num_init_orders: int, num_dynamic_orders: int, item_set: dict, dynamic_deadline:int,
+                 rng: random.Random):
+        # Orders and the steps dynamic orders come in on are drawn from rng
+        self._rng = rng
         self._num_init_orders = num_init_orders
         self._num_dynamic_orders = num_dynamic_orders
         self._item_set = item_set
@@ -23,7 +27,35 @@ class OrderManager:
 
         self._dynamic_orders_intro_steps = {}
         self.generate_dynamic_order_introduction_times_uniform(self._dynamic_deadline)
-
+        # The intro steps in order, for next_dynamic_order_step
+        self._sorted_intro_steps = sorted(self._dynamic_orders_intro_steps.keys())
+
+
+    def get_state(self, encode_order):
+        # The orders and their times, copied, with each order given by encode_order(order), see
+        # warehouse.Warehouse.get_state
+        return {"init_orders": [encode_order(ordr) for ordr in self._init_orders],
+                "dynamic_orders": [encode_order(ordr) for ordr in self._dynamic_orders],
+                "order_intro_times": dict(self._order_intro_times),
+                "order_work_start_times": dict(self._order_work_start_times),
+                "order_completion_times": dict(self._order_completion_times),
+                "all_orders": {order_id: encode_order(ordr) for order_id, ordr in self._all_orders.items()},
+                "dynamic_orders_intro_steps": {step: encode_order(ordr)
+                                               for step, ordr in self._dynamic_orders_intro_steps.items()}}
+
+    def set_state(self, state, decode_order, rng: random.Random):
+        # Takes over the data of state, from get_state, with decode_order undoing encode_order, and carries on
+        # drawing from rng
+        self._rng = rng
+        self._init_orders = [decode_order(code) for code in state["init_orders"]]
+        self._dynamic_orders = [decode_order(code) for code in state["dynamic_orders"]]
+        self._order_intro_times = state["order_intro_times"]
+        self._order_work_start_times = state["order_work_start_times"]
+        self._order_completion_times = state["order_completion_times"]
+        self._all_orders = {order_id: decode_order(code) for order_id, code in state["all_orders"].items()}
+        self._dynamic_orders_intro_steps = {step: decode_order(code)
+                                            for step, code in state["dynamic_orders_intro_steps"].items()}
+        self._sorted_intro_steps = sorted(self._dynamic_orders_intro_steps.keys())
 
     def get_dynamic_deadline(self):
         return self._dynamic_deadline
@@ -38,9 +70,9 @@ class OrderManager:
         for i in range(num_init_orders):
             current_items = []
             for j in range(order_size):
-                selected_item_index = random.randint(0, len(self._item_set.keys()) - 1)
+                selected_item_index = self._rng.randint(0, len(self._item_set.keys()) - 1)
                 current_items.append(self._item_set["item%s" % selected_item_index])
-            order_prio = random.randint(1, 5)
+            order_prio = self._rng.randint(1, 5)
             current_order = order.Order(current_items, order_prio, order_id_ctr)
             self._all_orders[order_id_ctr] = current_order
             self._init_orders.append(current_order)
@@ -49,9 +81,9 @@ class OrderManager:
         for i2 in range(num_dynamic_orders):
             current_items = []
             for j2 in range(order_size):
-                selected_item_index = random.randint(0, len(self._item_set.keys()) - 1)
+                selected_item_index = self._rng.randint(0, len(self._item_set.keys()) - 1)
                 current_items.append(self._item_set["item%s" % selected_item_index])
-            order_prio = random.randint(1, 5)
+            order_prio = self._rng.randint(1, 5)
             current_order = order.Order(current_items, order_prio, order_id_ctr)
             self._all_orders[order_id_ctr] = current_order
             self._dynamic_orders.append(current_order)
@@ -59,9 +91,9 @@ class OrderManager:
 
     def generate_dynamic_order_introduction_times_uniform(self, deadline):
         for ordr in self._dynamic_orders:
-            selected_step = random.randint(1, deadline - 1)
+            selected_step = self._rng.randint(1, deadline - 1)
             while selected_step in self._dynamic_orders_intro_steps.keys():
-                selected_step = random.randint(1, deadline - 1)
+                selected_step = self._rng.randint(1, deadline - 1)
             self._dynamic_orders_intro_steps[selected_step] = ordr
             self._order_intro_times[ordr.get_id()] = selected_step
 
@@ -69,6 +101,13 @@ class OrderManager:
         if step in self._dynamic_orders_intro_steps.keys():
             return self._dynamic_orders_intro_steps[step]
 
+    def next_dynamic_order_step(self, step):
+        # Returns the first step after step that a dynamic order is introduced on, or None if there are none left
+        index = bisect.bisect_right(self._sorted_intro_steps, step)
+        if index == len(self._sorted_intro_steps):
+            return None
+        return self._sorted_intro_steps[index]
+
     def get_init_orders(self):
         return self._init_orders
 
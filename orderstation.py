@@ -5,6 +5,8 @@ import math
 
 
 class OrderStation(entitywithinventory.InventoryEntity):
+    __slots__ = ("_x", "_y", "_warehouse_ref")
+
     def __init__(self, x_pos: int, y_pos: int, name: str, warehouse):
         self._x = x_pos
         self._y = y_pos
@@ -36,6 +38,11 @@ class OrderStation(entitywithinventory.InventoryEntity):
     def get_position(self):
         return self._x, self._y
 
+    def set_state(self, state, items, warehouse):
+        # As InventoryEntity.set_state, for the station of warehouse
+        super().set_state(state, items)
+        self._warehouse_ref = warehouse
+
     def get_name(self):
         return self._name
 
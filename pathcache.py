@@ -0,0 +1,97 @@
+from collections import OrderedDict
+
+import numpy
+
+import pathfinding
+
+
+class PathCache:
+    # A least recently used cache of planned shortest paths, keyed on (start cell, target cell). Storing a path also
+    # stores every suffix of it, keyed on the cell the suffix starts after, as the rest of a shortest path is a
+    # shortest path from any cell on it. Paths share one record, so the suffixes cost a dict entry each, not a copy.
+    #
+    # Paths are checked against the occupancy when they are looked up, rather than expired whenever a robot moves, so
+    # robots moving elsewhere don't matter. A path is still clear if every cell still ahead on it is free. It is still
+    # a shortest path if no shorter one has opened. When it was planned every shorter route went through a cell a
+    # robot was in, and each such cell's distance from the start, ignoring walls, plus its distance to the target,
+    # ignoring robots, is less than the path's length. Those cells are kept with the path, there are none when
+    # nothing shorter could get round the walls anyway, and the path is only used while they are all still occupied.
+    # So a cached path is as short as the path the planner would find, though it isn't always the same path.
+    def __init__(self, capacity: int, graph: pathfinding.NavigationGraph):
+        self._capacity = capacity
+        self._graph = graph
+        self._width = graph.width
+        # (start cell, target cell) -> (record, index of the first cell of the path in the record)
+        # A record is a tuple of ((x,y) positions of the path, its cells, cells that were blocking a shorter path)
+        self._entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def blocking_cells(self, start: int, target: int, length: int, occupancy, free_value: int):
+        # The occupied cells a path from start to target shorter than length could go through, as a list
+        distances = self._graph.distance_table(target)
+        if distances[start] >= length:
+            return []
+        width = self._width
+        cells = numpy.flatnonzero(numpy.frombuffer(occupancy, dtype=numpy.int32) != free_value)
+        cells = cells[cells != start]
+        start_distances = numpy.abs(cells % width - start % width) + numpy.abs(cells // width - start // width)
+        target_distances = numpy.frombuffer(distances, dtype=numpy.uint16)[cells]
+        return cells[start_distances + target_distances < length].tolist()
+
+    def get(self, start: int, target: int, occupancy, free_value=-1):
+        # Returns the cached positions from start to target, not including start, or None if there are none that are
+        # still clear and still as short as any path
+        key = (start, target)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        record, first = entry
+        positions, cells, blocking_cells = record
+        is_current = (all(occupancy[cell] == free_value for cell in cells[first:]) and
+                      all(occupancy[cell] != free_value for cell in blocking_cells))
+        if not is_current:
+            del self._entries[key]
+            self.expired += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return positions[first:]
+
+    def put(self, start: int, target: int, path: list, occupancy, free_value=-1):
+        # path is the (x,y) positions of a shortest path from start to target, not including start, planned with
+        # occupancy. Empty paths aren't cached, as they depend on the occupancy of the whole floor.
+        if not path or self._capacity <= 0:
+            return
+        width = self._width
+        cells = [y * width + x for x, y in path]
+        record = (list(path), cells, self.blocking_cells(start, target, len(path), occupancy, free_value))
+        entries = self._entries
+        entries[(start, target)] = (record, 0)
+        entries.move_to_end((start, target))
+        for i in range(len(path) - 1):
+            key = (cells[i], target)
+            entries[key] = (record, i + 1)
+            entries.move_to_end(key)
+        while len(entries) > self._capacity:
+            entries.popitem(last=False)
+
+    def get_state(self):
+        # The entries and counts, copied, see warehouse.Warehouse.get_state. Records never change once made, so they
+        # are shared.
+        return {"entries": list(self._entries.items()), "hits": self.hits, "misses": self.misses,
+                "expired": self.expired}
+
+    def set_state(self, state):
+        # Takes over the data of state, from get_state, rather than copying it
+        self._entries = OrderedDict(state["entries"])
+        self.hits = state["hits"]
+        self.misses = state["misses"]
+        self.expired = state["expired"]
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,905 @@
+import functools
+import heapq
+from array import array
+
+import numpy
+
+# Distance table value for cells that can't reach the target
+UNREACHABLE = 65535
+
+# Flow field directions, the next cell is the current cell plus the offset for the direction
+DIRECTION_POS_X = 0
+DIRECTION_NEG_X = 1
+DIRECTION_POS_Y = 2
+DIRECTION_NEG_Y = 3
+# Flow field value for the target itself and cells that can't reach it
+NO_DIRECTION = 255
+
+
+# Grid cell (x,y) is encoded as the integer index y * width + x
+def cell_index(x, y, width):
+    return y * width + x
+
+
+def cell_position(index, width):
+    return index % width, index // width
+
+
+class NavigationGraph:
+    # The static movement graph of a layout, compiled once into compressed sparse row arrays.
+    # The cells that can be moved into from cell i are adjacency[offsets[i]:offsets[i + 1]], which never contains
+    # a wall or an endpoint cell. Endpoint cells (shelves, goals and homes) can only be entered as the target of a
+    # search, from one of the cells in entries[entry_offsets[i]:entry_offsets[i + 1]].
+    # Graphs are shared between warehouses with the same layout, see compile_navigation_graph, so they must not be
+    # changed after they are built.
+    def __init__(self, width: int, height: int, static_layer, wall_flags: int, endpoint_flags: int):
+        self.width = width
+        self.height = height
+        size = width * height
+        self._compile_args = (width, height, bytes(static_layer), wall_flags, endpoint_flags)
+
+        self.is_wall = bytearray(size)
+        self.is_endpoint = bytearray(size)
+        self.offsets = array("l", [0]) * (size + 1)
+        self.adjacency = array("l")
+        self.entry_offsets = array("l", [0]) * (size + 1)
+        self.entries = array("l")
+        self.passable_cells = 0
+        self._distance_tables = {}
+        self._flow_fields = {}
+        self._jump_distances = None
+        self.direction_offsets = (1, -1, width, -width)
+
+        for index in range(size):
+            x, y = cell_position(index, width)
+            # Neighbours in the order +x, -x, +y, -y
+            grid_neighbours = []
+            if x + 1 < width:
+                grid_neighbours.append(index + 1)
+            if x - 1 >= 0:
+                grid_neighbours.append(index - 1)
+            if y + 1 < height:
+                grid_neighbours.append(index + width)
+            if y - 1 >= 0:
+                grid_neighbours.append(index - width)
+
+            is_wall = static_layer[index] & wall_flags != 0
+            if is_wall:
+                self.is_wall[index] = 1
+            if static_layer[index] & endpoint_flags != 0:
+                self.is_endpoint[index] = 1
+            elif not is_wall:
+                self.passable_cells += 1
+
+            for neighbour in grid_neighbours:
+                if static_layer[neighbour] & (wall_flags | endpoint_flags) == 0:
+                    self.adjacency.append(neighbour)
+            self.offsets[index + 1] = len(self.adjacency)
+
+            if not is_wall:
+                for neighbour in grid_neighbours:
+                    if static_layer[neighbour] & wall_flags == 0:
+                        self.entries.append(neighbour)
+            self.entry_offsets[index + 1] = len(self.entries)
+
+    def __reduce__(self):
+        # Copies of a graph, including those made when copying or pickling a warehouse, are the graph compiled for
+        # the same layout, so they share it rather than holding a copy each
+        return compile_navigation_graph, self._compile_args
+
+    def distance_table(self, target: int):
+        # Returns the number of steps from every cell to target, ignoring robots, as an array of unsigned 16 bit
+        # ints. Each table is built by a breadth first search from the target the first time it is asked for.
+        table = self._distance_tables.get(target)
+        if table is None:
+            table = self.build_distance_table(target)
+            self._distance_tables[target] = table
+        return table
+
+    def build_distance_table(self, target: int):
+        entries = self.entries
+        entry_offsets = self.entry_offsets
+        is_endpoint = self.is_endpoint
+
+        table = array("H", [UNREACHABLE]) * (self.width * self.height)
+        table[target] = 0
+        frontier = [target]
+        distance = 0
+        while frontier:
+            distance += 1
+            if distance >= UNREACHABLE:
+                break
+            next_frontier = []
+            for cell in frontier:
+                # A robot can't move through an endpoint, so nothing reaches the target by way of one
+                if is_endpoint[cell] and cell != target:
+                    continue
+                for previous in entries[entry_offsets[cell]:entry_offsets[cell + 1]]:
+                    if table[previous] == UNREACHABLE:
+                        table[previous] = distance
+                        next_frontier.append(previous)
+            frontier = next_frontier
+        return table
+
+    def flow_field(self, target: int):
+        # Returns the direction of the next step towards target from every cell, as a bytearray of DIRECTION_*
+        # values. Following it from any cell gives a shortest path to target when no robots are in the way.
+        field = self._flow_fields.get(target)
+        if field is None:
+            field = self.build_flow_field(target)
+            self._flow_fields[target] = field
+        return field
+
+    def build_flow_field(self, target: int):
+        table = self.distance_table(target)
+        offsets = self.offsets
+        adjacency = self.adjacency
+        direction_offsets = self.direction_offsets
+
+        field = bytearray([NO_DIRECTION]) * (self.width * self.height)
+        for cell in range(self.width * self.height):
+            distance = table[cell]
+            if distance == UNREACHABLE or distance == 0:
+                continue
+            if distance == 1:
+                # Only cells next to the target are one step away from it
+                next_cell = target
+            else:
+                next_cell = None
+                for neighbour in adjacency[offsets[cell]:offsets[cell + 1]]:
+                    if table[neighbour] == distance - 1:
+                        next_cell = neighbour
+                        break
+            field[cell] = direction_offsets.index(next_cell - cell)
+        return field
+
+    def jump_distances(self):
+        # Returns, for each direction in DIRECTION_* order, an array holding for every cell how far along that
+        # direction the first jump point is, looking only at walls and endpoints. A value d >= 0 is a jump point d
+        # cells on, a value -1 - d means a cell that can't be moved through is d cells on first.
+        if self._jump_distances is None:
+            self._jump_distances = self.build_jump_distances()
+        return self._jump_distances
+
+    def build_jump_distances(self):
+        width = self.width
+        height = self.height
+        size = width * height
+        is_open = bytearray(size)
+        for index in range(size):
+            if not self.is_wall[index] and not self.is_endpoint[index]:
+                is_open[index] = 1
+
+        def open_cell(x, y):
+            return 0 <= x < width and 0 <= y < height and is_open[y * width + x]
+
+        tables = [array("l", [-1]) * size for i in range(4)]
+        # Along x, a cell is a jump point if a cell next to it along y is open but the one before that wasn't
+        for y in range(height):
+            for direction, dx, xs in [(DIRECTION_POS_X, 1, range(width - 1, -1, -1)),
+                                      (DIRECTION_NEG_X, -1, range(width))]:
+                table = tables[direction]
+                next_value = -1
+                for x in xs:
+                    index = y * width + x
+                    if not is_open[index]:
+                        next_value = -1
+                    elif ((open_cell(x, y - 1) and not open_cell(x - dx, y - 1)) or
+                          (open_cell(x, y + 1) and not open_cell(x - dx, y + 1))):
+                        next_value = 0
+                    elif next_value >= 0:
+                        next_value += 1
+                    else:
+                        next_value -= 1
+                    table[index] = next_value
+        # Along y, a cell is also a jump point if a scan along x from it finds one
+        for x in range(width):
+            for direction, dy, ys in [(DIRECTION_POS_Y, 1, range(height - 1, -1, -1)),
+                                      (DIRECTION_NEG_Y, -1, range(height))]:
+                table = tables[direction]
+                next_value = -1
+                for y in ys:
+                    index = y * width + x
+                    if not is_open[index]:
+                        next_value = -1
+                    elif ((open_cell(x - 1, y) and not open_cell(x - 1, y - dy)) or
+                          (open_cell(x + 1, y) and not open_cell(x + 1, y - dy)) or
+                          (x + 1 < width and tables[DIRECTION_POS_X][index + 1] >= 0) or
+                          (x - 1 >= 0 and tables[DIRECTION_NEG_X][index - 1] >= 0)):
+                        next_value = 0
+                    elif next_value >= 0:
+                        next_value += 1
+                    else:
+                        next_value -= 1
+                    table[index] = next_value
+        return tables
+
+
+@functools.lru_cache(maxsize=32)
+def compile_navigation_graph(width: int, height: int, static_layer: bytes, wall_flags: int, endpoint_flags: int):
+    # Warehouses built from the same layout get the same graph, along with any distance tables already built for it
+    return NavigationGraph(width, height, static_layer, wall_flags, endpoint_flags)
+
+
+class GridPathfinder:
+    # A* over a NavigationGraph, with its working arrays allocated once and reused by every search.
+    # The heuristic is the graph's distance table for the target, which is exact when no robots are in the way.
+    # Instead of clearing the arrays between searches, each search has an id, and a cell's g score is only valid
+    # when its stamp matches the id of the current search.
+    # Whether find_path can be given cells to plan through as if they were free, see
+    # warehouse.Warehouse.move_waiting_robots_out_of_way
+    PLANS_THROUGH_CELLS = False
+
+    def __init__(self, graph: NavigationGraph):
+        self._graph = graph
+        self._width = graph.width
+        self.allocate_working_arrays()
+        self._search_id = 0
+
+        self.searches = 0
+        self.expansions = 0
+
+    # The working arrays hold nothing between searches, so copies of a pathfinder start with fresh ones
+    WORKING_ARRAYS = ("_g_scores", "_came_from", "_seen_stamp", "_closed_stamp", "_entry_stamp")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.WORKING_ARRAYS:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.allocate_working_arrays()
+
+    def allocate_working_arrays(self):
+        size = self._graph.width * self._graph.height
+        self._g_scores = array("l", [0]) * size
+        self._came_from = array("l", [-1]) * size
+        self._seen_stamp = array("L", [0]) * size
+        self._closed_stamp = array("L", [0]) * size
+        self._entry_stamp = array("L", [0]) * size
+
+    def get_state(self):
+        # The counts, see warehouse.Warehouse.get_state
+        return {"search_id": self._search_id, "searches": self.searches, "expansions": self.expansions}
+
+    def set_state(self, state):
+        # Working arrays are allocated again, so a copy.copy of a pathfinder doesn't share them
+        self._search_id = state["search_id"]
+        self.searches = state["searches"]
+        self.expansions = state["expansions"]
+        self.allocate_working_arrays()
+
+    def find_path(self, start: int, target: int, occupancy, free_value=-1):
+        # Returns the cells (as (x,y) tuples) on a shortest path from start to target, not including start.
+        # A cell can only be entered if its occupancy value is free_value. An empty list is returned if there is
+        # no path.
+        self._search_id += 1
+        search_id = self._search_id
+        self.searches += 1
+        if start == target:
+            return []
+
+        graph = self._graph
+        width = self._width
+        offsets = graph.offsets
+        adjacency = graph.adjacency
+        g_scores = self._g_scores
+        came_from = self._came_from
+        seen_stamp = self._seen_stamp
+        closed_stamp = self._closed_stamp
+        entry_stamp = self._entry_stamp
+        heuristic = graph.distance_table(target)
+
+        # An endpoint target is not in the adjacency arrays, mark the cells it can be entered from instead
+        target_is_endpoint = graph.is_endpoint[target]
+        if target_is_endpoint:
+            for entry in graph.entries[graph.entry_offsets[target]:graph.entry_offsets[target + 1]]:
+                entry_stamp[entry] = search_id
+
+        start_h = heuristic[start]
+        if start_h == UNREACHABLE:
+            return []
+        g_scores[start] = 0
+        came_from[start] = -1
+        seen_stamp[start] = search_id
+
+        # Entries are (f score, h score, cell). Ties on f are broken towards the cell closest to the target, then
+        # by cell index. Entries are never removed when a cell's score improves, stale ones are skipped on pop.
+        frontier = [(start_h, start_h, start)]
+        expansions = 0
+        while frontier:
+            f_score, h_score, current = heapq.heappop(frontier)
+            if closed_stamp[current] == search_id:
+                continue
+            if current == target:
+                self.expansions += expansions
+                return self.reconstruct_path(start, target)
+            closed_stamp[current] = search_id
+            expansions += 1
+
+            possible_g_score = g_scores[current] + 1
+            neighbours = adjacency[offsets[current]:offsets[current + 1]]
+            if target_is_endpoint and entry_stamp[current] == search_id:
+                neighbours.append(target)
+            for neighbour in neighbours:
+                if occupancy[neighbour] != free_value:
+                    continue
+                neighbour_h = heuristic[neighbour]
+                if neighbour_h == UNREACHABLE:
+                    continue
+                if closed_stamp[neighbour] == search_id:
+                    continue
+                if seen_stamp[neighbour] == search_id and not possible_g_score < g_scores[neighbour]:
+                    continue
+                seen_stamp[neighbour] = search_id
+                g_scores[neighbour] = possible_g_score
+                came_from[neighbour] = current
+                heapq.heappush(frontier, (possible_g_score + neighbour_h, neighbour_h, neighbour))
+
+        self.expansions += expansions
+        return []
+
+    def find_windowed_path(self, start: int, target: int, start_time: int, window: int, is_blocked):
+        # Space-time A* for cooperative planning, over (cell, steps taken) states up to window steps ahead, where a
+        # robot can also wait in place. is_blocked(from_cell, to_cell, time) says whether a robot can move (or wait,
+        # if the cells are the same) into to_cell on step time. States at the edge of the window are scored by the
+        # distance table, so the result is the start of the best path given the reservations.
+        # Returns the cells (as (x,y) tuples) the robot should be in at the end of steps start_time,
+        # start_time + 1, ..., ending at target if it can be reached within the window.
+        self.searches += 1
+        graph = self._graph
+        width = self._width
+        offsets = graph.offsets
+        adjacency = graph.adjacency
+        heuristic = graph.distance_table(target)
+
+        start_h = heuristic[start]
+        if start_h == UNREACHABLE:
+            return []
+        target_entries = ()
+        if graph.is_endpoint[target]:
+            target_entries = graph.entries[graph.entry_offsets[target]:graph.entry_offsets[target + 1]]
+
+        start_state = (start, 0)
+        g_scores = {start_state: 0}
+        came_from = {}
+        closed = set()
+        frontier = [(start_h, start_h, start, 0)]
+        expansions = 0
+        while frontier:
+            f_score, h_score, current, depth = heapq.heappop(frontier)
+            state = (current, depth)
+            if state in closed:
+                continue
+            if current == target or depth == window:
+                self.expansions += expansions
+                path = []
+                while state != start_state:
+                    path.append(cell_position(state[0], width))
+                    state = came_from[state]
+                path.reverse()
+                return path
+            closed.add(state)
+            expansions += 1
+
+            time = start_time + depth
+            possible_g_score = g_scores[state] + 1
+            neighbours = adjacency[offsets[current]:offsets[current + 1]]
+            if current in target_entries:
+                neighbours.append(target)
+            neighbours.append(current)
+            for neighbour in neighbours:
+                neighbour_h = heuristic[neighbour]
+                if neighbour_h == UNREACHABLE:
+                    continue
+                neighbour_state = (neighbour, depth + 1)
+                if neighbour_state in closed:
+                    continue
+                if neighbour_state in g_scores and not possible_g_score < g_scores[neighbour_state]:
+                    continue
+                if is_blocked(current, neighbour, time):
+                    continue
+                g_scores[neighbour_state] = possible_g_score
+                came_from[neighbour_state] = state
+                heapq.heappush(frontier, (possible_g_score + neighbour_h, neighbour_h, neighbour, depth + 1))
+
+        self.expansions += expansions
+        return []
+
+    def reconstruct_path(self, start: int, target: int):
+        width = self._width
+        came_from = self._came_from
+        path = []
+        current = target
+        while current != start:
+            path.append((current % width, current // width))
+            current = came_from[current]
+        path.reverse()
+        return path
+
+
+# Cost used by the incremental pathfinder for cells that can't reach the target
+INFINITE_COST = 1 << 30
+
+
+class IncrementalPathfinder:
+    # D* Lite over a NavigationGraph, for one robot. The search runs backwards from the target, so when the robot
+    # moves or cells become blocked or free, only the part of the search those changes affect is redone.
+    # A new target throws the search state away and starts again. Each call is told which cells may have become
+    # blocked or free since the last one, so a repair costs time for the changes, not for every blocked cell.
+    PLANS_THROUGH_CELLS = False
+
+    def __init__(self, graph: NavigationGraph):
+        self._graph = graph
+        self._width = graph.width
+        self._target = None
+        self._target_entries = frozenset()
+        self._last_start = None
+        self._key_modifier = 0
+        self._blocked = set()
+        # Cells that may have changed since the search was last repaired
+        self._pending_cells = set()
+        self._g_scores = {}
+        self._rhs_scores = {}
+        self._frontier = []
+        self._queued = {}
+
+        self.searches = 0
+        self.repairs = 0
+        self.expansions = 0
+        # Not counted, as that would take a full search as well: the expansions of the last full search, less the
+        # ones a repair used itself. The floor changes between the two, so it can be off either way.
+        self.estimated_saved_expansions = 0
+        self._last_full_expansions = 0
+
+    def find_path(self, start: int, target: int, occupancy, changed_cells=None, free_value=-1):
+        # Returns the cells (as (x,y) tuples) on a shortest path from start to target, not including start. Cells
+        # other than start whose occupancy value isn't free_value can't be entered. changed_cells lists the cells
+        # whose occupancy may have changed since the last call, or is None if that isn't known, in which case every
+        # cell is checked. An empty list is returned if there is no path.
+        self.searches += 1
+        if changed_cells is None:
+            self._pending_cells = None
+        else:
+            self.add_pending_cells(changed_cells)
+        if start == target:
+            return []
+        previous_expansions = self.expansions
+        if target != self._target:
+            self.reset(start, target, self.blocked_cells(start, occupancy, free_value))
+            self.compute_shortest_path(start)
+            self._last_full_expansions = self.expansions - previous_expansions
+        else:
+            self.repairs += 1
+            if start != self._last_start:
+                # The robot's own cell is never blocked, so where it was and where it is now may both have changed
+                self.add_pending_cells((self._last_start, start))
+                self._key_modifier += self.heuristic(self._last_start, start)
+                self._last_start = start
+            self.update_blocked_cells(start, occupancy, free_value)
+            self.compute_shortest_path(start)
+            self.estimated_saved_expansions += max(0, self._last_full_expansions -
+                                                   (self.expansions - previous_expansions))
+        return self.extract_path(start)
+
+    def get_state(self):
+        # The search, copied, see warehouse.Warehouse.get_state
+        return {"target": self._target, "target_entries": self._target_entries, "last_start": self._last_start,
+                "key_modifier": self._key_modifier, "blocked": set(self._blocked),
+                "pending_cells": None if self._pending_cells is None else set(self._pending_cells),
+                "g_scores": dict(self._g_scores), "rhs_scores": dict(self._rhs_scores),
+                "frontier": list(self._frontier), "queued": dict(self._queued), "searches": self.searches,
+                "repairs": self.repairs, "expansions": self.expansions,
+                "estimated_saved_expansions": self.estimated_saved_expansions,
+                "last_full_expansions": self._last_full_expansions}
+
+    def set_state(self, state):
+        # Takes over the data of state, from get_state, rather than copying it
+        self._target = state["target"]
+        self._target_entries = state["target_entries"]
+        self._last_start = state["last_start"]
+        self._key_modifier = state["key_modifier"]
+        self._blocked = state["blocked"]
+        self._pending_cells = state["pending_cells"]
+        self._g_scores = state["g_scores"]
+        self._rhs_scores = state["rhs_scores"]
+        self._frontier = state["frontier"]
+        self._queued = state["queued"]
+        self.searches = state["searches"]
+        self.repairs = state["repairs"]
+        self.expansions = state["expansions"]
+        self.estimated_saved_expansions = state["estimated_saved_expansions"]
+        self._last_full_expansions = state["last_full_expansions"]
+
+    def blocked_cells(self, start: int, occupancy, free_value: int):
+        blocked_cells = set(numpy.flatnonzero(numpy.frombuffer(occupancy, dtype=occupancy.typecode) !=
+                                              free_value).tolist())
+        blocked_cells.discard(start)
+        return blocked_cells
+
+    def add_pending_cells(self, cells):
+        if self._pending_cells is not None:
+            self._pending_cells.update(cells)
+
+    def reset(self, start: int, target: int, blocked_cells):
+        graph = self._graph
+        self._target = target
+        self._target_entries = frozenset()
+        if graph.is_endpoint[target]:
+            self._target_entries = frozenset(graph.entries[graph.entry_offsets[target]:graph.entry_offsets[target + 1]])
+        self._last_start = start
+        self._key_modifier = 0
+        self._blocked = set(blocked_cells)
+        self._pending_cells = set()
+        self._g_scores = {}
+        self._rhs_scores = {target: 0}
+        self._frontier = []
+        self._queued = {}
+        self.queue_cell(target, start)
+
+    def heuristic(self, a: int, b: int):
+        width = self._width
+        return abs(a % width - b % width) + abs(a // width - b // width)
+
+    def calculate_key(self, cell: int, start: int):
+        score = min(self._g_scores.get(cell, INFINITE_COST), self._rhs_scores.get(cell, INFINITE_COST))
+        return score + self.heuristic(start, cell) + self._key_modifier, score
+
+    def queue_cell(self, cell: int, start: int):
+        key = self.calculate_key(cell, start)
+        self._queued[cell] = key
+        heapq.heappush(self._frontier, (key[0], key[1], cell))
+
+    def successors(self, cell: int):
+        graph = self._graph
+        neighbours = graph.adjacency[graph.offsets[cell]:graph.offsets[cell + 1]]
+        if cell in self._target_entries:
+            neighbours.append(self._target)
+        return neighbours
+
+    def predecessors(self, cell: int):
+        # Endpoints other than the target can't be moved through, so nothing reaches the target by way of one
+        graph = self._graph
+        if graph.is_endpoint[cell] and cell != self._target:
+            return ()
+        return graph.entries[graph.entry_offsets[cell]:graph.entry_offsets[cell + 1]]
+
+    def step_cost(self, to_cell: int):
+        if to_cell in self._blocked:
+            return INFINITE_COST
+        return 1
+
+    def update_cell(self, cell: int, start: int):
+        g_scores = self._g_scores
+        if cell != self._target:
+            best = INFINITE_COST
+            for successor in self.successors(cell):
+                score = self.step_cost(successor) + g_scores.get(successor, INFINITE_COST)
+                if score < best:
+                    best = score
+            self._rhs_scores[cell] = best
+        if g_scores.get(cell, INFINITE_COST) != self._rhs_scores.get(cell, INFINITE_COST):
+            self.queue_cell(cell, start)
+        else:
+            self._queued.pop(cell, None)
+
+    def update_blocked_cells(self, start: int, occupancy, free_value: int):
+        # Moving into a cell that became blocked or free changes the cost of every move into it
+        blocked = self._blocked
+        if self._pending_cells is None:
+            blocked_cells = self.blocked_cells(start, occupancy, free_value)
+            changed_cells = blocked_cells.symmetric_difference(blocked)
+            self._blocked = blocked_cells
+        else:
+            changed_cells = []
+            for cell in self._pending_cells:
+                is_blocked = cell != start and occupancy[cell] != free_value
+                if is_blocked and cell not in blocked:
+                    blocked.add(cell)
+                    changed_cells.append(cell)
+                elif not is_blocked and cell in blocked:
+                    blocked.remove(cell)
+                    changed_cells.append(cell)
+        self._pending_cells = set()
+        for cell in changed_cells:
+            for predecessor in self.predecessors(cell):
+                self.update_cell(predecessor, start)
+
+    def compute_shortest_path(self, start: int):
+        g_scores = self._g_scores
+        rhs_scores = self._rhs_scores
+        frontier = self._frontier
+        queued = self._queued
+        expansions = 0
+        while frontier:
+            key_0, key_1, cell = frontier[0]
+            # Entries are never removed when a cell's key changes, stale ones are skipped
+            if queued.get(cell) != (key_0, key_1):
+                heapq.heappop(frontier)
+                continue
+            start_g = g_scores.get(start, INFINITE_COST)
+            start_rhs = rhs_scores.get(start, INFINITE_COST)
+            if (key_0, key_1) >= self.calculate_key(start, start) and start_g == start_rhs:
+                break
+            heapq.heappop(frontier)
+            del queued[cell]
+            new_key = self.calculate_key(cell, start)
+            if (key_0, key_1) < new_key:
+                self.queue_cell(cell, start)
+                continue
+            expansions += 1
+            cell_g = g_scores.get(cell, INFINITE_COST)
+            cell_rhs = rhs_scores.get(cell, INFINITE_COST)
+            if cell_g > cell_rhs:
+                g_scores[cell] = cell_rhs
+            else:
+                g_scores[cell] = INFINITE_COST
+                self.update_cell(cell, start)
+            for predecessor in self.predecessors(cell):
+                self.update_cell(predecessor, start)
+        self.expansions += expansions
+
+    def extract_path(self, start: int):
+        g_scores = self._g_scores
+        width = self._width
+        path = []
+        current = start
+        if self._rhs_scores.get(start, INFINITE_COST) >= INFINITE_COST:
+            return []
+        # A shortest path can't be longer than the number of cells, stop if something has gone wrong
+        for i in range(self._graph.width * self._graph.height):
+            if current == self._target:
+                return path
+            best_cell = None
+            best = INFINITE_COST
+            for successor in self.successors(current):
+                score = self.step_cost(successor) + g_scores.get(successor, INFINITE_COST)
+                if score < best:
+                    best = score
+                    best_cell = successor
+            if best_cell is None:
+                return []
+            current = best_cell
+            path.append((current % width, current // width))
+        return []
+
+
+class JumpPointPathfinder:
+    # Jump point search for 4-connected grids. Straight runs of open cells are skipped over instead of putting every
+    # cell on the heap, and only cells where a shortest path may turn (jump points) are expanded. Scans along y also
+    # stop where a scan along x would find a jump point, so turns that are only needed further on are still found.
+    # The jump points from walls and endpoints come from the graph's jump distance tables. Robots, and the target,
+    # add jump points and block scans, and are checked against those tables on every scan. Treating more cells as
+    # jump points than strictly needed is safe, so any row next to a robot, or holding the target or a cell it is
+    # entered from, is a jump point for scans along y.
+    # find_path takes ignored_cells
+    PLANS_THROUGH_CELLS = True
+
+    def __init__(self, graph: NavigationGraph):
+        self._graph = graph
+        self._width = graph.width
+        self._height = graph.height
+        self._jump_distances = graph.jump_distances()
+        self.allocate_working_arrays()
+        self._search_id = 0
+        # Set for each search
+        self._target = -1
+        self._robots_by_row = {}
+        self._robots_by_column = {}
+        self._entries_by_row = {}
+        self._event_rows = ()
+
+        self.searches = 0
+        self.expansions = 0
+
+    # As for GridPathfinder, copies start with fresh working arrays. The jump distances are the graph's own, so they
+    # are taken from the copy's graph.
+    WORKING_ARRAYS = ("_g_scores", "_came_from", "_seen_stamp", "_closed_stamp")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.WORKING_ARRAYS:
+            del state[name]
+        del state["_jump_distances"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._jump_distances = self._graph.jump_distances()
+        self.allocate_working_arrays()
+
+    def allocate_working_arrays(self):
+        size = self._graph.width * self._graph.height
+        self._g_scores = array("l", [0]) * size
+        self._came_from = array("l", [-1]) * size
+        self._seen_stamp = array("L", [0]) * size
+        self._closed_stamp = array("L", [0]) * size
+
+    def get_state(self):
+        # The counts, see warehouse.Warehouse.get_state. What prepare_search sets is only used within a search.
+        return {"search_id": self._search_id, "searches": self.searches, "expansions": self.expansions}
+
+    def set_state(self, state):
+        # As GridPathfinder.set_state
+        self._search_id = state["search_id"]
+        self.searches = state["searches"]
+        self.expansions = state["expansions"]
+        self.allocate_working_arrays()
+
+    def scan_result(self, value: int, stops, jumps, target_distance: int):
+        # Works out the result of a scan from the static table value, the distances of robots blocking it, the
+        # distances of other jump points, and the distance of the target (or -1). Returns the distance of the jump
+        # point the scan finds, or -1.
+        if value >= 0:
+            stop = UNREACHABLE
+            best = value
+        else:
+            stop = -1 - value
+            best = UNREACHABLE
+        for distance in stops:
+            if 0 <= distance < stop:
+                stop = distance
+        for distance in jumps:
+            if 0 <= distance < best:
+                best = distance
+        if target_distance >= 0 and target_distance <= stop and target_distance <= best:
+            return target_distance
+        if best < stop:
+            return best
+        return -1
+
+    def jump_x(self, x: int, y: int, dx: int):
+        # Scans along x from (x,y), which is checked too, and returns the first jump point found, or -1
+        width = self._width
+        if x < 0 or x >= width:
+            return -1
+        direction = DIRECTION_POS_X if dx > 0 else DIRECTION_NEG_X
+        value = self._jump_distances[direction][y * width + x]
+        robots_by_row = self._robots_by_row
+        stops = [(robot_x - x) * dx for robot_x in robots_by_row.get(y, ())]
+        # A robot next to the row makes the cell after it a jump point
+        jumps = [(robot_x + dx - x) * dx for robot_x in robots_by_row.get(y - 1, ())]
+        jumps += [(robot_x + dx - x) * dx for robot_x in robots_by_row.get(y + 1, ())]
+        jumps += [(entry_x - x) * dx for entry_x in self._entries_by_row.get(y, ())]
+        target_distance = -1
+        if self._target // width == y:
+            target_distance = (self._target % width - x) * dx
+        distance = self.scan_result(value, stops, jumps, target_distance)
+        if distance < 0:
+            return -1
+        return y * width + x + distance * dx
+
+    def jump_y(self, x: int, y: int, dy: int):
+        # Scans along y from (x,y), which is checked too, and returns the first jump point found, or -1
+        width = self._width
+        if y < 0 or y >= self._height:
+            return -1
+        direction = DIRECTION_POS_Y if dy > 0 else DIRECTION_NEG_Y
+        value = self._jump_distances[direction][y * width + x]
+        stops = [(robot_y - y) * dy for robot_y in self._robots_by_column.get(x, ())]
+        jumps = [(row - y) * dy for row in self._event_rows]
+        target_distance = -1
+        if self._target % width == x:
+            target_distance = (self._target // width - y) * dy
+        distance = self.scan_result(value, stops, jumps, target_distance)
+        if distance < 0:
+            return -1
+        return (y + distance * dy) * width + x
+
+    def prepare_search(self, target: int, occupied_cells):
+        graph = self._graph
+        width = self._width
+        self._target = target
+        robots_by_row = {}
+        robots_by_column = {}
+        event_rows = {target // width}
+        for cell in occupied_cells:
+            robot_x, robot_y = cell % width, cell // width
+            robots_by_row.setdefault(robot_y, []).append(robot_x)
+            robots_by_column.setdefault(robot_x, []).append(robot_y)
+            event_rows.add(robot_y - 1)
+            event_rows.add(robot_y + 1)
+        entries_by_row = {}
+        if graph.is_endpoint[target]:
+            for entry in graph.entries[graph.entry_offsets[target]:graph.entry_offsets[target + 1]]:
+                entries_by_row.setdefault(entry // width, []).append(entry % width)
+                event_rows.add(entry // width)
+        self._robots_by_row = robots_by_row
+        self._robots_by_column = robots_by_column
+        self._entries_by_row = entries_by_row
+        self._event_rows = event_rows
+
+    def find_path(self, start: int, target: int, occupancy, occupied_cells, free_value=-1, ignored_cells=()):
+        # Returns the cells (as (x,y) tuples) on a shortest path from start to target, not including start.
+        # occupied_cells lists every cell whose occupancy value isn't free_value, which can't be entered. The path
+        # can go through ignored_cells, a set, as if they were free. An empty list is returned if there is no path.
+        self._search_id += 1
+        search_id = self._search_id
+        self.searches += 1
+        if start == target or (occupancy[target] != free_value and target not in ignored_cells):
+            return []
+        if ignored_cells:
+            occupied_cells = [cell for cell in occupied_cells if cell not in ignored_cells]
+
+        graph = self._graph
+        width = self._width
+        g_scores = self._g_scores
+        came_from = self._came_from
+        seen_stamp = self._seen_stamp
+        closed_stamp = self._closed_stamp
+        heuristic = graph.distance_table(target)
+        self.prepare_search(target, occupied_cells)
+        target_entries = ()
+        if graph.is_endpoint[target]:
+            target_entries = graph.entries[graph.entry_offsets[target]:graph.entry_offsets[target + 1]]
+
+        start_h = heuristic[start]
+        if start_h == UNREACHABLE:
+            return []
+        g_scores[start] = 0
+        came_from[start] = -1
+        seen_stamp[start] = search_id
+
+        frontier = [(start_h, start_h, start)]
+        expansions = 0
+        while frontier:
+            f_score, h_score, current = heapq.heappop(frontier)
+            if closed_stamp[current] == search_id:
+                continue
+            if current == target:
+                self.expansions += expansions
+                return self.reconstruct_path(start, target)
+            closed_stamp[current] = search_id
+            expansions += 1
+
+            x, y = current % width, current // width
+            parent = came_from[current]
+            if parent == -1:
+                successors = [self.jump_x(x + 1, y, 1), self.jump_x(x - 1, y, -1),
+                              self.jump_y(x, y + 1, 1), self.jump_y(x, y - 1, -1)]
+            elif parent // width == y:
+                dx = 1 if x > parent % width else -1
+                successors = [self.jump_x(x + dx, y, dx), self.jump_y(x, y + 1, 1), self.jump_y(x, y - 1, -1)]
+            else:
+                dy = 1 if y > parent // width else -1
+                successors = [self.jump_y(x, y + dy, dy), self.jump_x(x + 1, y, 1), self.jump_x(x - 1, y, -1)]
+            if current in target_entries:
+                successors.append(target)
+
+            for successor in successors:
+                if successor == -1:
+                    continue
+                successor_h = heuristic[successor]
+                if successor_h == UNREACHABLE or closed_stamp[successor] == search_id:
+                    continue
+                possible_g_score = g_scores[current] + abs(successor % width - x) + abs(successor // width - y)
+                if seen_stamp[successor] == search_id and not possible_g_score < g_scores[successor]:
+                    continue
+                seen_stamp[successor] = search_id
+                g_scores[successor] = possible_g_score
+                came_from[successor] = current
+                heapq.heappush(frontier, (possible_g_score + successor_h, successor_h, successor))
+
+        self.expansions += expansions
+        return []
+
+    def reconstruct_path(self, start: int, target: int):
+        # Fills in the straight runs between jump points
+        width = self._width
+        came_from = self._came_from
+        path = []
+        current = target
+        while current != start:
+            previous = came_from[current]
+            step = 1 if current // width == previous // width else width
+            if current < previous:
+                step = -step
+            cell = current
+            while cell != previous:
+                path.append((cell % width, cell // width))
+                cell -= step
+            current = previous
+        path.reverse()
+        return path
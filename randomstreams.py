@@ -0,0 +1,55 @@
+import random
+
+import numpy
+
+
+class RandomStreams:
+    # The random numbers of one simulation, as a stream for each part of it that draws any, all seeded from the one
+    # seed. The parts are handed their own stream rather than sharing random, so a simulation gives the same results
+    # from the same seed whatever else runs in the process, and can be run again from its seed alone. The streams
+    # are seeded from children of a NumPy SeedSequence, so they are independent of each other.
+    def __init__(self, seed: int):
+        # Order generation
+        self.orders = random.Random()
+        # Genetic algorithm populations and the seeds of the genetic algorithm runs
+        self.scheduler = random.Random()
+        # Deadlock breaking
+        self.movement = random.Random()
+        # Fault steps, see faulttimeline.FaultTimeline
+        self.faults = numpy.random.Generator(numpy.random.PCG64())
+        self._seed = None
+        self.reseed(seed)
+
+    def reseed(self, seed: int):
+        # The streams are seeded in place, so whatever was handed one carries on from the new seed
+        self._seed = seed
+        orders, scheduler, movement, faults = numpy.random.SeedSequence(seed).spawn(4)
+        self.orders.seed(python_seed(orders))
+        self.scheduler.seed(python_seed(scheduler))
+        self.movement.seed(python_seed(movement))
+        self.faults.bit_generator.state = numpy.random.PCG64(faults).state
+
+    def get_seed(self):
+        return self._seed
+
+    def get_state(self):
+        return {"seed": self._seed, "orders": self.orders.getstate(), "scheduler": self.scheduler.getstate(),
+                "movement": self.movement.getstate(), "faults": self.faults.bit_generator.state}
+
+    def set_state(self, state):
+        # The streams are made again rather than set in place, so a copy.copy of streams can be given the state of
+        # another without the two sharing a stream
+        self._seed = state["seed"]
+        self.orders = random.Random()
+        self.orders.setstate(state["orders"])
+        self.scheduler = random.Random()
+        self.scheduler.setstate(state["scheduler"])
+        self.movement = random.Random()
+        self.movement.setstate(state["movement"])
+        self.faults = numpy.random.Generator(numpy.random.PCG64())
+        self.faults.bit_generator.state = state["faults"]
+
+
+def python_seed(seed_sequence: numpy.random.SeedSequence):
+    # A 128 bit seed for random.Random from a SeedSequence
+    return int.from_bytes(seed_sequence.generate_state(4).tobytes(), "little")
@@ -0,0 +1,74 @@
+class ReservationTable:
+    # Space-time reservations for cooperative path planning. A robot holds (cell, time) when its plan has it in that
+    # cell at the end of step time. Entries for steps that have passed are dropped by advance.
+    def __init__(self):
+        self._holders = {}
+        self._keys_by_time = {}
+        self._keys_by_robot = {}
+        # Robot name -> (step the plan starts on, number of cells in the plan)
+        self._plans = {}
+        self._oldest_time = 0
+
+    def holder(self, cell: int, time: int):
+        return self._holders.get((cell, time))
+
+    def reserve_path(self, robot_name: str, start_cell: int, path_cells: list, start_time: int):
+        # path_cells are the cells the robot plans to be in at the end of steps start_time, start_time + 1, ...
+        # The start cell is held for the step before, so that swaps can be detected, and the final cell is held for
+        # one step after the plan ends.
+        self.release(robot_name)
+        self._plans[robot_name] = (start_time, len(path_cells))
+        self.reserve(robot_name, start_cell, start_time - 1)
+        for i, cell in enumerate(path_cells):
+            self.reserve(robot_name, cell, start_time + i)
+        if path_cells:
+            self.reserve(robot_name, path_cells[-1], start_time + len(path_cells))
+
+    def reserve(self, robot_name: str, cell: int, time: int):
+        if time < self._oldest_time:
+            return
+        key = (cell, time)
+        self._holders[key] = robot_name
+        self._keys_by_robot.setdefault(robot_name, []).append(key)
+        self._keys_by_time.setdefault(time, []).append(key)
+
+    def release(self, robot_name: str):
+        self._plans.pop(robot_name, None)
+        for key in self._keys_by_robot.pop(robot_name, []):
+            if self._holders.get(key) == robot_name:
+                del self._holders[key]
+
+    def is_on_plan(self, robot_name: str, cells_remaining: int, time: int):
+        # A robot is on its plan if, at step time, it has as many cells of the plan left as it should have
+        if robot_name not in self._plans:
+            return False
+        start_time, plan_length = self._plans[robot_name]
+        return plan_length - (time - start_time) == cells_remaining
+
+    def advance(self, time: int):
+        # Drops every reservation for a step before time
+        while self._oldest_time < time:
+            for key in self._keys_by_time.pop(self._oldest_time, []):
+                self._holders.pop(key, None)
+            self._oldest_time += 1
+        for robot_name, keys in self._keys_by_robot.items():
+            if keys and keys[0][1] < time:
+                self._keys_by_robot[robot_name] = [key for key in keys if key[1] >= time]
+
+    def get_state(self):
+        # The reservations, copied, see warehouse.Warehouse.get_state
+        return {"holders": dict(self._holders),
+                "keys_by_time": {time: list(keys) for time, keys in self._keys_by_time.items()},
+                "keys_by_robot": {robot_name: list(keys) for robot_name, keys in self._keys_by_robot.items()},
+                "plans": dict(self._plans), "oldest_time": self._oldest_time}
+
+    def set_state(self, state):
+        # Takes over the data of state, from get_state, rather than copying it
+        self._holders = state["holders"]
+        self._keys_by_time = state["keys_by_time"]
+        self._keys_by_robot = state["keys_by_robot"]
+        self._plans = state["plans"]
+        self._oldest_time = state["oldest_time"]
+
+    def __len__(self):
+        return len(self._holders)
@@ -0,0 +1,118 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import types
+
+import warehouse
+
+# Results are pickled, so a cache must only be read from a trusted file. Rows are keyed by a hash of the
+# simulation's settings and the code version, so changing either never hands back results of the old ones.
+SCHEMA = """CREATE TABLE IF NOT EXISTS results (
+    config_key TEXT NOT NULL,
+    seed TEXT NOT NULL,
+    code_version TEXT NOT NULL,
+    result BLOB NOT NULL,
+    PRIMARY KEY (config_key, seed))"""
+# Bumped whenever main.run_warehouse changes what a result holds, main isn't part of the code version
+RESULT_FORMAT = 3
+# Seeds looked up per query, SQLite limits how many values a query can have
+SEEDS_PER_QUERY = 500
+
+
+def simulator_modules():
+    # The modules of this directory that warehouse imports, directly or through each other. Those are what decide
+    # a simulation's results, the scripts that run and plot simulations, such as main and benchmarks, aren't.
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    modules = {}
+    to_visit = [warehouse]
+    while to_visit:
+        module = to_visit.pop()
+        module_file = getattr(module, "__file__", None)
+        if module.__name__ in modules or module_file is None or os.path.dirname(module_file) != package_dir:
+            continue
+        modules[module.__name__] = module_file
+        to_visit.extend(value for value in vars(module).values() if isinstance(value, types.ModuleType))
+    return modules
+
+
+@functools.lru_cache(maxsize=None)
+def code_version():
+    # Hex SHA-256 of the simulator's source files and the result format, so any change to the simulator starts
+    # from an empty cache. This is stricter than it has to be, but a stale result is far worse than running a
+    # simulation again.
+    digest = hashlib.sha256(str(RESULT_FORMAT).encode())
+    for module_name, module_file in sorted(simulator_modules().items()):
+        digest.update(module_name.encode())
+        with open(module_file, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def config_key(warehouse_args, warehouse_kwargs):
+    # Hex SHA-256 of the arguments a warehouse is built with, as in main.run_one_simulation, and the code version.
+    # The layout is keyed by its contents, so layouts read from different files with the same text share results.
+    layout, *settings = warehouse_args
+    config = {"layout": layout.get_hash(), "args": settings, "kwargs": sorted(warehouse_kwargs.items()),
+              "code_version": code_version()}
+    return hashlib.sha256(json.dumps(config).encode()).hexdigest()
+
+
+def is_cacheable(result):
+    # Simulations that finish or fault with a SimulationError give the same result from the same seed every time.
+    # Any other error is a bug, so it is run again.
+    return result["error"] is None or result["simulation_error"]
+
+
+class ResultCache:
+    # A store of the results of simulations, as returned by main.run_one_simulation, in an SQLite file, so running
+    # the same simulations again only reads them back. See main.Simulation's result_cache.
+    def __init__(self, filename: str = "results.sqlite"):
+        self._filename = filename
+        self._connection = sqlite3.connect(filename)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(SCHEMA)
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._connection.close()
+
+    def get_results(self, key: str, seeds):
+        # Returns a dict of the stored results for those of seeds there are any for, by seed. Seeds are stored as
+        # text, SQLite integers are too small for 64 bit seeds.
+        seed_texts = [str(seed) for seed in seeds]
+        results = {}
+        for start in range(0, len(seed_texts), SEEDS_PER_QUERY):
+            chunk = seed_texts[start:start + SEEDS_PER_QUERY]
+            query = ("SELECT seed, result FROM results WHERE config_key = ? AND seed IN (%s)" %
+                     ", ".join("?" * len(chunk)))
+            for seed, result in self._connection.execute(query, [key] + chunk):
+                results[int(seed)] = pickle.loads(result)
+        return results
+
+    def put_result(self, key: str, seed: int, result):
+        # Committed straight away, so an interrupted run keeps the results it got to
+        if not is_cacheable(result):
+            return
+        self._connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                                 (key, str(seed), code_version(), pickle.dumps(result, pickle.HIGHEST_PROTOCOL)))
+        self._connection.commit()
+
+    def count_results(self, key: str = None):
+        if key is None:
+            return self._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return self._connection.execute("SELECT COUNT(*) FROM results WHERE config_key = ?", (key,)).fetchone()[0]
+
+    def prune(self):
+        # Deletes the results of other code versions, which can never be read again, and returns how many there were
+        cursor = self._connection.execute("DELETE FROM results WHERE code_version != ?", (code_version(),))
+        self._connection.commit()
+        return cursor.rowcount
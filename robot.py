@@ -1,24 +1,49 @@
-import random
 
 import udptransmit
 import entitywithinventory
-import math
 import shelf
 import orderstation
+import robothome
+import robotfleet
 import customexceptions
 
+
+def fleet_flag(column_name: str):
+    # A bool attribute of a robot that is stored in its fleet
+    def get_flag(self):
+        return getattr(self._fleet, column_name)[self._index] != 0
+
+    def set_flag(self, value):
+        getattr(self._fleet, column_name)[self._index] = 1 if value else 0
+    return property(get_flag, set_flag)
+
+
 class Robot(entitywithinventory.InventoryEntity):
-    def __init__(self, name: str, x: int, y: int, max_inv_size: int, fault_rates: list):
-        self._x = x
-        self._y = y
+    # The state the warehouse checks every step (position, waits, priority, faults, target and next path cell) is
+    # kept in a robotfleet.RobotFleet, so it can be looked at for all robots at once. Robots made without a fleet get
+    # one of their own. The movement path must only be changed through set_movement_path and advance_movement_path,
+    # so the fleet's copy of the next cell stays in step with it.
+    __slots__ = ("_fleet", "_index", "_home_x", "_home_y", "_assigned_order", "_movement_path", "_current_target",
+                 "_battery_critical_fault_rate", "_battery_low_fault_rate", "_actuator_fault_rate",
+                 "_sensor_fault_rate", "_goal_visit_flag", "charge_time", "apply_charge_wait_upon_reaching_home")
+
+    battery_faulted = fleet_flag("battery_faulted")
+    gone_home_to_clear_inv = fleet_flag("gone_home_to_clear_inv")
+    battery_faulted_critical = fleet_flag("battery_faulted_critical")
+    sensors_faulted = fleet_flag("sensors_faulted")
+    actuators_faulted = fleet_flag("actuators_faulted")
+
+    def __init__(self, name: str, x: int, y: int, max_inv_size: int, fault_rates: list,
+                 fleet: robotfleet.RobotFleet = None):
+        if fleet is None:
+            fleet = robotfleet.RobotFleet()
+        self._fleet = fleet
+        self._index = fleet.add(x, y)
         self._home_x = x
         self._home_y = y
-        self.wait_steps = 0
         self._assigned_order = None
         self._movement_path = []
         self._current_target = None
-        self._steps_halted = 0
-        self._prio = None
 
         self._battery_critical_fault_rate = fault_rates[0]
         self._battery_low_fault_rate = fault_rates[1]
@@ -27,18 +52,22 @@ class Robot(entitywithinventory.InventoryEntity):
 
         self._goal_visit_flag = None
 
-        self.battery_faulted = False
-        self.gone_home_to_clear_inv = False
-
         self.charge_time = 50
         self.apply_charge_wait_upon_reaching_home = False
 
-        self.battery_faulted_critical = False
-        self.sensors_faulted = False
-        self.actuators_faulted = False
-
         super().__init__(name, max_inv_size)
 
+    def get_fleet_index(self):
+        return self._index
+
+    @property
+    def wait_steps(self):
+        return self._fleet.get_wait(self._index)
+
+    @wait_steps.setter
+    def wait_steps(self, value):
+        self._fleet.set_wait(self._index, value)
+
     def set_assigned_order(self, id_num):
         self._assigned_order = id_num
 
@@ -54,13 +83,14 @@ class Robot(entitywithinventory.InventoryEntity):
         return self._assigned_order
 
     def get_position(self):
-        return self._x, self._y
+        return self._fleet.x[self._index], self._fleet.y[self._index]
 
     def set_prio(self, prio):
-        self._prio = prio
+        self._fleet.prio[self._index] = robotfleet.NO_PRIO if prio is None else prio
 
     def get_prio(self):
-        return self._prio
+        prio = self._fleet.prio[self._index]
+        return None if prio == robotfleet.NO_PRIO else prio
 
     def add_wait_steps(self, step_amount):
         self.wait_steps = self.wait_steps + step_amount
@@ -68,45 +98,72 @@ class Robot(entitywithinventory.InventoryEntity):
     def get_wait_steps(self):
         return self.wait_steps
 
-    def decrement_wait_steps(self):
-        if self.wait_steps == math.inf:
-            return False
+    def get_wake_step(self):
+        # The step of the turn the robot's wait ends on, or robotfleet.NOT_WAITING
+        return self._fleet.wake_step[self._index]
 
-        self.wait_steps = self.wait_steps - 1
+    def end_wait(self):
+        self.wait_steps = 0
 
         # Reset the states of the faults that involve waiting after the wait is over
-        if self.wait_steps == 0:
-            self.actuators_faulted = False
-            if (self._home_x == self._x) and (self._home_y == self._y) and self.battery_faulted:
-                self.battery_faulted = False
-                return True
+        self.actuators_faulted = False
+        if (self._home_x, self._home_y) == self.get_position() and self.battery_faulted:
+            self.battery_faulted = False
+            return True
+        return False
 
 
     def set_position(self, x, y):
         if self.wait_steps != 0:
             raise customexceptions.SimulationError("Cannot move a robot that is waiting")
-        self._steps_halted = 0
-        self._x = x
-        self._y = y
+        fleet = self._fleet
+        fleet.steps_halted[self._index] = 0
+        fleet.x[self._index] = x
+        fleet.y[self._index] = y
 
     def increment_steps_halted(self):
-        self._steps_halted = self._steps_halted + 1
-        if self._steps_halted > 10:
-            self._steps_halted = 0
+        steps_halted = self._fleet.steps_halted[self._index] + 1
+        if steps_halted > 10:
+            steps_halted = 0
+        self._fleet.steps_halted[self._index] = steps_halted
 
     def get_steps_halted(self):
-        return self._steps_halted
+        return self._fleet.steps_halted[self._index]
 
     def set_movement_path(self, path):
         self._movement_path = path
+        self.update_next_path_cell()
+
+    def advance_movement_path(self, steps=1):
+        # Drops the first cells of the movement path, once the robot has moved through them
+        del self._movement_path[:steps]
+        self.update_next_path_cell()
+
+    def update_next_path_cell(self):
+        fleet = self._fleet
+        if self._movement_path:
+            fleet.next_x[self._index], fleet.next_y[self._index] = self._movement_path[0]
+        else:
+            fleet.next_x[self._index] = robotfleet.NO_POSITION
+            fleet.next_y[self._index] = robotfleet.NO_POSITION
 
     def get_movement_path(self):
         return self._movement_path
 
     def set_target(self, target):
+        self.update_target(target)
+        if target is None:
+            self.set_prio(None)
+
+    def update_target(self, target):
         self._current_target = target
+        fleet = self._fleet
         if target is None:
-            self._prio = None
+            fleet.target_x[self._index] = robotfleet.NO_POSITION
+            fleet.target_y[self._index] = robotfleet.NO_POSITION
+        else:
+            fleet.target_x[self._index], fleet.target_y[self._index] = target.get_position()
+        fleet.target_is_home[self._index] = type(target) is robothome.RobotHome
 
     def get_target(self):
         return self._current_target
@@ -118,25 +175,28 @@ class Robot(entitywithinventory.InventoryEntity):
 
         self._current_target.interact(self)
 
-        self._current_target = None
+        self.update_target(None)
 
     def is_at_target(self):
         if self._current_target is None:
             return False
 
-        target_x, target_y = self._current_target.get_position()
-        if (self._x == target_x) and (self._y == target_y):
-            return True
-        else:
-            return False
+        return self._current_target.get_position() == self.get_position()
 
     def get_name(self):
         return self._name
 
     def transmit_creation(self):
-        udptransmit.transmit_robot_creation(self._name, self._x, self._y)
+        x, y = self.get_position()
+        udptransmit.transmit_robot_creation(self._name, x, y)
+
+    def get_fault_rates(self):
+        return [self._battery_critical_fault_rate, self._battery_low_fault_rate, self._actuator_fault_rate,
+                self._sensor_fault_rate]
 
-    def maybe_introduce_fault(self):
+    def introduce_faults(self, due_faults):
+        # due_faults says which faults are due this step, in the order battery critical, battery low, actuator and
+        # sensor (see faulttimeline.FaultTimeline). Returns which of them happened, in the same order.
         # Battery fault - 2 types:
         # Low battery - robot must return to its home and becomes unavailable for a certain number of steps
         # Battery failure - robot breaks unrecoverable.
@@ -146,25 +206,48 @@ class Robot(entitywithinventory.InventoryEntity):
         f0, f1, f2, f3 = False, False, False, False
         if self.battery_faulted_critical:
             return []
-        if random.random() < self._battery_critical_fault_rate:
+        if due_faults[0]:
             self.battery_faulted_critical = True
             #print("FAULT %s BATTERY CRITICAL" % self._name)
             f0 = True
         else:
-            if random.random() < self._battery_low_fault_rate and not self.battery_faulted:
+            if due_faults[1] and not self.battery_faulted:
                 #print("FAULT %s BATTERY RECHARGE" % self._name)
                 self.battery_faulted = True
                 f1 = True
-            if random.random() < self._actuator_fault_rate and not self.actuators_faulted:
+            if due_faults[2] and not self.actuators_faulted:
                 self.actuators_faulted = True
                 #print("FAULT %s ACTUATOR OVERHEAT" % self._name)
                 f2 = True
-            if random.random() < self._sensor_fault_rate and not self.sensors_faulted:
+            if due_faults[3] and not self.sensors_faulted:
                 self.sensors_faulted = True
                 #print("FAULT %s SENSOR FAILURE" % self._name)
                 f3 = True
         return [f0, f1, f2, f3]
 
 
+    def get_state(self):
+        # What the robot keeps outside its fleet, as plain data with its target by name, see
+        # warehouse.Warehouse.get_state
+        state = super().get_state()
+        target = self._current_target
+        state.update({"assigned_order": self._assigned_order, "movement_path": list(self._movement_path),
+                      "target": None if target is None else target.get_name(), "goal_visit_flag": self._goal_visit_flag,
+                      "charge_time": self.charge_time,
+                      "apply_charge_wait_upon_reaching_home": self.apply_charge_wait_upon_reaching_home})
+        return state
+
+    def set_state(self, state, fleet: robotfleet.RobotFleet, items, targets):
+        # The robot becomes a view of fleet, which already holds its columns. targets is a dict of the names of the
+        # shelves, order stations and homes robots go to -> them.
+        super().set_state(state, items)
+        self._fleet = fleet
+        self._assigned_order = state["assigned_order"]
+        self._movement_path = state["movement_path"]
+        self._current_target = None if state["target"] is None else targets[state["target"]]
+        self._goal_visit_flag = state["goal_visit_flag"]
+        self.charge_time = state["charge_time"]
+        self.apply_charge_wait_upon_reaching_home = state["apply_charge_wait_upon_reaching_home"]
+
     def __repr__(self):
         return self._name
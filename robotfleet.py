@@ -0,0 +1,122 @@
+from array import array
+import math
+import sys
+
+import numpy
+
+import timerwheel
+
+# Stored in place of a priority for robots that don't have one
+NO_PRIO = -(2 ** 63)
+# Stored in place of a coordinate for robots with no target or no next path cell
+NO_POSITION = -1
+# Stored in place of a wake step for robots that aren't waiting
+NOT_WAITING = 0
+# Turn index once every robot has had its turn in the current step
+ALL_TURNS_TAKEN = sys.maxsize
+
+
+class RobotFleet:
+    # Struct of arrays store for the per robot state the warehouse checks every step. Robot objects are views over
+    # one index of it. The columns are arrays, so the robots read and write plain Python numbers, and views lets the
+    # warehouse look at every robot at once with NumPy without copying anything.
+    #
+    # Waits are kept as the step of the turn the wait ends on, with waits that never end as math.inf, so waiting robots
+    # don't need a turn every step to count down. A timer wheel holds the robots by the step their wait ends, and the
+    # warehouse says whose turn it is, to know whether a robot's turn this step is still to come.
+    COLUMNS = {"x": "q", "y": "q", "wake_step": "d", "prio": "q", "steps_halted": "q",
+               "next_x": "q", "next_y": "q", "target_x": "q", "target_y": "q", "target_is_home": "B",
+               "battery_faulted": "B", "battery_faulted_critical": "B", "sensors_faulted": "B",
+               "actuators_faulted": "B", "gone_home_to_clear_inv": "B"}
+
+    def __init__(self):
+        for name, typecode in self.COLUMNS.items():
+            setattr(self, name, array(typecode))
+        self._views = None
+        self._wakes = timerwheel.TimerWheel()
+        # The step robots are taking turns in, and the index of the last robot to have had its turn
+        self.turn_step = 0
+        self.turn_index = ALL_TURNS_TAKEN
+
+    def add(self, x: int, y: int):
+        # Returns the index of a new robot at (x,y), with no target, path, priority or faults
+        # Arrays can't grow while NumPy views share their memory, so the views are dropped and made again later
+        self._views = None
+        index = len(self.x)
+        for name, typecode in self.COLUMNS.items():
+            getattr(self, name).append(0)
+        self.x[index] = x
+        self.y[index] = y
+        self.prio[index] = NO_PRIO
+        for name in ("next_x", "next_y", "target_x", "target_y"):
+            getattr(self, name)[index] = NO_POSITION
+        return index
+
+    def start_turns(self, step: int):
+        # Returns the indexes of the robots whose waits end on step, in order
+        self.turn_step = step
+        self.turn_index = -1
+        return sorted(self._wakes.pop(step))
+
+    def end_turns(self):
+        self.turn_index = ALL_TURNS_TAKEN
+
+    def next_turn_step(self, index: int):
+        return self.turn_step + 1 if index <= self.turn_index else self.turn_step
+
+    def get_wait(self, index: int):
+        # Returns the number of turns the robot still has to wait
+        wake_step = self.wake_step[index]
+        if wake_step == math.inf:
+            return math.inf
+        if wake_step == NOT_WAITING:
+            return 0
+        return int(wake_step) - self.next_turn_step(index) + 1
+
+    def set_wait(self, index: int, wait_steps):
+        self._wakes.cancel(index)
+        if wait_steps <= 0:
+            self.wake_step[index] = NOT_WAITING
+        elif wait_steps == math.inf:
+            self.wake_step[index] = math.inf
+        else:
+            wake_step = self.next_turn_step(index) + int(wait_steps) - 1
+            self.wake_step[index] = wake_step
+            self._wakes.schedule(index, wake_step)
+
+    def next_wake_step(self):
+        # Returns the first step a wait ends on, or math.inf if no wait ends
+        wake_steps = self.views()["wake_step"]
+        ending = wake_steps[(wake_steps != NOT_WAITING) & (wake_steps != math.inf)]
+        return ending.min() if len(ending) else math.inf
+
+    def __getstate__(self):
+        # The views share the memory of the columns they were made from, so copies of the fleet make their own
+        state = self.__dict__.copy()
+        state["_views"] = None
+        return state
+
+    def get_state(self):
+        # The state of the fleet as plain data, copied, see warehouse.Warehouse.get_state
+        return {"columns": {name: getattr(self, name)[:] for name in self.COLUMNS},
+                "wakes": self._wakes.get_state(), "turn_step": self.turn_step, "turn_index": self.turn_index}
+
+    def set_state(self, state):
+        # Takes over the data of state, from get_state, rather than copying it
+        for name in self.COLUMNS:
+            setattr(self, name, state["columns"][name])
+        self._views = None
+        self._wakes = timerwheel.TimerWheel()
+        self._wakes.set_state(state["wakes"])
+        self.turn_step = state["turn_step"]
+        self.turn_index = state["turn_index"]
+
+    def views(self):
+        # Returns a dict of column name -> NumPy array sharing the column's memory
+        if self._views is None:
+            self._views = {name: numpy.frombuffer(getattr(self, name), dtype=typecode)
+                           for name, typecode in self.COLUMNS.items()}
+        return self._views
+
+    def __len__(self):
+        return len(self.x)
@@ -1,4 +1,6 @@
 class RobotHome:
+    __slots__ = ("_x", "_y", "_name", "_robot_name")
+
     def __init__(self, home_name: str, robot_name: str, x: int, y: int):
         self._x = x
         self._y = y
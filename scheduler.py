@@ -13,7 +13,9 @@ import random
 class Scheduler:
     def __init__(self, order_manager, robots: dict, shelves: dict, goals: dict, homes: dict, init_orders: list, schedule_mode:str,
                  robot_inventory_size: int,
-                 fault_tolerant_mode: bool):
+                 fault_tolerant_mode: bool, rng: random.Random):
+        # The genetic algorithm's initial populations and seeds are drawn from rng
+        self._rng = rng
         self._order_manager_ref = order_manager
         self._fault_tolerant_mode = fault_tolerant_mode
         self._robots = robots
@@ -58,6 +60,7 @@ class Scheduler:
         self._all_positions = {}
         self._all_genes = []
         self._all_distances = {}
+        self._static_distances_found = False
 
         self._mr_flag_ctr = 0
 
@@ -78,23 +81,60 @@ class Scheduler:
     def get_ga_attempts(self):
         return self._ga_attempts
 
+    def get_state(self, encode_order):
+        # The schedule and what it has been given to do, copied, with each order given by encode_order(order), see
+        # warehouse.Warehouse.get_state. Robots and locations are held by name already. The distances are left out,
+        # they are worked out again from the positions before they are used.
+        return {"num_robots": self._num_robots,
+                "order_to_amount_robots_assigned": dict(self._order_to_amount_robots_assigned),
+                "ga_attempts": list(self._ga_attempts), "flags": list(self._flags),
+                "orders_backlog": [encode_order(ordr) for ordr in self._orders_backlog],
+                "orders_active": [encode_order(ordr) for ordr in self._orders_active],
+                "order_robots_assignment": {order_id: list(robot_names)
+                                            for order_id, robot_names in self._order_robots_assignment.items()},
+                "order_goal_assignment": dict(self._order_goal_assignment),
+                "schedule": {robot_name: list(targets) for robot_name, targets in self._schedule.items()},
+                "mr_flag_ctr": self._mr_flag_ctr}
+
+    def set_state(self, state, decode_order, robots: dict, goals: dict, order_manager, rng: random.Random):
+        # Takes over the data of state, from get_state, with decode_order undoing encode_order. The scheduler works
+        # with robots, goals and order_manager from then on, and draws from rng.
+        self._robots = robots
+        self._goals = goals
+        self._order_manager_ref = order_manager
+        self._rng = rng
+        self._num_robots = state["num_robots"]
+        self._order_to_amount_robots_assigned = state["order_to_amount_robots_assigned"]
+        self._ga_attempts = state["ga_attempts"]
+        self._flags = state["flags"]
+        self._orders_backlog = [decode_order(code) for code in state["orders_backlog"]]
+        self._orders_active = [decode_order(code) for code in state["orders_active"]]
+        self._order_robots_assignment = state["order_robots_assignment"]
+        self._order_goal_assignment = state["order_goal_assignment"]
+        self._schedule = state["schedule"]
+        # The robots' entries are set again by recalculate_distances, so only the positions of the shelves and goals
+        # matter, and those never change
+        self._all_positions = dict(self._all_positions)
+        self._all_distances = {}
+        self._static_distances_found = False
+        self._mr_flag_ctr = state["mr_flag_ctr"]
+
     def recalculate_distances(self):
+        # Robots are never travelled to, so only the distances from each robot to the shelves and goals are needed,
+        # rather than every pair of robots as well. Distances between shelves and goals never change.
+        static_positions = [(name, position) for name, position in self._all_positions.items()
+                            if "robot" not in name]
         for robot_name, robot_obj in self._robots.items():
-            self._all_positions[robot_name] = robot_obj.get_position()
-
-        for location1 in self._all_positions.keys():
-            for location2 in self._all_positions.keys():
-                if (location2, location1) not in self._all_distances.keys():
-                    if (((location1, location2) not in self._all_distances.keys()) or
-                            ("robot" in location1) or ("robot" in location2)):
-                        if location1 != location2:
-                            x1 = self._all_positions[location1][0]
-                            y1 = self._all_positions[location1][1]
+            x1, y1 = robot_obj.get_position()
+            self._all_positions[robot_name] = (x1, y1)
+            for location, (x2, y2) in static_positions:
+                self._all_distances[(robot_name, location)] = utils.taxicab_dist(x1, y1, x2, y2)
 
-                            x2 = self._all_positions[location2][0]
-                            y2 = self._all_positions[location2][1]
-
-                            self._all_distances[(location1, location2)] = utils.taxicab_dist(x1,y1,x2,y2)
+        if not self._static_distances_found:
+            for i, (location1, (x1, y1)) in enumerate(static_positions):
+                for location2, (x2, y2) in static_positions[i + 1:]:
+                    self._all_distances[(location1, location2)] = utils.taxicab_dist(x1, y1, x2, y2)
+            self._static_distances_found = True
 
     def add_flag(self, flag: str):
         self._flags.append(flag)
@@ -755,6 +795,10 @@ class Scheduler:
 
         return robot_next_target_obj
 
+    def get_robot_schedule(self, robot_name):
+        # Returns the names of the targets still to be given to the robot, or None if it has never been given any
+        return self._schedule.get(robot_name)
+
     def get_home_name_for_robot_name(self, robot_name):
         return "home%s" % robot_name[5:]
 
@@ -875,23 +919,23 @@ class Scheduler:
                 offsets = [-2,-1,0,1,2]
                 if i > 1:
                     for k in range(i - 1):
-                        robot_indices.append((((k + 1) * num_genes) // i) - 1 + random.choice(offsets))
+                        robot_indices.append((((k + 1) * num_genes) // i) - 1 + self._rng.choice(offsets))
 
                 sol = []
                 robots_added_to_sol = []
                 for k in range(num_genes):
                     if k in robot_indices:
-                        free_robot_name = random.choice(free_robot_names)
+                        free_robot_name = self._rng.choice(free_robot_names)
                         while free_robot_name in robots_added_to_sol:
-                            free_robot_name = random.choice(free_robot_names)
+                            free_robot_name = self._rng.choice(free_robot_names)
                         sol.append(free_robot_name)
                         robots_added_to_sol.append(free_robot_name)
                     else:
                         if shelf_ctr == len(order_list):
-                            gene_choice = random.choice(genes_no_robots_no_shelves)
+                            gene_choice = self._rng.choice(genes_no_robots_no_shelves)
                             sol.append(gene_choice)
                         else:
-                            gene_choice = random.choice(genes_no_robots)
+                            gene_choice = self._rng.choice(genes_no_robots)
                             if "shelf" in gene_choice:
                                 shelf_ctr += 1
                             sol.append(gene_choice)
@@ -910,7 +954,8 @@ class Scheduler:
                                initial_population=init_pop,
                                sol_per_pop=200,
                                fitness_func=fitness_func,
-                               num_parents_mating=num_parents_mating)
+                               num_parents_mating=num_parents_mating,
+                               random_seed=self._rng.getrandbits(32))
 
         ga_instance.run()
 
@@ -3,6 +3,8 @@ import udptransmit
 
 
 class Shelf:
+    __slots__ = ("_x", "_y", "_item", "_name")
+
     def __init__(self, x_pos: int, y_pos: int, name: str, item_type: item.Item = None):
         self._x = x_pos
         self._y = y_pos
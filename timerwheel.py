@@ -0,0 +1,43 @@
+class TimerWheel:
+    # Hashed timer wheel of keys due on a step. Each key is kept in the slot of its step modulo the wheel's size, so
+    # scheduling, cancelling and finding what is due on a step only touch one slot, however far ahead keys are due.
+    # Keys due more than one turn of the wheel ahead share a slot with nearer ones and are passed over until their
+    # step comes round.
+    def __init__(self, size: int = 256):
+        # size must be a power of 2
+        self._mask = size - 1
+        self._slots = [{} for _ in range(size)]
+        # Key -> step it is due on
+        self._steps = {}
+
+    def schedule(self, key, step: int):
+        self.cancel(key)
+        self._steps[key] = step
+        self._slots[step & self._mask][key] = step
+
+    def cancel(self, key):
+        step = self._steps.pop(key, None)
+        if step is not None:
+            del self._slots[step & self._mask][key]
+
+    def pop(self, step: int):
+        # Returns the keys due on step, and removes them
+        slot = self._slots[step & self._mask]
+        due = [key for key, key_step in slot.items() if key_step == step]
+        for key in due:
+            del slot[key]
+            del self._steps[key]
+        return due
+
+    def get_state(self):
+        # Key -> step it is due on, see RobotFleet.get_state
+        return dict(self._steps)
+
+    def set_state(self, steps):
+        self._slots = [{} for _ in range(self._mask + 1)]
+        self._steps = {}
+        for key, step in steps.items():
+            self.schedule(key, step)
+
+    def __len__(self):
+        return len(self._steps)
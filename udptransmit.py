@@ -6,8 +6,12 @@ SOCK = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 commands = {}
 
 
+def is_transmitting():
+    return os.environ["ROBOTSIM_TRANSMIT"] == "True"
+
+
 def send_udp_message(message: str):
-    if os.environ["ROBOTSIM_TRANSMIT"] == "True":
+    if is_transmitting():
         print("sending")
         SOCK.sendto(bytes(message, "utf-8"), (IP, PORT))
 
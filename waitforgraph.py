@@ -0,0 +1,97 @@
+class WaitForGraph:
+    # Which robot each blocked robot is waiting for, to find cyclic deadlocks. A robot waits for the robot in its
+    # target's cell, so every robot has at most one edge out and the waits form chains that can end in a cycle.
+    # Edges are added when a robot can't find a path, and removed when either robot moves, so a cycle only has to be
+    # looked for when an edge is added, by following the chain on from the robot it waits for. Found cycles are kept
+    # until one of their edges is removed.
+    def __init__(self):
+        # Robot -> (robot it waits for, position of its target when the edge was added)
+        self._edges = {}
+        # Robot -> robots waiting for it
+        self._waiters = {}
+        # Robot -> cycle it is in, as a list of robots starting with it
+        self._cycles = {}
+
+        self.cycles_found = 0
+
+    def is_current(self, robot_obj):
+        # An edge is dropped if the robot's target has changed since it was added, as the scheduler can give robots
+        # new targets without the graph hearing about it
+        edge = self._edges.get(robot_obj)
+        if edge is None:
+            return False
+        target = robot_obj.get_target()
+        if target is None or target.get_position() != edge[1]:
+            self.remove_edge(robot_obj)
+            return False
+        return True
+
+    def add_edge(self, robot_obj, blocking_robot):
+        # robot_obj can't reach its target as blocking_robot is in it
+        edge = self._edges.get(robot_obj)
+        target_position = robot_obj.get_target().get_position()
+        if edge is not None and edge[0] is blocking_robot and edge[1] == target_position:
+            return
+        self.remove_edge(robot_obj)
+        self._edges[robot_obj] = (blocking_robot, target_position)
+        self._waiters.setdefault(blocking_robot, set()).add(robot_obj)
+
+        cycle = [robot_obj]
+        next_robot = blocking_robot
+        while next_robot is not robot_obj:
+            if next_robot in self._cycles or not self.is_current(next_robot):
+                # The chain ends, or runs into a cycle this robot isn't part of
+                return
+            cycle.append(next_robot)
+            next_robot = self._edges[next_robot][0]
+        self.cycles_found += 1
+        for i, robo in enumerate(cycle):
+            self._cycles[robo] = cycle[i:] + cycle[:i]
+
+    def remove_edge(self, robot_obj):
+        edge = self._edges.pop(robot_obj, None)
+        if edge is None:
+            return
+        self._waiters[edge[0]].discard(robot_obj)
+        cycle = self._cycles.get(robot_obj)
+        if cycle is not None:
+            for robo in cycle:
+                del self._cycles[robo]
+
+    def robot_moved(self, robot_obj):
+        # A robot that moves is no longer blocked, and no longer blocks the robots waiting for the cell it left
+        self.remove_edge(robot_obj)
+        for waiter in list(self._waiters.get(robot_obj, ())):
+            self.remove_edge(waiter)
+
+    def cycle_of(self, robot_obj):
+        # Returns the cycle of waiting robots starting with robot_obj, or None if it isn't in one
+        cycle = self._cycles.get(robot_obj)
+        if cycle is None:
+            return None
+        for robo in cycle:
+            if not self.is_current(robo):
+                return None
+        return cycle
+
+    def has_edges(self):
+        return len(self._edges) != 0
+
+    def get_state(self, robot_index):
+        # The graph, copied, with each robot given by robot_index(robot), see warehouse.Warehouse.get_state
+        return {"edges": {robot_index(robo): (robot_index(blocking_robot), target_position)
+                          for robo, (blocking_robot, target_position) in self._edges.items()},
+                "waiters": {robot_index(robo): [robot_index(waiter) for waiter in waiters]
+                            for robo, waiters in self._waiters.items()},
+                "cycles": {robot_index(robo): [robot_index(member) for member in cycle]
+                           for robo, cycle in self._cycles.items()},
+                "cycles_found": self.cycles_found}
+
+    def set_state(self, state, robots):
+        # robots is a list of the robots by the index robot_index gave them
+        self._edges = {robots[index]: (robots[blocking_index], target_position)
+                       for index, (blocking_index, target_position) in state["edges"].items()}
+        self._waiters = {robots[index]: {robots[waiter] for waiter in waiters}
+                         for index, waiters in state["waiters"].items()}
+        self._cycles = {robots[index]: [robots[member] for member in cycle] for index, cycle in state["cycles"].items()}
+        self.cycles_found = state["cycles_found"]
@@ -1,27 +1,115 @@
+import copy
+import functools
 import math
 import random
 
+import checkpoint
 import customexceptions
 import item
+import order
 import udptransmit
 import shelf
 import orderstation
 import robot
-import heapq
-import utils
+import robotfleet
+import pathfinding
+import hierarchicalpathfinding
+import reservationtable
+import pathcache
+import randomstreams
+import waitforgraph
+import faulttimeline
 import ordermanager
 import scheduler
 import robothome
+import warehouselayout
 import time
-from dataclasses import dataclass, field
+from array import array
+
+import numpy
+
+# Bit flags for the static layer, one byte per cell
+CELL_WALL = 1
+CELL_SHELF = 2
+CELL_GOAL = 4
+CELL_HOME = 8
+# Cells that robots only path into when they are the target
+CELL_ENDPOINT = CELL_SHELF | CELL_GOAL | CELL_HOME
+
+# Value of the robot layer for a cell with no robot in it
+NO_ROBOT = -1
+
+MOVEMENT_MODES = ["astar", "flow-field", "cooperative"]
+# How robots plan full paths to their targets. "incremental" keeps a D* Lite search per robot and repairs it when
+# the robot or the robots around it move, instead of searching from scratch. "hierarchical" plans between clusters
+# of cells and only works out the cells of the path through the cluster the robot is in. "jump-point" is A* that
+# skips along straight runs of open cells, which suits open floors.
+PATH_PLANNERS = ["astar", "incremental", "hierarchical", "jump-point"]
+# The pathfinder class of each path planner
+PATH_PLANNER_CLASSES = {"astar": pathfinding.GridPathfinder, "incremental": pathfinding.IncrementalPathfinder,
+                        "hierarchical": hierarchicalpathfinding.HierarchicalPathfinder,
+                        "jump-point": pathfinding.JumpPointPathfinder}
+# The fewest steps ahead robots plan and reserve in the cooperative movement mode. Plans go as far as the robot's
+# target would be with nothing in the way, plus two steps for waits, so a robot with a clear run plans once per target.
+COOPERATIVE_WINDOW = 8
+
+# How the warehouse moves through time. "tick" runs every step. "event" jumps straight over steps in which all that
+# happens is robots following their paths, see skip_quiet_steps, and gives the same results. It only works with the
+# astar movement mode, the others plan with the step they are on. The steps it still runs are the ones that plan
+# paths, schedule and interact, which is most of the time taken, so it is nowhere near ten times faster: see
+# benchmarks.run_event_engine_benchmark.
+ENGINES = ["tick", "event"]
+
+# A reasonable number of entries for the path cache, every cell of a cached path takes an entry. The cache is off
+# unless a size is given. Only about one plan in ten is from a cell and to a target that were planned for before, so
+# it serves about one in twenty, see benchmarks.run_path_cache_benchmark
+PATH_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=32)
+def compile_static_layer(layout: warehouselayout.WarehouseLayout):
+    # The CELL_* flags of each cell of a layout. Layouts are keyed by their contents, so warehouses built from the
+    # same layout, however it was given, share this and copy it rather than working it out again.
+    static_layer = bytearray(layout.get_width() * layout.get_height())
+    for positions, flag in ((layout.get_robot_positions(), CELL_HOME), (layout.get_shelf_positions(), CELL_SHELF),
+                            (layout.get_goal_positions(), CELL_GOAL), (layout.get_wall_positions(), CELL_WALL)):
+        for x, y in positions:
+            static_layer[y * layout.get_width() + x] |= flag
+    return bytes(static_layer)
+
 
 class Warehouse:
-    def __init__(self, w_house_filename: str, num_items: int, robot_max_inventory: int, schedule_mode: str,
-                 robot_fault_rates: list[float], fault_tolerant_mode, step_limit: int):
+    def __init__(self, w_house_layout, num_items: int, robot_max_inventory: int, schedule_mode: str,
+                 robot_fault_rates: list[float], fault_tolerant_mode, step_limit: int, movement_mode: str = "astar",
+                 path_planner: str = "astar", path_cache_size: int = 0,
+                 vectorized_step: bool = False, engine: str = "tick", skip_idle: bool = True,
+                 checkpoint_steps: int = 0, checkpoint_filename: str = "checkpoint%s.bin", seed: int = None):
         self._fault_tolerant_mode = fault_tolerant_mode
 
+        # Everything random in the simulation is drawn from streams seeded from seed, see randomstreams. Without a
+        # seed one is drawn from random, so seeding random still repeats a simulation.
+        if seed is None:
+            seed = random.getrandbits(64)
+        self._random_streams = randomstreams.RandomStreams(seed)
+
+        if movement_mode not in MOVEMENT_MODES:
+            raise customexceptions.SimulationError("Invalid movement mode provided")
+        self._movement_mode = movement_mode
+
+        if path_planner not in PATH_PLANNERS:
+            raise customexceptions.SimulationError("Invalid path planner provided")
+        self._path_planner = path_planner
+
+        if engine not in ENGINES:
+            raise customexceptions.SimulationError("Invalid engine provided")
+        if engine == "event" and movement_mode != "astar":
+            raise customexceptions.SimulationError("The event engine only works with the astar movement mode")
+        self._event_engine = engine == "event"
+        # Whether the tick engine jumps over steps in which no robot moves and nothing else happens either, such as
+        # while every robot charges or once all the orders are done. The results are the same.
+        self._skip_idle = skip_idle
+
         self._current_orders = []
-        self._cells = []
         self._robots = {}
         self._order_stations = {}
         self._shelves = {}
@@ -36,58 +124,166 @@ class Warehouse:
         self._dynamic_deadline = 100
 
         self._order_manager = ordermanager.OrderManager(5, 5, self._items,
-                                                        self._dynamic_deadline)
+                                                        self._dynamic_deadline, self._random_streams.orders)
 
         self._robot_max_inventory = robot_max_inventory
-        # Warehouse cell (x,y) is accessed via self._cells[y][x]
-        self._cells = self.parse_warehouse_file(w_house_filename)
+
+        # Warehouse cell (x,y) is stored at index y * self._width + x of each layer.
+        # The static layer holds CELL_* flags, the robot layer holds the id of the robot in the cell or NO_ROBOT.
+        self._width = 0
+        self._height = 0
+        self._static_layer = bytearray()
+        self._robot_layer = array("i")
+        # Counts, for each cell, how many sensor faulted robots could move into it on their next step
+        self._danger_layer = array("i")
+        self._robots_by_id = []
+        self._robot_ids = {}
+        # Robot ids are their indexes in the fleet
+        self._fleet = robotfleet.RobotFleet()
+        # w_house_layout is a warehouselayout.WarehouseLayout, or the name of a file to read one from
+        layout = warehouselayout.load_layout(w_house_layout)
+        self.build_layout(layout)
+        # vectorized_step moves the robots that are simply following their paths all at once, see
+        # move_robots_along_paths, which is much faster for big fleets but doesn't give the same results as moving
+        # them one at a time. It is only done for the default movement mode. Robots wanting the same cell, or each
+        # other's cells, are settled by chains of followers rather than by each robot taking its turn in id order,
+        # and a follower that a robot with a higher id is in the way of gets another try later in the step, where
+        # in id order it would wait a step, see step. On the nxn layouts every run parts ways within the first 20
+        # steps, and finishes 1-2% sooner with 10-20% fewer blocked steps, see
+        # benchmarks.run_vectorized_step_divergence_benchmark.
+        self._vectorized_step = vectorized_step and self._movement_mode == "astar"
+        self._fault_timeline = faulttimeline.FaultTimeline([robot_obj.get_fault_rates()
+                                                            for robot_obj in self._robots_by_id],
+                                                           self._random_streams.faults)
+        self._nav_graph = pathfinding.compile_navigation_graph(self._width, self._height, bytes(self._static_layer),
+                                                               CELL_WALL, CELL_ENDPOINT)
+        self._pathfinder = pathfinding.GridPathfinder(self._nav_graph)
+        # Robot name -> pathfinding.IncrementalPathfinder, for the incremental path planner
+        self._incremental_pathfinders = {}
+        self._hierarchical_pathfinder = None
+        if self._path_planner == "hierarchical":
+            abstraction = hierarchicalpathfinding.compile_cluster_abstraction(self._nav_graph,
+                                                                              hierarchicalpathfinding.CLUSTER_SIZE)
+            # Falls back on the A* pathfinder when the clusters can't find a path
+            self._hierarchical_pathfinder = hierarchicalpathfinding.HierarchicalPathfinder(abstraction,
+                                                                                           self._pathfinder)
+        self._jump_point_pathfinder = None
+        if self._path_planner == "jump-point":
+            self._jump_point_pathfinder = pathfinding.JumpPointPathfinder(self._nav_graph)
+        self._reservations = reservationtable.ReservationTable()
+        self._wait_for = waitforgraph.WaitForGraph()
+        # Bumped whenever the robot layer changes
+        self._occupancy_version = 0
+        self._path_cache = pathcache.PathCache(path_cache_size, self._nav_graph)
+        # The cells robots have entered or left, in order, for the incremental path planner. Each robot's pathfinder
+        # is given the ones since it last planned. Cleared once there are more than the floor has cells, pathfinders
+        # that hadn't been given them all then check every cell instead.
+        self._occupancy_changes = []
+        # How many changes have been cleared from _occupancy_changes
+        self._cleared_occupancy_changes = 0
+        # Robot name -> how many changes its incremental pathfinder has been given
+        self._given_occupancy_changes = {}
+
+        # Movement statistics, a blocked step is one where a robot had somewhere to go but couldn't move there
+        self._path_plans = 0
+        self._blocked_steps = 0
+        self._skipped_steps = 0
 
         self._scheduler = scheduler.Scheduler(self._order_manager,
                                               self._robots, self._shelves, self._order_stations,
                                               self._homes, self._order_manager.get_init_orders(),
                                               schedule_mode,
-                                              self._robot_max_inventory, self._fault_tolerant_mode)
+                                              self._robot_max_inventory, self._fault_tolerant_mode,
+                                              self._random_streams.scheduler)
         self._scheduler.schedule(1)
 
-        self._width = len(self._cells[0])
-        self._height = len(self._cells)
-
         self.transmit_initial_warehouse_layout()
         self._total_steps = 0
+        self._last_step_count = 0
+        # The occupancy version when the last step started
+        self._last_step_occupancy_version = -1
         self._step_limit = step_limit
 
         self.sensor_faulty_bots = {}
 
+        # Writes a checkpoint every checkpoint_steps steps, to checkpoint_filename with the step filled in, see
+        # checkpoint.read_checkpoint to carry on from one
+        self._checkpoints = None
+        if checkpoint_steps:
+            self._checkpoints = checkpoint.CheckpointWriter(checkpoint_filename, checkpoint_steps)
+
+        # What the warehouse was built with, as plain data with the layout's text, so a checkpoint can build it again
+        # before giving it its state, see get_arguments
+        self._arguments = {"w_house_layout": layout.get_text(), "num_items": num_items,
+                           "robot_max_inventory": robot_max_inventory, "schedule_mode": schedule_mode,
+                           "robot_fault_rates": list(robot_fault_rates), "fault_tolerant_mode": fault_tolerant_mode,
+                           "step_limit": step_limit, "movement_mode": movement_mode, "path_planner": path_planner,
+                           "path_cache_size": path_cache_size, "vectorized_step": vectorized_step, "engine": engine,
+                           "skip_idle": skip_idle, "checkpoint_steps": checkpoint_steps,
+                           "checkpoint_filename": checkpoint_filename, "seed": seed}
+
     def step(self):
+        steps_before = self._total_steps
+        if self._event_engine:
+            self.skip_quiet_steps()
+        elif self._skip_idle and self._occupancy_version == self._last_step_occupancy_version:
+            # Only looked for once a step goes by without any robot moving, as there is rarely anything to skip
+            self.skip_quiet_steps(robots_may_move=False)
+        self._last_step_occupancy_version = self._occupancy_version
         self._total_steps = self._total_steps + 1
+        self._last_step_count = self._total_steps - steps_before
 
         if self._total_steps > self._step_limit:
             raise customexceptions.SimulationError("Simulation still running after step limit")
 
-        # ============================================UPDATE ROBOTS====================================================
-        for robot_obj in self._robots.values():
-            # Apply any faults
-            fault_list = robot_obj.maybe_introduce_fault()
-            self.apply_fault_actions(robot_obj, fault_list)
-
-
+        if self._movement_mode == "cooperative":
+            # Reservations before the previous step are no longer needed to plan or to detect swaps
+            self._reservations.advance(self._total_steps - 1)
 
-            # Robots should only take action if they are not waiting
-            if robot_obj.get_wait_steps() == 0:
-                #print("Updating robot %s" % robot_obj.get_name())
-                #print("At (%s %s)" % (robot_obj.get_position()[0], robot_obj.get_position()[1]))
-                #print("Has target %s" % robot_obj.get_target())
-                self.decide_robot_action(robot_obj)
-            else:
-                #print("Robot %s waited a step" % robot_obj.get_name())
-                should_schedule = robot_obj.decrement_wait_steps()
-                if should_schedule:
-                    self._scheduler.schedule(self._total_steps)
-            #self.print_layout_simple()
-            #print(self._scheduler._orders_active)
-            #print(self._scheduler._orders_backlog)
-            #for value in self._order_stations.values():
-                #print(value.report_inventory())
+        # ============================================UPDATE ROBOTS====================================================
+        faults = self._fault_timeline.faults_at(self._total_steps)
+        fleet = self._fleet
+        waking = fleet.start_turns(self._total_steps)
+        if self._vectorized_step:
+            # Faults come first for every robot, then the waits that end this step. Sensor faulted robots move blind,
+            # so they go next, for the others to see where they could move to. Then the robots that are just following
+            # their paths move together, and the rest act one at a time as usual. Waits given during the step all
+            # count down from the next step, as if every robot had already had its turn.
+            # So robots don't act in id order as they do one at a time, and the results differ: the robots acting one
+            # at a time do so after every follower has moved, so they see the cells followers have left and entered.
+            # A follower blocked by a robot with a higher id tries again then, once that robot may have moved, where
+            # in id order it would have been blocked for the step.
+            fleet.end_turns()
+            for robot_index, due_faults in faults.items():
+                self.introduce_robot_faults(self._robots_by_id[robot_index], due_faults)
+            for robot_id in waking:
+                self.update_robot(self._robots_by_id[robot_id])
+            columns = fleet.views()
+            resting = columns["wake_step"] != robotfleet.NOT_WAITING
+            resting[waking] = True
+            sensor_faulted = columns["sensors_faulted"] != 0
+            for robot_id in numpy.flatnonzero(sensor_faulted & ~resting).tolist():
+                self.update_robot(self._robots_by_id[robot_id])
+            moved = self.move_robots_along_paths(resting)
+            for robot_id in numpy.flatnonzero(~moved & ~sensor_faulted & ~resting).tolist():
+                self.update_robot(self._robots_by_id[robot_id])
+        else:
+            # Waiting robots only have a turn on the step their wait ends, or to take a fault
+            awake = numpy.flatnonzero(fleet.views()["wake_step"] == robotfleet.NOT_WAITING)
+            turns = numpy.union1d(awake, numpy.array(waking + list(faults), dtype=awake.dtype))
+            for robot_id in turns.tolist():
+                robot_obj = self._robots_by_id[robot_id]
+                # Apply any faults
+                if robot_id in faults:
+                    self.introduce_robot_faults(robot_obj, faults[robot_id])
+                fleet.turn_index = robot_id
+                self.update_robot(robot_obj)
+                #self.print_layout_simple()
+                #print(self._scheduler._orders_active)
+                #print(self._scheduler._orders_backlog)
+                #for value in self._order_stations.values():
+                    #print(value.report_inventory())
+            fleet.end_turns()
 
         # ============================================ADD DYNAMIC ORDERS==============================================
         new_order = self._order_manager.possibly_introduce_dynamic_order(self._total_steps)
@@ -98,7 +294,264 @@ class Warehouse:
         # ============================================DISPLAY LAYOUT==================================================
         #self.print_layout_simple()
         #print("===============================================================================")
-        return self._scheduler.are_all_orders_complete() and self.get_total_steps() > self._dynamic_deadline + 1
+        done = self._scheduler.are_all_orders_complete() and self.get_total_steps() > self._dynamic_deadline + 1
+        # There is nothing to carry on from once the simulation is done
+        if self._checkpoints is not None and not done:
+            self._checkpoints.after_step(self, steps_before)
+        return done
+
+    def skip_quiet_steps(self, robots_may_move=True):
+        # Jumps over the steps before the next one that can do more than move robots along their paths. A step
+        # can do more if a fault or dynamic order is due, a wait ends, a robot needs a path, reaches its target or
+        # interacts with it, or a robot's next cell has or has just had another robot in it. Every step before that
+        # would move each moving robot one cell along its path, so they are moved there at once. If robots_may_move
+        # is False, only steps in which no robot moves are jumped over.
+        step = self._total_steps
+        last_step = min(self._fault_timeline.next_fault_step(), self._fleet.next_wake_step(), self._step_limit + 1) - 1
+        next_order_step = self._order_manager.next_dynamic_order_step(step)
+        if next_order_step is not None:
+            last_step = min(last_step, next_order_step - 1)
+        if self._scheduler.are_all_orders_complete():
+            # The step that ends the simulation is still run
+            last_step = min(last_step, self._dynamic_deadline + 1)
+        if last_step <= step:
+            return
+
+        quiet_robots = self.find_quiet_robots(robots_may_move)
+        if quiet_robots is None:
+            return
+        movers, home_bound, parked = quiet_robots
+        steps = self.count_clear_path_steps(movers + home_bound, int(last_step - step))
+        if home_bound or parked:
+            # Idle robots ask the scheduler for work every step, which flips their schedules between going home and
+            # nothing, so only an even number of steps leaves them as they were
+            steps -= steps % 2
+        if steps <= 0:
+            return
+
+        self.move_robots_ahead(movers + home_bound, steps)
+        for i in range(2):
+            for robot_obj in home_bound:
+                self._scheduler.direct_robot(robot_obj)
+            for robot_obj in parked:
+                self.decide_robot_action(robot_obj)
+        self._total_steps += steps
+        self._skipped_steps += steps
+
+    def find_quiet_robots(self, robots_may_move=True):
+        # Sorts the robots that aren't waiting into those that just follow their paths, those that also ask the
+        # scheduler for work as they go home and those idling at home. Robots that have never been given work do
+        # nothing. Returns None if any robot would do anything else on the next step, or would move and
+        # robots_may_move is False.
+        columns = self._fleet.views()
+        awake = numpy.flatnonzero(columns["wake_step"] == robotfleet.NOT_WAITING)
+        if columns["sensors_faulted"][awake].any():
+            return None
+        if self._fault_tolerant_mode and self.sensor_faulty_bots:
+            danger_layer = numpy.frombuffer(self._danger_layer, dtype=self._danger_layer.typecode)
+            if danger_layer[columns["y"][awake] * self._width + columns["x"][awake]].any():
+                return None
+
+        # Robots that will interact with a target other than their home, or need a path, act on the next step
+        robot_ids = awake
+        xs = columns["x"][robot_ids]
+        ys = columns["y"][robot_ids]
+        target_xs = columns["target_x"][robot_ids]
+        has_target = target_xs != robotfleet.NO_POSITION
+        at_target = has_target & (xs == target_xs) & (ys == columns["target_y"][robot_ids])
+        if not robots_may_move and (has_target & ~at_target).any():
+            return None
+        is_idle = (has_target & (columns["target_is_home"][robot_ids] != 0) &
+                   (columns["battery_faulted"][robot_ids] == 0) & (columns["gone_home_to_clear_inv"][robot_ids] == 0))
+        if (at_target & ~is_idle).any():
+            return None
+        if (has_target & ~at_target & (columns["next_x"][robot_ids] == robotfleet.NO_POSITION)).any():
+            return None
+
+        movers = [self._robots_by_id[robot_id] for robot_id in robot_ids[has_target & ~is_idle].tolist()]
+        home_bound = []
+        parked = []
+        for robot_id in robot_ids[~has_target | is_idle].tolist():
+            robot_obj = self._robots_by_id[robot_id]
+            robot_name = robot_obj.get_name()
+            schedule = self._scheduler.get_robot_schedule(robot_name)
+            home_name = self._scheduler.get_home_name_for_robot_name(robot_name)
+            if robot_obj.get_target() is None:
+                if schedule is None:
+                    continue
+                if schedule == [home_name] and robot_obj.get_position() == self._homes[home_name].get_position():
+                    parked.append(robot_obj)
+                    continue
+                return None
+
+            if robot_obj.is_at_target():
+                if schedule == [] and not robot_obj.apply_charge_wait_upon_reaching_home:
+                    parked.append(robot_obj)
+                    continue
+                return None
+            if schedule is None:
+                movers.append(robot_obj)
+            elif schedule == [] or schedule == [home_name]:
+                home_bound.append(robot_obj)
+            else:
+                return None
+        return movers, home_bound, parked
+
+    def count_clear_path_steps(self, robots, max_steps):
+        # Returns how many steps, up to max_steps, robots can all take the next cells of their paths for, without
+        # any of them moving into a cell that another robot is in before or after the step, or that is near a sensor
+        # faulted robot. A robot's path has to last the steps too, the step after it ends it interacts.
+        if not robots:
+            return max_steps
+        steps = min(max_steps, min(len(robot_obj.get_movement_path()) for robot_obj in robots))
+        width = self._width
+        cell_count = width * self._height
+        # The cells each robot is in after each step, starting with the cells they are in now
+        paths = [[robot_obj.get_position()] + robot_obj.get_movement_path()[:steps] for robot_obj in robots]
+        cells = numpy.array([[y * width + x for x, y in path] for path in paths], dtype=numpy.int64)
+        next_cells = cells[:, 1:]
+
+        is_moving = numpy.zeros(len(self._robots_by_id), dtype=bool)
+        is_moving[[robot_obj.get_fleet_index() for robot_obj in robots]] = True
+        robot_layer = numpy.frombuffer(self._robot_layer, dtype=self._robot_layer.typecode)
+        occupants = robot_layer[next_cells]
+        blocked = (occupants != NO_ROBOT) & ~is_moving[numpy.maximum(occupants, 0)]
+        blocked |= next_cells == cells[:, :-1]
+
+        # Each (step, cell) taken by a moving robot, as one number
+        taken = cells + numpy.arange(steps + 1) * cell_count
+        taken_keys, taken_counts = numpy.unique(taken, return_counts=True)
+        blocked |= taken_counts[numpy.searchsorted(taken_keys, taken[:, 1:])] > 1
+        taken_before = taken[:, 1:] - cell_count
+        before_index = numpy.minimum(numpy.searchsorted(taken_keys, taken_before), len(taken_keys) - 1)
+        blocked |= taken_keys[before_index] == taken_before
+
+        if self._fault_tolerant_mode and self.sensor_faulty_bots:
+            danger_layer = numpy.frombuffer(self._danger_layer, dtype=self._danger_layer.typecode)
+            in_danger = danger_layer[cells] != 0
+            blocked |= in_danger[:, 1:] | in_danger[:, :-1]
+
+        blocked_steps = blocked.any(axis=0)
+        if blocked_steps.any():
+            return int(numpy.argmax(blocked_steps))
+        return steps
+
+    def move_robots_ahead(self, robots, steps):
+        # Moves each robot steps cells along its path, which must be clear
+        robot_layer = self._robot_layer
+        width = self._width
+        changed_cells = []
+        for robot_obj in robots:
+            x, y = robot_obj.get_position()
+            robot_layer[y * width + x] = NO_ROBOT
+            changed_cells.append(y * width + x)
+        for robot_obj in robots:
+            x, y = robot_obj.get_movement_path()[steps - 1]
+            robot_obj.set_position(x, y)
+            robot_layer[y * width + x] = robot_obj.get_fleet_index()
+            changed_cells.append(y * width + x)
+            robot_obj.advance_movement_path(steps)
+            self._wait_for.robot_moved(robot_obj)
+            udptransmit.transmit_robot_position(robot_obj.get_name(), x, y)
+        self.occupancy_changed(changed_cells)
+
+    def occupancy_changed(self, cells):
+        # Robots entered or left cells, a list or NumPy array of them
+        self._occupancy_version += 1
+        if self._path_planner == "incremental":
+            occupancy_changes = self._occupancy_changes
+            occupancy_changes.extend(int(cell) for cell in cells)
+            if len(occupancy_changes) > len(self._robot_layer):
+                self._cleared_occupancy_changes += len(occupancy_changes)
+                occupancy_changes.clear()
+
+    def update_robot(self, robot_obj):
+        # Robots should only take action if they are not waiting
+        wake_step = robot_obj.get_wake_step()
+        if wake_step == robotfleet.NOT_WAITING:
+            #print("Updating robot %s" % robot_obj.get_name())
+            #print("At (%s %s)" % (robot_obj.get_position()[0], robot_obj.get_position()[1]))
+            #print("Has target %s" % robot_obj.get_target())
+            self.decide_robot_action(robot_obj)
+        elif wake_step == self._total_steps:
+            #print("Robot %s finished waiting" % robot_obj.get_name())
+            should_schedule = robot_obj.end_wait()
+            if should_schedule:
+                self._scheduler.schedule(self._total_steps)
+
+    def move_robots_along_paths(self, resting):
+        # Moves every robot that would simply take the next cell of its path this step, using the fleet's arrays.
+        # These are the robots decide_robot_action would send to move_robot_towards_astar_collision_detect, that
+        # aren't waiting, sensor faulted or near a sensor faulted robot, and whose next cell is free. As when robots
+        # act one at a time, a robot can follow a robot with a lower id into the cell it is leaving, and when two
+        # robots want the same cell the one with the lower id gets it, but see step for how the results still differ.
+        # resting is a bool array, indexed by robot id, of robots that don't act this step. Returns a bool array,
+        # indexed by robot id, of the robots that moved.
+        columns = self._fleet.views()
+        width = self._width
+        robot_layer = numpy.frombuffer(self._robot_layer, dtype=self._robot_layer.typecode)
+        xs = columns["x"]
+        ys = columns["y"]
+        next_xs = columns["next_x"]
+        target_xs = columns["target_x"]
+        candidates = (~resting & (columns["wake_step"] == robotfleet.NOT_WAITING) &
+                      (target_xs != robotfleet.NO_POSITION) & (next_xs != robotfleet.NO_POSITION) &
+                      (columns["sensors_faulted"] == 0) &
+                      ((xs != target_xs) | (ys != columns["target_y"])))
+        # Robots heading home are still idle, and ask the scheduler for work every step
+        candidates &= ((columns["target_is_home"] == 0) | (columns["battery_faulted"] != 0) |
+                       (columns["gone_home_to_clear_inv"] != 0))
+        robot_ids = numpy.flatnonzero(candidates)
+        cells = columns["next_y"][robot_ids] * width + next_xs[robot_ids]
+        if self._fault_tolerant_mode and self.sensor_faulty_bots:
+            danger_layer = numpy.frombuffer(self._danger_layer, dtype=self._danger_layer.typecode)
+            safe = (danger_layer[ys[robot_ids] * width + xs[robot_ids]] == 0) & (danger_layer[cells] == 0)
+            robot_ids = robot_ids[safe]
+            cells = cells[safe]
+
+        # robot_ids are in increasing order, so the first robot to want each cell has the lowest id
+        cells, first = numpy.unique(cells, return_index=True)
+        robot_ids = robot_ids[first]
+        occupants = robot_layer[cells]
+        # A robot moves if its cell is free, or if it follows a robot with a lower id that moves. Following robots
+        # form chains that end in a robot that isn't following, which decides whether the whole chain moves. Each
+        # robot jumps along its chain, doubling how far it jumps each time, until it reaches the end.
+        candidate_index = numpy.full(len(self._robots_by_id), -1)
+        candidate_index[robot_ids] = numpy.arange(len(robot_ids))
+        leader = numpy.where((occupants != NO_ROBOT) & (occupants < robot_ids),
+                             candidate_index[numpy.maximum(occupants, 0)], -1)
+        chain_end = numpy.where(leader == -1, numpy.arange(len(robot_ids)), leader)
+        while True:
+            next_chain_end = chain_end[chain_end]
+            if numpy.array_equal(next_chain_end, chain_end):
+                break
+            chain_end = next_chain_end
+        accepted = (occupants == NO_ROBOT)[chain_end]
+        robot_ids = robot_ids[accepted]
+        cells = cells[accepted]
+        moving = numpy.zeros(len(self._robots_by_id), dtype=bool)
+        moving[robot_ids] = True
+        if len(robot_ids) == 0:
+            return moving
+
+        old_cells = ys[robot_ids] * width + xs[robot_ids]
+        robot_layer[old_cells] = NO_ROBOT
+        robot_layer[cells] = robot_ids
+        self.occupancy_changed(numpy.concatenate((old_cells, cells)))
+        xs[robot_ids] = cells % width
+        ys[robot_ids] = cells // width
+        columns["steps_halted"][robot_ids] = 0
+        robots_by_id = self._robots_by_id
+        transmitting = udptransmit.is_transmitting()
+        for robot_id in robot_ids.tolist():
+            robot_obj = robots_by_id[robot_id]
+            robot_obj.advance_movement_path()
+            if self._wait_for.has_edges():
+                self._wait_for.robot_moved(robot_obj)
+            if transmitting:
+                x, y = robot_obj.get_position()
+                udptransmit.transmit_robot_position(robot_obj.get_name(), x, y)
+        return moving
 
     def decide_robot_action(self, robot_obj):
         if self._fault_tolerant_mode and not robot_obj.sensors_faulted:
@@ -112,6 +565,8 @@ class Warehouse:
                 for pos in next_positions:
                     if not self.is_within_grid(pos[0], pos[1]):
                         continue
+                    if self.cell_is_wall(pos[0], pos[1]):
+                        continue
                     if not self.cell_is_full(pos[0],pos[1]):
                         self.update_robot_position(robot_obj.get_name(), pos[0], pos[1])
 
@@ -130,7 +585,12 @@ class Warehouse:
 
             if not robot_obj.is_at_target():
                 #print("Robot is trying to move")
-                self.move_robot_towards_astar_collision_detect(robot_obj)
+                if self._movement_mode == "flow-field":
+                    self.move_robot_towards_flow_field(robot_obj)
+                elif self._movement_mode == "cooperative":
+                    self.move_robot_towards_cooperative(robot_obj)
+                else:
+                    self.move_robot_towards_astar_collision_detect(robot_obj)
             else:
                 #print("Robot is interacting with target")
                 robot_obj.interact_with_target()
@@ -139,6 +599,12 @@ class Warehouse:
             #print("Robot is waiting for direction")
             self._scheduler.direct_robot(robot_obj)
 
+    def introduce_robot_faults(self, robot_obj: robot.Robot, due_faults):
+        fault_list = robot_obj.introduce_faults(due_faults)
+        if robot_obj.battery_faulted_critical:
+            self._fault_timeline.stop(robot_obj.get_fleet_index())
+        self.apply_fault_actions(robot_obj, fault_list)
+
     def apply_fault_actions(self, robot_obj: robot.Robot, fault_list):
         if not fault_list:
             return
@@ -150,7 +616,7 @@ class Warehouse:
         if fault_list[2]:
             robot_obj.add_wait_steps(20)
         if fault_list[3]:
-            self.sensor_faulty_bots[robot_obj.get_name()] = robot_obj
+            self.add_sensor_faulty_robot(robot_obj)
             robot_obj.add_wait_steps(2)
         if True in fault_list:
             self._scheduler.schedule(self._total_steps)
@@ -158,6 +624,189 @@ class Warehouse:
     def get_total_steps(self):
         return self._total_steps
 
+    def get_last_step_count(self):
+        # How many steps the last call to step went through, more than one if it jumped over quiet steps
+        return self._last_step_count
+
+    def fork(self, seed: int = None):
+        # Returns a copy of the warehouse that carries on from the same step on its own. The copy shares everything
+        # that never changes, such as the layers and graph compiled from the layout, the shelves, homes and items,
+        # and copies the rest, see get_state. It has its own copy of the random streams, so it does just what the
+        # warehouse would from here on, unless it is given a new seed to carry on from instead.
+        forked = copy.copy(self)
+        forked.set_state(self.get_state())
+        forked.stop_checkpoints()
+        if seed is not None:
+            forked.reseed(seed)
+        return forked
+
+    def get_state(self):
+        # The state of the warehouse that changes as it runs, as plain data: dicts, lists, arrays and numbers, copied
+        # from the warehouse. Robots are given by their index, order stations, shelves and homes by name, and orders
+        # by their index in the state's list of orders. Everything else is fixed by the arguments the warehouse was
+        # built with. See set_state.
+        orders = []
+        order_codes = {}
+
+        def encode_order(order_obj):
+            code = order_codes.get(id(order_obj))
+            if code is None:
+                code = len(orders)
+                order_codes[id(order_obj)] = code
+                orders.append(order_obj)
+            return code
+
+        state = {"fleet": self._fleet.get_state(),
+                 "robots": [robot_obj.get_state() for robot_obj in self._robots_by_id],
+                 "order_stations": {name: station.get_state() for name, station in self._order_stations.items()},
+                 "robot_layer": self._robot_layer[:],
+                 "danger_layer": self._danger_layer[:],
+                 "sensor_faulty_robots": [robot_obj.get_fleet_index()
+                                          for robot_obj in self.sensor_faulty_bots.values()],
+                 "random_streams": self._random_streams.get_state(),
+                 "fault_timeline": self._fault_timeline.get_state(),
+                 "order_manager": self._order_manager.get_state(encode_order),
+                 "scheduler": self._scheduler.get_state(encode_order),
+                 "current_orders": [encode_order(order_obj) for order_obj in self._current_orders],
+                 "reservations": self._reservations.get_state(),
+                 "wait_for": self._wait_for.get_state(robot.Robot.get_fleet_index),
+                 "path_cache": self._path_cache.get_state(),
+                 "pathfinder": self._pathfinder.get_state(),
+                 "incremental_pathfinders": {robot_name: pathfinder.get_state()
+                                             for robot_name, pathfinder in self._incremental_pathfinders.items()},
+                 "hierarchical_pathfinder": None,
+                 "jump_point_pathfinder": None,
+                 "occupancy_changes": list(self._occupancy_changes),
+                 "cleared_occupancy_changes": self._cleared_occupancy_changes,
+                 "given_occupancy_changes": dict(self._given_occupancy_changes),
+                 "occupancy_version": self._occupancy_version,
+                 "last_step_occupancy_version": self._last_step_occupancy_version,
+                 "path_plans": self._path_plans,
+                 "blocked_steps": self._blocked_steps,
+                 "skipped_steps": self._skipped_steps,
+                 "total_steps": self._total_steps,
+                 "last_step_count": self._last_step_count}
+        if self._hierarchical_pathfinder is not None:
+            state["hierarchical_pathfinder"] = self._hierarchical_pathfinder.get_state()
+        if self._jump_point_pathfinder is not None:
+            state["jump_point_pathfinder"] = self._jump_point_pathfinder.get_state()
+        # An order's original items are only given when they aren't its items list itself
+        state["orders"] = [([itm.get_id() for itm in order_obj.get_items()], order_obj.get_prio(), order_obj.get_id(),
+                            None if order_obj.get_original_items() is order_obj.get_items() else
+                            [itm.get_id() for itm in order_obj.get_original_items()])
+                           for order_obj in orders]
+        return state
+
+    def get_arguments(self):
+        # The arguments the warehouse was built with, copied, by name. w_house_layout is the layout's text, which
+        # warehouselayout.WarehouseLayout.from_text reads back.
+        return copy.deepcopy(self._arguments)
+
+    def set_state(self, state):
+        # Gives the warehouse the state of state, from get_state of a warehouse built with the same arguments. It takes
+        # over the data of state rather than copying it. Everything that changes as the warehouse runs is made anew,
+        # and nothing the warehouse held before is changed, so a copy.copy of a warehouse can be given a state
+        # without affecting the warehouse it was copied from.
+        items = self._items
+
+        def item_list(item_ids):
+            return [items[item.ITEM_NAME_FORMAT % item_id] for item_id in item_ids]
+
+        orders = []
+        for item_ids, prio, order_id, original_item_ids in state["orders"]:
+            order_items = item_list(item_ids)
+            original_items = None if original_item_ids is None else item_list(original_item_ids)
+            orders.append(order.Order(order_items, prio, order_id, original_items))
+        decode_order = orders.__getitem__
+
+        random_streams = copy.copy(self._random_streams)
+        random_streams.set_state(state["random_streams"])
+        self._random_streams = random_streams
+        fleet = copy.copy(self._fleet)
+        fleet.set_state(state["fleet"])
+        self._fleet = fleet
+
+        order_stations = {}
+        for name, station in self._order_stations.items():
+            station = copy.copy(station)
+            station.set_state(state["order_stations"][name], items, self)
+            order_stations[name] = station
+        self._order_stations = order_stations
+        targets = dict(self._shelves)
+        targets.update(self._homes)
+        targets.update(order_stations)
+        robots_by_id = []
+        for robot_obj, robot_state in zip(self._robots_by_id, state["robots"]):
+            robot_obj = copy.copy(robot_obj)
+            robot_obj.set_state(robot_state, fleet, items, targets)
+            robots_by_id.append(robot_obj)
+        self._robots_by_id = robots_by_id
+        self._robots = {robot_obj.get_name(): robot_obj for robot_obj in robots_by_id}
+        self._robot_layer = state["robot_layer"]
+        self._danger_layer = state["danger_layer"]
+        self.sensor_faulty_bots = {robots_by_id[index].get_name(): robots_by_id[index]
+                                   for index in state["sensor_faulty_robots"]}
+
+        self._fault_timeline = copy.copy(self._fault_timeline)
+        self._fault_timeline.set_state(state["fault_timeline"], random_streams.faults)
+        self._order_manager = copy.copy(self._order_manager)
+        self._order_manager.set_state(state["order_manager"], decode_order, random_streams.orders)
+        self._scheduler = copy.copy(self._scheduler)
+        self._scheduler.set_state(state["scheduler"], decode_order, self._robots, order_stations, self._order_manager,
+                                  random_streams.scheduler)
+        self._current_orders = [decode_order(code) for code in state["current_orders"]]
+        self._reservations = copy.copy(self._reservations)
+        self._reservations.set_state(state["reservations"])
+        self._wait_for = copy.copy(self._wait_for)
+        self._wait_for.set_state(state["wait_for"], robots_by_id)
+        self._path_cache = copy.copy(self._path_cache)
+        self._path_cache.set_state(state["path_cache"])
+        self._pathfinder = copy.copy(self._pathfinder)
+        self._pathfinder.set_state(state["pathfinder"])
+        self._incremental_pathfinders = {}
+        for robot_name, pathfinder_state in state["incremental_pathfinders"].items():
+            pathfinder = pathfinding.IncrementalPathfinder(self._nav_graph)
+            pathfinder.set_state(pathfinder_state)
+            self._incremental_pathfinders[robot_name] = pathfinder
+        if self._hierarchical_pathfinder is not None:
+            self._hierarchical_pathfinder = copy.copy(self._hierarchical_pathfinder)
+            self._hierarchical_pathfinder.set_state(state["hierarchical_pathfinder"], self._pathfinder)
+        if self._jump_point_pathfinder is not None:
+            self._jump_point_pathfinder = copy.copy(self._jump_point_pathfinder)
+            self._jump_point_pathfinder.set_state(state["jump_point_pathfinder"])
+
+        self._occupancy_changes = state["occupancy_changes"]
+        self._cleared_occupancy_changes = state["cleared_occupancy_changes"]
+        self._given_occupancy_changes = state["given_occupancy_changes"]
+        self._occupancy_version = state["occupancy_version"]
+        self._last_step_occupancy_version = state["last_step_occupancy_version"]
+        self._path_plans = state["path_plans"]
+        self._blocked_steps = state["blocked_steps"]
+        self._skipped_steps = state["skipped_steps"]
+        self._total_steps = state["total_steps"]
+        self._last_step_count = state["last_step_count"]
+
+    def snapshot(self):
+        return WarehouseSnapshot(self)
+
+    def reseed(self, seed: int):
+        # Carries on with the random streams seeded from seed. What was drawn ahead of time, such as the orders and
+        # the next faults, stays as it is.
+        self._random_streams.reseed(seed)
+
+    def get_seed(self):
+        # The seed the random streams were last seeded from
+        return self._random_streams.get_seed()
+
+    def stop_checkpoints(self):
+        # Forks stop writing checkpoints, they would write over the ones of the warehouse they came from
+        self._checkpoints = None
+
+    def wait_for_checkpoints(self):
+        # Waits for the last checkpoint to be written, as they are written while the simulation carries on
+        if self._checkpoints is not None:
+            self._checkpoints.wait()
+
     def is_within_grid(self, x, y):
         return (0 <= x <= self._width - 1) and (0 <= y <= self._height - 1)
 
@@ -170,6 +819,28 @@ class Warehouse:
     def get_number_of_robots(self):
         return len(self._robots.keys())
 
+    def get_movement_stats(self):
+        incremental_pathfinders = self._incremental_pathfinders.values()
+        node_expansions = self._pathfinder.expansions + sum(pathfinder.expansions
+                                                            for pathfinder in incremental_pathfinders)
+        if self._hierarchical_pathfinder is not None:
+            node_expansions += self._hierarchical_pathfinder.expansions
+        if self._jump_point_pathfinder is not None:
+            node_expansions += self._jump_point_pathfinder.expansions
+        return {"path_plans": self._path_plans,
+                "blocked_steps": self._blocked_steps,
+                "node_expansions": node_expansions,
+                "incremental_repairs": sum(pathfinder.repairs for pathfinder in incremental_pathfinders),
+                "incremental_estimated_saved_expansions": sum(pathfinder.estimated_saved_expansions
+                                                              for pathfinder in incremental_pathfinders),
+                "hierarchical_fallbacks": (0 if self._hierarchical_pathfinder is None else
+                                           self._hierarchical_pathfinder.fallbacks),
+                "path_cache_hits": self._path_cache.hits,
+                "path_cache_misses": self._path_cache.misses,
+                "path_cache_expired": self._path_cache.expired,
+                "deadlock_cycles": self._wait_for.cycles_found,
+                "skipped_steps": self._skipped_steps}
+
     def cell_is_full(self, x, y):
         is_near_faulty_robot = False
 
@@ -179,20 +850,173 @@ class Warehouse:
         return self.cell_contains_robot(x, y) or is_near_faulty_robot
 
     def cell_contains_robot(self, x, y):
-        return "robot" in "".join(self._cells[y][x])
+        return self._robot_layer[y * self._width + x] != NO_ROBOT
+
+    def cell_is_wall(self, x, y):
+        return self._static_layer[y * self._width + x] & CELL_WALL != 0
+
+    def cell_is_shelf(self, x, y):
+        return self._static_layer[y * self._width + x] & CELL_SHELF != 0
+
+    def cell_is_goal(self, x, y):
+        return self._static_layer[y * self._width + x] & CELL_GOAL != 0
+
+    def cell_is_home(self, x, y):
+        return self._static_layer[y * self._width + x] & CELL_HOME != 0
+
+    def cell_is_endpoint(self, x, y):
+        return self._static_layer[y * self._width + x] & CELL_ENDPOINT != 0
 
     def cell_within_faulty_robot_move_range(self, x, y):
-        for faulty_robot_name, faulty_robot in self.sensor_faulty_bots.items():
-            pos = faulty_robot.get_position()
-            possible_next_positions = [(pos[0] + 1, pos[1]),
-                                       (pos[0] - 1, pos[1]),
-                                       (pos[0], pos[1] + 1),
-                                       (pos[0], pos[1] - 1)]
-            if (x, y) in possible_next_positions:
-                return True
-        return False
+        return self._danger_layer[y * self._width + x] != 0
 
+    def add_sensor_faulty_robot(self, robot_obj):
+        if robot_obj.get_name() in self.sensor_faulty_bots:
+            return
+        self.sensor_faulty_bots[robot_obj.get_name()] = robot_obj
+        x, y = robot_obj.get_position()
+        self.update_faulty_robot_move_range(x, y, 1)
 
+    def update_faulty_robot_move_range(self, x, y, amount):
+        possible_next_positions = [(x + 1, y),
+                                   (x - 1, y),
+                                   (x, y + 1),
+                                   (x, y - 1)]
+        for pos in possible_next_positions:
+            if self.is_within_grid(pos[0], pos[1]):
+                self._danger_layer[pos[1] * self._width + pos[0]] += amount
+
+
+
+    def move_robot_towards_flow_field(self, robot_obj):
+        # Robots follow the flow field of their target one cell at a time, which is shared by every robot heading
+        # there. A* is only used to plan a detour when the next flow cell is blocked by another robot.
+        if not robot_obj.get_movement_path():
+            robot_x, robot_y = robot_obj.get_position()
+            target_x, target_y = robot_obj.get_target().get_position()
+            robot_cell = pathfinding.cell_index(robot_x, robot_y, self._width)
+            target_cell = pathfinding.cell_index(target_x, target_y, self._width)
+
+            direction = self._nav_graph.flow_field(target_cell)[robot_cell]
+            if direction != pathfinding.NO_DIRECTION:
+                next_cell = robot_cell + self._nav_graph.direction_offsets[direction]
+                next_position = pathfinding.cell_position(next_cell, self._width)
+                if self.cell_is_full(next_position[0], next_position[1]) and not robot_obj.sensors_faulted:
+                    detour = self.compute_robot_astar_path(robot_obj)
+                    # Only keep the detour until it gets closer to the target than the blocked cell, after that
+                    # the robot can go back to following the flow field
+                    distances = self._nav_graph.distance_table(target_cell)
+                    for i, position in enumerate(detour):
+                        position_cell = pathfinding.cell_index(position[0], position[1], self._width)
+                        if distances[position_cell] < distances[next_cell]:
+                            detour = detour[:i + 1]
+                            break
+                    # With no detour the robot waits behind the blocking robot, as it would on a planned path
+                    robot_obj.set_movement_path(detour if detour else [next_position])
+                else:
+                    robot_obj.set_movement_path([next_position])
+
+        self.move_robot_towards_astar_collision_detect(robot_obj)
+
+    def move_robot_towards_cooperative(self, robot_obj):
+        # Robots plan ahead around the cells other robots have reserved for those steps, and reserve their own plan
+        # in turn. A plan is followed until it runs out, or until the robot has fallen behind it.
+        robot_name = robot_obj.get_name()
+        path = robot_obj.get_movement_path()
+        plan_is_current = self._reservations.is_on_plan(robot_name, len(path), self._total_steps)
+        if not path or not plan_is_current:
+            path = self.compute_robot_cooperative_path(robot_obj)
+            robot_obj.set_movement_path(path)
+
+        if not path:
+            # Not even waiting in place fits around the reservations, use the non cooperative handling instead
+            self._reservations.release(robot_name)
+            self.move_robot_towards_astar_collision_detect(robot_obj)
+            return
+
+        if path[-1] == robot_obj.get_position():
+            # The whole window is spent waiting. If that keeps happening the robot is probably in a deadlock the
+            # reservations can't see, so fall back to the non cooperative deadlock handling.
+            robot_obj.increment_steps_halted()
+            if robot_obj.get_steps_halted() > 2:
+                self._reservations.release(robot_name)
+                robot_obj.set_movement_path([])
+                self.move_robot_towards_astar_collision_detect(robot_obj)
+                return
+
+        if path[0] == robot_obj.get_position():
+            # A planned wait
+            robot_obj.advance_movement_path()
+            return
+
+        if not self.cell_is_full(path[0][0], path[0][1]) or robot_obj.sensors_faulted:
+            self.move_robot_next_path_spot(robot_obj)
+            return
+
+        blocking_robot = self.get_robot_at(path[0][0], path[0][1])
+        if blocking_robot is not None and self.robot_is_waiting_on_occupied_target(blocking_robot):
+            # The plan went through a robot that gives way, so move it aside
+            if self.move_robot_break_deadlock(robot_obj, [blocking_robot]):
+                self.move_robot_next_path_spot(robot_obj)
+                return
+
+        # A robot that isn't following a plan is in the way, drop the plan so the next step plans around it
+        self._blocked_steps += 1
+        self._reservations.release(robot_name)
+        robot_obj.set_movement_path([])
+        robot_obj.increment_steps_halted()
+        if robot_obj.get_steps_halted() > 2:
+            self.move_robot_towards_astar_collision_detect(robot_obj)
+
+    def robot_is_waiting_on_occupied_target(self, robot_obj):
+        target = robot_obj.get_target()
+        if target is None or robot_obj.get_wait_steps() != 0:
+            return False
+        target_x, target_y = target.get_position()
+        occupant_id = self._robot_layer[target_y * self._width + target_x]
+        return occupant_id != NO_ROBOT and self._robots_by_id[occupant_id] is not robot_obj
+
+    def compute_robot_cooperative_path(self, robot_obj):
+        self._path_plans += 1
+        robot_name = robot_obj.get_name()
+        robot_id = self._robot_ids[robot_name]
+        robot_x, robot_y = robot_obj.get_position()
+        target_x, target_y = robot_obj.get_target().get_position()
+        start_cell = pathfinding.cell_index(robot_x, robot_y, self._width)
+        reservations = self._reservations
+        robot_layer = self._robot_layer
+        current_time = self._total_steps
+
+        # Robots waiting for their target to be vacated give way to everyone else, otherwise they can block the only
+        # way out for the robot they are waiting on
+        def must_avoid(other_name):
+            return other_name != robot_name and not self.robot_is_waiting_on_occupied_target(self._robots[other_name])
+
+        def is_blocked(from_cell, to_cell, time):
+            holder = reservations.holder(to_cell, time)
+            if holder is not None and must_avoid(holder):
+                return True
+            # Two robots can't swap cells in one step
+            from_holder = reservations.holder(from_cell, time)
+            if (from_holder is not None and reservations.holder(to_cell, time - 1) == from_holder and
+                    must_avoid(from_holder)):
+                return True
+            # Robots without a plan are treated as staying where they are
+            occupant_id = robot_layer[to_cell]
+            if occupant_id != NO_ROBOT and occupant_id != robot_id:
+                occupant_name = self._robots_by_id[occupant_id].get_name()
+                if (reservations.holder(to_cell, current_time) != occupant_name and
+                        reservations.holder(to_cell, current_time - 1) != occupant_name and
+                        must_avoid(occupant_name)):
+                    return True
+            return False
+
+        target_cell = pathfinding.cell_index(target_x, target_y, self._width)
+        window = max(COOPERATIVE_WINDOW, self._nav_graph.distance_table(target_cell)[start_cell] + 2)
+        path = self._pathfinder.find_windowed_path(start_cell, target_cell, current_time, window, is_blocked)
+        path_cells = [pathfinding.cell_index(x, y, self._width) for x, y in path]
+        reservations.reserve_path(robot_name, start_cell, path_cells, current_time)
+        return path
 
     def move_robot_towards_astar_collision_detect(self, robot_obj):
         # If the robot has no planned path when we ask it to move, it should try and compute one
@@ -216,9 +1040,12 @@ class Warehouse:
             self.move_robot_next_path_spot(robot_obj)
             return
 
+        self._blocked_steps += 1
+
         if potential_next_position is None:
             #print("Robot %s couldnt pathfind to its target" % robot_obj.get_name())
-            self.attempt_resolve_deadlocks(robot_obj)
+            if not self.move_waiting_robots_out_of_way(robot_obj):
+                self.attempt_resolve_deadlocks(robot_obj)
         else:
             # If the robot has a movement path, but cant move because it was blocked
             #print("A robot %s couldnt move, as it was blocked" % robot_obj.get_name())
@@ -236,6 +1063,10 @@ class Warehouse:
                     robot_obj.set_movement_path(self.compute_robot_astar_path(robot_obj))
                     if robot_obj.get_movement_path():
                         self.move_robot_next_path_spot(robot_obj)
+                    elif blocking_robot.get_target() is not None and not blocking_robot.is_at_target():
+                        # The blocking robot wants to move but has no path, as shelves, goals and homes can't be
+                        # passed through this robot is likely blocking the only way out of its cell. Step aside.
+                        self.move_robot_break_deadlock(robot_obj, [robot_obj])
                     else:
                         self.attempt_resolve_deadlocks(robot_obj)
                 else:
@@ -245,7 +1076,7 @@ class Warehouse:
             blocking_robot_next_position = blocking_robot.get_movement_path()[0]
 
             if blocking_robot_next_position != robot_obj.get_position():
-                if random.random() > 0.1:
+                if self._random_streams.movement.random() > 0.1:
                     self.move_robot_break_deadlock(robot_obj, [robot_obj])
                 #else:
                     #print("doing nothing, waiting for the blocking robot to move as it will get out the way")
@@ -255,45 +1086,53 @@ class Warehouse:
                 is_horizontal = (blocking_robot.get_position()[0] - robot_obj.get_position()[0]) != 0
                 self.move_robot_break_deadlock(robot_obj, robots_by_prio, is_horizontal)
 
+    def move_waiting_robots_out_of_way(self, robot_obj):
+        # Robots waiting for their target to be vacated can be all that stops the robot in it from leaving, when they
+        # wait in the aisle it has to leave by. Plan a path through them, and move the first one on it aside. Only
+        # done with path planners that can plan through cells (PLANS_THROUGH_CELLS), which is the jump point planner
+        # so far, whose tie breaking makes robots wait in those aisles far more often.
+        if not PATH_PLANNER_CLASSES[self._path_planner].PLANS_THROUGH_CELLS:
+            return False
+        waiting_cells = {pathfinding.cell_index(robo.get_position()[0], robo.get_position()[1], self._width)
+                         for robo in self._robots.values()
+                         if robo is not robot_obj and self.robot_is_waiting_on_occupied_target(robo)}
+        if not waiting_cells:
+            return False
+        self._path_plans += 1
+        robot_x, robot_y = robot_obj.get_position()
+        target_x, target_y = robot_obj.get_target().get_position()
+        path = self.plan_robot_path(robot_obj, pathfinding.cell_index(robot_x, robot_y, self._width),
+                                    pathfinding.cell_index(target_x, target_y, self._width), waiting_cells)
+
+        for x, y in path:
+            blocking_robot = self.get_robot_at(x, y)
+            if blocking_robot is not None:
+                if not self.move_robot_break_deadlock(robot_obj, [blocking_robot]):
+                    return False
+                break
+        robot_obj.set_movement_path(path)
+        return len(path) != 0
+
     def attempt_resolve_deadlocks(self, robot_obj):
         robot_target = robot_obj.get_target()
         self.resolve_boxed_in_deadlock(robot_obj, robot_target.get_position()[0], robot_target.get_position()[1])
 
-        keep_searching = True
-        loop_found = False
+        # The robot waits for whichever robot is in its target, the wait-for graph finds when that closes a cycle
         next_robot = self.get_robot_at(robot_target.get_position()[0], robot_target.get_position()[1])
-        robots_searched = [robot_obj]
-        if next_robot is not None:
-            while keep_searching:
-                robots_searched.append(next_robot)
-                robot_target = next_robot.get_target()
-                if robot_target is None:
-                    break
-                if robot_target.get_position() == next_robot.get_position():
-                    break
-                next_robot = self.get_robot_at(robot_target.get_position()[0], robot_target.get_position()[1])
-                if next_robot is None:
-                    break
-                elif next_robot == robot_obj:
-                    #print("CYCLIC DEADLOCK FOUND CONCERNING THIS ROBOT - OF SIZE %s" % (len(robots_searched)))
-                    #print("Positions")
-                    loop_found = True
-                    keep_searching = False
-                elif next_robot in robots_searched:
-                    break
-        if loop_found:
-            robots_by_prio = reversed(sorted(robots_searched, key=lambda robot2: robot2.get_prio()))
+        if next_robot is None or next_robot is robot_obj:
+            return
+        self._wait_for.add_edge(robot_obj, next_robot)
+        cycle = self._wait_for.cycle_of(robot_obj)
+        if cycle is not None:
+            #print("CYCLIC DEADLOCK FOUND CONCERNING THIS ROBOT - OF SIZE %s" % (len(cycle)))
+            robots_by_prio = reversed(sorted(cycle, key=lambda robot2: robot2.get_prio()))
             self.move_robot_break_deadlock(robot_obj, robots_by_prio)
 
     def get_robot_at(self, x, y):
-        cell = self._cells[y][x]
-        robot_name = None
-        for obj_name in cell:
-            if "robot" in obj_name:
-                robot_name = obj_name
-        if robot_name is None:
+        robot_id = self._robot_layer[y * self._width + x]
+        if robot_id == NO_ROBOT:
             return None
-        return self._robots[robot_name]
+        return self._robots_by_id[robot_id]
 
     def move_robot_break_deadlock(self, this_robot, robots, prioritise_vertical=False):
         for robo in robots:
@@ -315,8 +1154,12 @@ class Warehouse:
             if prioritise_vertical:
                 offsets = vertical + horizontal
 
+            offsets = [off for off in offsets if self.is_within_grid(off[0], off[1])]
+            # Stepping into a shelf, goal or home can block other robots in, so those are only used as a last resort
+            offsets.sort(key=lambda off: self.cell_is_endpoint(off[0], off[1]))
+
             for off in offsets:
-                if not self.is_within_grid(off[0], off[1]):
+                if self.cell_is_wall(off[0], off[1]):
                     continue
                 if not self.cell_is_full(off[0], off[1]):
                     self.update_robot_position(robo.get_name(), off[0], off[1])
@@ -336,6 +1179,8 @@ class Warehouse:
             new_y = robo.get_position()[1] + y_change
             if not self.is_within_grid(new_x, new_y):
                 continue
+            if self.cell_is_wall(new_x, new_y):
+                continue
             if not self.cell_is_full(new_x, new_y):
                 if robo.get_target() is not None:
                     self.update_robot_position(robo.get_name(), new_x, new_y)
@@ -357,8 +1202,14 @@ class Warehouse:
                 found_robot = self.get_robot_at(off[0], off[1])
                 if found_robot.get_target() is None:
                     return
+                if found_robot is robot_obj:
+                    # This robot is already next to its target, so the target isn't boxed in from it
+                    return
                 if found_robot is not None:
                     blocking_robots.append(found_robot)
+            elif self.cell_is_wall(off[0], off[1]) or self.cell_is_endpoint(off[0], off[1]):
+                # The target can't be reached through these cells, so they don't stop it being boxed in
+                continue
             else:
                 return
 
@@ -371,73 +1222,88 @@ class Warehouse:
         result = self.move_robots_away_from(x, y, robots_by_prio)
 
     def compute_robot_astar_path(self, robot_obj):
+        self._path_plans += 1
         robot_x, robot_y = robot_obj.get_position()
         target_x, target_y = robot_obj.get_target().get_position()
-
-        @dataclass(order=True)
-        class PrioNode:
-            x: int = field(compare=False)
-            y: int = field(compare=False)
-            f_score: int
-
-            def __eq__(self, other):
-                return self.x == other.x and self.y == other.y
-        g_scores = {}
-        f_scores = {}
-        came_from = {}
-        search_frontier = []
-        f_scores[(robot_x, robot_y)] = utils.taxicab_dist(robot_x, robot_y, target_x, target_y)
-        g_scores[(robot_x, robot_y)] = 0
-        heapq.heappush(search_frontier,
-                       PrioNode(robot_x, robot_y, f_scores[(robot_x, robot_y)]))
-        while len(search_frontier) != 0:
-            current = heapq.heappop(search_frontier)
-            if current.x == target_x and current.y == target_y:
-                # We don't need the first element of the path, that's where we already are
-                return utils.reconstruct_astar_path(came_from, (current.x, current.y))[1:]
-
-            offsets = [(current.x + 1, current.y),
-                       (current.x - 1, current.y),
-                       (current.x, current.y + 1),
-                       (current.x, current.y - 1)]
-
-            # Search each neighbour
-            for n in offsets:
-                if not self.is_within_grid(n[0], n[1]):
-                    continue
-                neigh_tup = (n[0], n[1])
-                cur_tup = (current.x, current.y)
-                if not self.cell_contains_robot(n[0], n[1]):
-                    possible_g_score = g_scores[cur_tup] + 1
-                    if neigh_tup in g_scores.keys():
-                        if not possible_g_score < g_scores[neigh_tup]:
-                            continue
-                    came_from[neigh_tup] = cur_tup
-                    g_scores[neigh_tup] = possible_g_score
-                    f_scores[neigh_tup] = possible_g_score + utils.taxicab_dist(current.x, current.y+1,
-                                                                                target_x, target_y)
-                    if PrioNode(n[0], n[1], 0) not in search_frontier:
-                        heapq.heappush(search_frontier,
-                                       PrioNode(n[0], n[1], f_scores[neigh_tup]))
-        return []
+        start_cell = pathfinding.cell_index(robot_x, robot_y, self._width)
+        target_cell = pathfinding.cell_index(target_x, target_y, self._width)
+        # Hierarchical paths only reach the next cluster, so they aren't shortest paths and aren't cached
+        use_cache = self._path_planner != "hierarchical"
+        if use_cache:
+            path = self._path_cache.get(start_cell, target_cell, self._robot_layer, NO_ROBOT)
+            if path is not None:
+                return path
+        path = self.plan_robot_path(robot_obj, start_cell, target_cell)
+        if use_cache:
+            self._path_cache.put(start_cell, target_cell, path, self._robot_layer, NO_ROBOT)
+        return path
+
+    def plan_robot_path(self, robot_obj, start_cell, target_cell, free_cells=()):
+        # free_cells is a set of cells the path can go through as if no robot was in them, only given with planners
+        # that can plan through cells, see PATH_PLANNER_CLASSES
+        if self._path_planner == "incremental":
+            return self.compute_robot_incremental_path(robot_obj, start_cell, target_cell)
+        if self._path_planner == "hierarchical":
+            return self._hierarchical_pathfinder.find_path(start_cell, target_cell, self._robot_layer, NO_ROBOT)
+        if self._path_planner == "jump-point":
+            return self._jump_point_pathfinder.find_path(start_cell, target_cell, self._robot_layer,
+                                                         self.get_robot_cells(), NO_ROBOT, ignored_cells=free_cells)
+        return self._pathfinder.find_path(start_cell, target_cell, self._robot_layer, NO_ROBOT)
+
+    def compute_robot_incremental_path(self, robot_obj, start_cell, target_cell):
+        robot_name = robot_obj.get_name()
+        pathfinder = self._incremental_pathfinders.get(robot_name)
+        if pathfinder is None:
+            pathfinder = pathfinding.IncrementalPathfinder(self._nav_graph)
+            self._incremental_pathfinders[robot_name] = pathfinder
+        given = self._given_occupancy_changes.get(robot_name, 0)
+        cleared = self._cleared_occupancy_changes
+        changed_cells = None
+        if given >= cleared:
+            changed_cells = self._occupancy_changes[given - cleared:]
+        self._given_occupancy_changes[robot_name] = cleared + len(self._occupancy_changes)
+        return pathfinder.find_path(start_cell, target_cell, self._robot_layer, changed_cells, NO_ROBOT)
+
+    def get_robot_cells(self):
+        # The cells marked on the robot layer, which robots can be left off while planning around them
+        cells = []
+        for robot_obj in self._robots.values():
+            robot_x, robot_y = robot_obj.get_position()
+            cell = pathfinding.cell_index(robot_x, robot_y, self._width)
+            if self._robot_layer[cell] != NO_ROBOT:
+                cells.append(cell)
+        return cells
+
+    def build_cells(self):
+        # Builds the name list view of the layout, cell (x,y) is accessed via cells[y][x].
+        # This is only meant for display and transmission, the simulation itself uses the layers.
+        cells = [[[] for x in range(self._width)] for y in range(self._height)]
+        for y in range(self._height):
+            for x in range(self._width):
+                if self.cell_is_wall(x, y):
+                    cells[y][x].append("wall")
+        for entities in (self._shelves, self._order_stations, self._homes):
+            for entity_name, entity in entities.items():
+                x, y = entity.get_position()
+                cells[y][x].append(entity_name)
+        for robot_obj in self._robots_by_id:
+            x, y = robot_obj.get_position()
+            cells[y][x].append(robot_obj.get_name())
+        return cells
 
     def transmit_initial_warehouse_layout(self):
         udptransmit.transmit_warehouse_size(self._width, self._height)
-        for row in self._cells:
-            for cell in row:
-                for obj_name in cell:
-                    if "robot" in obj_name:
-                        self._robots[obj_name].transmit_creation()
-                    elif "shelf" in obj_name:
-                        self._shelves[obj_name].transmit_creation()
-                    elif "goal" in obj_name:
-                        self._order_stations[obj_name].transmit_creation()
+        # Robots, shelves and goals in the order of their cells, along each row from the bottom one up
+        entities = self._robots_by_id + list(self._shelves.values()) + list(self._order_stations.values())
+        for entity in sorted(entities, key=lambda obj: obj.get_position()[::-1]):
+            entity.transmit_creation()
 
     def print_layout_simple(self):
-        for i in range(len(self._cells[0]) + 2):
+        cells = self.build_cells()
+        for i in range(self._width + 2):
             print("-", end="")
         print("")
-        for row in reversed(self._cells):
+        for row in reversed(cells):
             print("|", end="")
             for cell in row:
                 for obj in cell:
@@ -463,90 +1329,61 @@ class Warehouse:
                 if len(cell) == 0:
                     print(" ", end="")
             print("|")
-        for i in range(len(self._cells[0]) + 2):
+        for i in range(self._width + 2):
             print("-", end="")
         print("")
 
-    def parse_warehouse_file(self, filename: str):
-        robot_name_ctr = 0
-        shelf_name_ctr = 0
-        goal_name_ctr = 0
-        row_ctr = 0
-
-        prev_width = None
-
-        cells_copy = []
-        lines = []
+    def build_layout(self, layout: warehouselayout.WarehouseLayout):
+        # Sets up the layers and creates the robots, homes, shelves and goals of the layout. The static layer is
+        # compiled once per layout, everything else is the warehouse's own.
+        self._width = layout.get_width()
+        self._height = layout.get_height()
+        self._static_layer = bytearray(compile_static_layer(layout))
+        self._robot_layer = array("i", [NO_ROBOT]) * (self._width * self._height)
+        self._danger_layer = array("i", [0]) * (self._width * self._height)
+
+        for robot_id, (x, y) in enumerate(layout.get_robot_positions()):
+            new_robot_name = "robot%s" % robot_id
+            new_robot = robot.Robot(new_robot_name, x, y, self._robot_max_inventory, self._robot_fault_rates,
+                                    self._fleet)
+            self._robots[new_robot_name] = new_robot
+
+            new_home_name = "home%s" % robot_id
+            self._homes[new_home_name] = robothome.RobotHome(new_home_name, new_robot_name, x, y)
+
+            self._robot_ids[new_robot_name] = robot_id
+            self._robots_by_id.append(new_robot)
+            self._robot_layer[y * self._width + x] = robot_id
+
+        for shelf_num, (x, y) in enumerate(layout.get_shelf_positions()):
+            new_shelf_name = "shelf%s" % shelf_num
+            possible_item_name = "item%s" % shelf_num
+            if possible_item_name in self._items.keys():
+                new_shelf = shelf.Shelf(x, y, new_shelf_name, self._items[possible_item_name])
+            else:
+                new_shelf = shelf.Shelf(x, y, new_shelf_name)
+            self._shelves[new_shelf_name] = new_shelf
 
-        f = open(filename, "r")
-        for line_raw in f:
-            lines.append(line_raw.strip())
-        f.close()
+        for goal_num, (x, y) in enumerate(layout.get_goal_positions()):
+            new_goal_name = "goal%s" % goal_num
+            self._order_stations[new_goal_name] = orderstation.OrderStation(x, y, new_goal_name, self)
 
-        for line in list(reversed(lines)):
-            width = len(line)
-            if prev_width is None:
-                prev_width = width
-            else:
-                if width != prev_width:
-                    raise ValueError("Warehouse file is not a complete rectangle")
-            cells_copy.append([])
-            col_ctr = 0
-            for char in line:
-                if char == "R":
-                    new_robot_name = "robot%s" % robot_name_ctr
-                    new_robot = robot.Robot(new_robot_name, col_ctr, row_ctr, self._robot_max_inventory,
-                                            self._robot_fault_rates)
-                    self._robots[new_robot_name] = new_robot
-
-                    new_home_name = "home%s" % robot_name_ctr
-                    new_home = robothome.RobotHome(new_home_name, new_robot_name, col_ctr, row_ctr)
-                    self._homes[new_home_name] = new_home
-
-                    cells_copy[row_ctr].append([new_robot_name, new_home_name])
-                    robot_name_ctr = robot_name_ctr + 1
-                elif char == "S":
-                    new_shelf_name = "shelf%s" % shelf_name_ctr
-                    possible_item_name = "item%s" % shelf_name_ctr
-
-                    if possible_item_name in self._items.keys():
-                        new_shelf = shelf.Shelf(col_ctr, row_ctr, new_shelf_name, self._items[possible_item_name])
-                    else:
-                        new_shelf = shelf.Shelf(col_ctr, row_ctr, new_shelf_name)
-                    self._shelves[new_shelf_name] = new_shelf
-
-                    cells_copy[row_ctr].append([new_shelf_name])
-                    shelf_name_ctr = shelf_name_ctr + 1
-                elif char == "G":
-                    new_goal_name = "goal%s" % goal_name_ctr
-                    new_goal = orderstation.OrderStation(col_ctr, row_ctr, new_goal_name, self)
-                    self._order_stations[new_goal_name] = new_goal
-
-                    cells_copy[row_ctr].append([new_goal_name])
-                    goal_name_ctr = goal_name_ctr + 1
-                elif char == "W":
-                    cells_copy[row_ctr].append(["wall"])
-                else:
-                    cells_copy[row_ctr].append([])
-                col_ctr = col_ctr + 1
-            row_ctr = row_ctr + 1
-        if shelf_name_ctr != self._NUM_ITEMS:
+        if len(self._shelves) != self._NUM_ITEMS:
             raise Exception("The incorrect amount of shelves were present for the amount of items specified")
-        return cells_copy
 
     def transmit(self):
         udptransmit.transmit_warehouse_size(self._width, self._height)
 
     def generate_items(self, num_items):
         for i in range(num_items):
-            item_name = "item%s" % i
-            self._items[item_name] = item.Item(item_name, i)
-            udptransmit.transmit_item_existence(item_name)
+            new_item = item.Item(i, i)
+            self._items[new_item.get_name()] = new_item
+            udptransmit.transmit_item_existence(new_item.get_name())
 
     def move_robot_next_path_spot(self, robot_obj):
         next_spot = robot_obj.get_movement_path()[0]
         self.update_robot_position(robot_obj.get_name(), next_spot[0], next_spot[1])
-        robot_obj.get_movement_path().pop(0)
+        robot_obj.advance_movement_path()
 
     def update_robot_position(self, robot_name, new_x, new_y):
         if self.cell_contains_robot(new_x, new_y):
@@ -555,10 +1392,26 @@ class Warehouse:
         robot_obj = self._robots[robot_name]
         old_x, old_y = robot_obj.get_position()
         robot_obj.set_position(new_x, new_y)
-        self._cells[old_y][old_x].remove(robot_name)
-        self._cells[new_y][new_x].append(robot_name)
+        self._robot_layer[old_y * self._width + old_x] = NO_ROBOT
+        self._robot_layer[new_y * self._width + new_x] = self._robot_ids[robot_name]
+        self.occupancy_changed((old_y * self._width + old_x, new_y * self._width + new_x))
+        self._wait_for.robot_moved(robot_obj)
+        if robot_name in self.sensor_faulty_bots:
+            self.update_faulty_robot_move_range(old_x, old_y, -1)
+            self.update_faulty_robot_move_range(new_x, new_y, 1)
         udptransmit.transmit_robot_position(robot_name, new_x, new_y)
 
 
+class WarehouseSnapshot:
+    # The state of a warehouse at a step, held as a fork of it that is never stepped, to fork any number of
+    # warehouses from, such as for restarts from a live state or to try out what would happen after different
+    # decisions. The warehouse itself carries on unchanged.
+    def __init__(self, warehouse_obj: Warehouse):
+        self._warehouse = warehouse_obj.fork()
 
+    def get_total_steps(self):
+        return self._warehouse.get_total_steps()
 
+    def fork(self, seed: int = None):
+        # As Warehouse.fork, forks without a seed do just what the warehouse did from the snapshot on
+        return self._warehouse.fork(seed)
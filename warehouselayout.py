@@ -0,0 +1,94 @@
+import hashlib
+
+# Layout characters, any other character is an empty floor cell
+ROBOT = "R"
+SHELF = "S"
+GOAL = "G"
+WALL = "W"
+
+
+class WarehouseLayout:
+    # The text of a warehouse layout, one string per row with the top row first, as in layout files. Layouts are
+    # parsed once, into the positions of the cells of each kind, and are never changed afterwards, so warehouses
+    # built from the same layout share it. Positions are (x,y) with y counted up from the bottom row, in the order
+    # warehouses name what is in them: along each row from the left, bottom row first.
+    # Layouts with the same text are equal and hash the same, whatever they were built from, so caches of what is
+    # compiled from a layout (see warehouse.compile_static_layer) are keyed by its contents.
+    def __init__(self, rows):
+        self._rows = tuple(row.strip() for row in rows)
+        if not self._rows:
+            raise ValueError("Warehouse layout has no rows")
+        self._width = len(self._rows[0])
+        self._height = len(self._rows)
+        for row in self._rows:
+            if len(row) != self._width:
+                raise ValueError("Warehouse file is not a complete rectangle")
+        self._hash = hashlib.sha256(self.get_text().encode()).hexdigest()
+
+        self._positions = {ROBOT: [], SHELF: [], GOAL: [], WALL: []}
+        for y, row in enumerate(reversed(self._rows)):
+            for x, char in enumerate(row):
+                if char in self._positions:
+                    self._positions[char].append((x, y))
+
+    @classmethod
+    def from_text(cls, text: str):
+        return cls(text.splitlines())
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls(rows)
+
+    @classmethod
+    def from_array(cls, cells):
+        # cells is a 2D array, or list of lists, of single characters, top row first
+        return cls("".join(str(char) for char in row) for row in cells)
+
+    @classmethod
+    def from_file(cls, filename: str):
+        with open(filename, "r") as f:
+            return cls.from_text(f.read())
+
+    def __eq__(self, other):
+        return isinstance(other, WarehouseLayout) and self._hash == other._hash
+
+    def __hash__(self):
+        return hash(self._hash)
+
+    def get_width(self):
+        return self._width
+
+    def get_height(self):
+        return self._height
+
+    def get_rows(self):
+        return self._rows
+
+    def get_text(self):
+        return "\n".join(self._rows)
+
+    def get_hash(self):
+        # Hex SHA-256 of the layout's text
+        return self._hash
+
+    def get_robot_positions(self):
+        return self._positions[ROBOT]
+
+    def get_shelf_positions(self):
+        return self._positions[SHELF]
+
+    def get_goal_positions(self):
+        return self._positions[GOAL]
+
+    def get_wall_positions(self):
+        return self._positions[WALL]
+
+    def count_robots(self):
+        return len(self._positions[ROBOT])
+
+
+def load_layout(layout):
+    # Returns layout if it is already a WarehouseLayout, otherwise reads it from the file it names
+    if isinstance(layout, WarehouseLayout):
+        return layout
+    return WarehouseLayout.from_file(layout)